@@ -1,42 +1,212 @@
 import os
+import click
 from flask import Flask
 from models import db # 从 models.py 导入 db 对象
-from routes.user_routes import user_bp
-from routes.activities import activities_bp    # D 负责的运动记录模块
-from routes.plans import plan_bp     # D 负责的健身计划模块
+from utils.db_engine import database_uri, engine_options, install_sqlite_pragmas
+from utils.json_provider import FastJSONProvider
 from dotenv import load_dotenv
 
-load_dotenv(dotenv_path='.env.py') #关于认证装饰的设置
-app = Flask(__name__)
-# ... app.config 设置 ...
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///smart_fitness.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') # 从环境变量中获取密钥
 
-if app.config['SECRET_KEY'] is None:
-    raise RuntimeError("SECRET_KEY is not set in .env.py file or environment variables.")
+def create_app(config=None):
+    """
+    应用工厂：每次调用创建一个独立的 Flask 应用
+    config: 可选的配置字典（或配置对象），用于覆盖默认配置，例如测试时指定临时数据库
+    建表不在这里执行，请使用命令行：flask --app app init-db
+    """
+    load_dotenv(dotenv_path='.env.py') #关于认证装饰的设置
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app) # orjson 可用时使用 orjson 编码，datetime 输出 ISO 8601
+    # ... app.config 设置 ...
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri() # 从环境变量 DATABASE_URL 读取，默认 SQLite
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') # 从环境变量中获取密钥
 
-db.init_app(app) # 在这里将 db 对象与 app 实例绑定
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
 
-# 注册蓝图
-app.register_blueprint(user_bp) # <-- 注册蓝图
-app.register_blueprint(activities_bp) # 运动记录模块的路由前缀
-app.register_blueprint(plan_bp) # 健身计划模块的路由前缀
+    if app.config['SECRET_KEY'] is None:
+        raise RuntimeError("SECRET_KEY is not set in .env.py file or environment variables.")
 
-# 您可以在这里添加其他蓝图的注册，例如：
-# from routes.activity_routes import activity_bp
-# app.register_blueprint(activity_bp, url_prefix='/api/v1/activities') # 可以添加 URL 前缀
+    # 已验证 Token 缓存容量，设置为 0 可关闭缓存
+    from utils.token_cache import account_status, token_cache, DEFAULT_ACCOUNT_STATUS_TTL, DEFAULT_TOKEN_CACHE_SIZE
+    token_cache.maxsize = int(app.config.get('TOKEN_CACHE_SIZE', os.getenv('TOKEN_CACHE_SIZE', DEFAULT_TOKEN_CACHE_SIZE)))
+    # 账户注销状态的缓存秒数（其他进程中注销的账户最多延迟这么久被拒绝），设置为 0 时每个请求都查询数据库
+    account_status.ttl = float(app.config.get('ACCOUNT_STATUS_TTL', os.getenv('ACCOUNT_STATUS_TTL', DEFAULT_ACCOUNT_STATUS_TTL)))
+
+    db.init_app(app) # 在这里将 db 对象与 app 实例绑定
+    with app.app_context():
+        install_sqlite_pragmas(db.engine) # SQLite 连接建立时设置 WAL 等 PRAGMA
+
+    # 可选：请求级指标（/metrics）与慢请求剖析，METRICS_ENABLED=1 开启
+    # /metrics 需要 METRICS_TOKEN（Bearer），未配置时只允许本机访问
+    app.config.setdefault('METRICS_ENABLED', os.getenv('METRICS_ENABLED', '0') == '1')
+    if app.config['METRICS_ENABLED']:
+        from utils.metrics import init_metrics
+        init_metrics(app, db)
+
+    # 响应压缩（gzip，安装 brotli / zstandard 后也协商 br / zstd），COMPRESSION_ENABLED=0 可关闭
+    app.config.setdefault('COMPRESSION_ENABLED', os.getenv('COMPRESSION_ENABLED', '1') == '1')
+    if app.config['COMPRESSION_ENABLED']:
+        from utils.compression import init_compression
+        init_compression(app)
+
+    # 可选：慢查询 / N+1 / 全表扫描检测，报告见 /debug/queries，QUERY_INSPECTOR_ENABLED=1 开启
+    app.config.setdefault('QUERY_INSPECTOR_ENABLED', os.getenv('QUERY_INSPECTOR_ENABLED', '0') == '1')
+    if app.config['QUERY_INSPECTOR_ENABLED']:
+        from utils.query_inspector import init_query_inspector
+        init_query_inspector(app, db)
+
+    # 注册蓝图（在工厂内导入，避免导入 app 模块时就加载全部路由）
+    from routes.user_routes import user_bp
+    from routes.activities import activities_bp    # D 负责的运动记录模块
+    from routes.plans import plan_bp     # D 负责的健身计划模块
+    from routes.leaderboards import leaderboard_bp # 排行榜模块
+    app.register_blueprint(user_bp) # <-- 注册蓝图
+    app.register_blueprint(activities_bp) # 运动记录模块的路由前缀
+    app.register_blueprint(plan_bp) # 健身计划模块的路由前缀
+    app.register_blueprint(leaderboard_bp) # 排行榜模块
+
+    # 您可以在这里添加其他蓝图的注册，例如：
+    # from routes.activity_routes import activity_bp
+    # app.register_blueprint(activity_bp, url_prefix='/api/v1/activities') # 可以添加 URL 前缀
+
+    # 可选：运动记录异步写入（write-behind）模式，ACTIVITY_WRITE_BEHIND=1 开启
+    app.config.setdefault('ACTIVITY_WRITE_BEHIND', os.getenv('ACTIVITY_WRITE_BEHIND', '0') == '1')
+    if app.config['ACTIVITY_WRITE_BEHIND']:
+        from utils.write_behind import init_write_behind
+        init_write_behind(app)
+
+    # 可选：已占用用户名 / 邮箱的进程内布隆过滤器（启动时加载），USER_BLOOM_FILTER=1 开启
+    app.config.setdefault('USER_BLOOM_FILTER', os.getenv('USER_BLOOM_FILTER', '0') == '1')
+    if app.config['USER_BLOOM_FILTER']:
+        from utils.bloom import init_identity_filter
+        init_identity_filter(app)
+
+    # 注销账户后的数据清除在后台线程中分批执行
+    from utils.account_purge import init_account_purge
+    init_account_purge(app)
+
+    register_commands(app)
+
+    # 如果有其他非 API 的普通路由，可以继续放在这里，但通常很少
+    @app.route('/')
+    def index():
+        return "Smart Fitness Backend is running!"
+
+    return app
+
+
+def register_commands(app):
+    """注册命令行命令，用法：flask --app app <命令>"""
+
+    # 数据库初始化：建表，为已存在的表补充新增的可空列和索引（部署或升级时执行一次）
+    @app.cli.command('init-db')
+    def init_db_command():
+        db.create_all()
+        inspector = db.inspect(db.engine)
+        with db.engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing and column.nullable:
+                        column_type = column.type.compile(dialect=db.engine.dialect)
+                        conn.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                        print(f"Added column {table.name}.{column.name}")
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+        # 分桶功能上线前的排行榜分数行回填分桶
+        from utils.leaderboards import backfill_buckets
+        filled = backfill_buckets()
+        if filled:
+            print(f"Assigned score buckets to {filled} leaderboard rows.")
+        # 健身计划全文搜索索引（仅 SQLite，需要 FTS5）；首次建立时回填已有计划
+        if db.engine.dialect.name == 'sqlite':
+            from sqlalchemy.exc import OperationalError
+            from utils.plan_search import ensure_search_index, rebuild_search_index
+            try:
+                if ensure_search_index():
+                    print(f"Created plan search index ({rebuild_search_index()} plans indexed).")
+            except OperationalError as e:
+                print(f"Plan search index unavailable, falling back to LIKE search: {e}")
+        print("Database initialized.")
+
+    # 清理过期的运动记录变更日志；游标早于清理点的客户端会收到 reset 并全量重建
+    @app.cli.command('prune-activity-changes')
+    @click.option('--keep-days', default=90, show_default=True, help='保留最近多少天的变更日志')
+    def prune_activity_changes_command(keep_days):
+        from datetime import datetime, timedelta
+        from models import ActivityChange
+        cutoff = datetime.utcnow() - timedelta(days=keep_days)
+        deleted = ActivityChange.query.filter(ActivityChange.changed_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        print(f"Pruned {deleted} activity changes.")
+
+    # 从运动记录全量重建统计汇总表（历史数据回填）
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        from utils.rollups import rebuild_rollups
+        buckets = rebuild_rollups()
+        print(f"Rebuilt {buckets} activity rollup buckets.")
+
+    # 根据统计汇总表全量重建排行榜（历史数据回填，需先执行 rebuild-rollups）
+    @app.cli.command('rebuild-leaderboards')
+    def rebuild_leaderboards_command():
+        from utils.leaderboards import rebuild_leaderboards
+        boards = rebuild_leaderboards()
+        print(f"Rebuilt {boards} leaderboards.")
+
+    # 重新计算服务端估算的卡路里（调整 MET 表或用户修改身体数据后），值有变化时重建统计汇总和排行榜
+    @app.cli.command('recompute-calories')
+    @click.option('--user-id', type=int, default=None, help='只重算指定用户的记录')
+    @click.option('--chunk-size', default=10000, show_default=True, help='每批处理的记录数')
+    def recompute_calories_command(user_id, chunk_size):
+        from utils.calories import recompute_estimates
+        from utils.leaderboards import rebuild_leaderboards
+        from utils.rollups import rebuild_rollups
+        scanned, changed = recompute_estimates(user_id=user_id, chunk_size=chunk_size)
+        print(f"Recomputed {scanned} estimated activities, {changed} changed.")
+        if changed:
+            rebuild_rollups(user_id=user_id)
+            rebuild_leaderboards()
+            print("Rebuilt activity rollups and leaderboards.")
+
+    # 把旧数据的内联计划详情转存到内容表并去重，再清理无人引用的内容（建议低峰期执行）
+    @app.cli.command('dedupe-plan-contents')
+    def dedupe_plan_contents_command():
+        from utils.plan_content import migrate_inline_contents, prune_unreferenced_contents
+        migrated, distinct = migrate_inline_contents()
+        pruned = prune_unreferenced_contents()
+        print(f"Migrated {migrated} plans into {distinct} distinct contents, pruned {pruned} unreferenced.")
+
+    # 执行未完成的账户删除任务（进程在清除过程中退出后用于恢复）
+    @app.cli.command('purge-deleted-accounts')
+    def purge_deleted_accounts_command():
+        from models import AccountPurgeJob
+        from utils.account_purge import RESUMABLE_STATUSES, claim_job, run_purge_job
+        job_ids = [job_id for (job_id,) in db.session.execute(
+            db.select(AccountPurgeJob.id).where(AccountPurgeJob.status.in_(RESUMABLE_STATUSES))
+            .order_by(AccountPurgeJob.created_at))]
+        for job_id in job_ids:
+            if claim_job(job_id, resume=True):
+                job = run_purge_job(job_id)
+                print(f"Job {job_id} (user {job.user_id}): {job.status}, {job.rows_deleted} rows deleted.")
+        print(f"Processed {len(job_ids)} account purge jobs.")
+
+    # 全量重建健身计划全文搜索索引
+    @app.cli.command('rebuild-plan-search')
+    def rebuild_plan_search_command():
+        from utils.plan_search import rebuild_search_index
+        print(f"Indexed {rebuild_search_index()} plans.")
 
-# 数据库初始化 (通常在 app.py 启动时执行一次)
-with app.app_context():
-    db.create_all()
 
-# 如果有其他非 API 的普通路由，可以继续放在这里，但通常很少
-@app.route('/')
-def index():
-    return "Smart Fitness Backend is running!"
 # --- 应用启动入口 ---
 if __name__ == '__main__':
     # 确保您已安装所有依赖：pip install Flask Flask-SQLAlchemy Werkzeug
-    # 运行此文件即可启动 Flask 应用，并在控制台看到服务地址
-    app.run(debug=True, port=5000) # 开启调试模式，开发时方便查看错误和自动重载
\ No newline at end of file
+    # 首次运行前先初始化数据库：flask --app app init-db
+    # 生产环境可使用：gunicorn "app:create_app()"
+    # 大量空闲长连接时可使用 ASGI 模式：uvicorn asgi:application（见 asgi.py）
+    create_app().run(debug=True, port=5000) # 开启调试模式，开发时方便查看错误和自动重载
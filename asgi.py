@@ -0,0 +1,25 @@
+#ASGI 入口：uvicorn asgi:application --host 0.0.0.0 --port 5000
+#连接与请求体读取由事件循环处理，路由仍是同一个 Flask 应用，在有界线程池中执行（见 utils/asgi_adapter.py）
+import os
+from app import create_app
+from utils.asgi_adapter import DEFAULT_WORKER_THREADS, WSGIToASGI
+
+
+def _worker_threads(app):
+    # 默认与数据库连接池容量（pool_size + max_overflow）一致，线程不会在取连接时排队
+    configured = int(os.getenv('ASGI_WORKER_THREADS', 0))
+    if configured > 0:
+        return configured
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    pool_capacity = options.get('pool_size', 0) + options.get('max_overflow', 0)
+    return pool_capacity or DEFAULT_WORKER_THREADS
+
+
+def create_asgi_app(config=None):
+    app = create_app(config)
+    adapter = WSGIToASGI(app, workers=_worker_threads(app), max_body_size=app.config.get('MAX_CONTENT_LENGTH'))
+    app.extensions['asgi'] = adapter  # /metrics 输出线程池占用情况
+    return adapter
+
+
+application = create_asgi_app()
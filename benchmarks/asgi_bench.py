@@ -0,0 +1,290 @@
+#WSGI / ASGI 服务模式对比：大量保持连接、大部分时间空闲的移动端客户端
+#每个连接循环执行：发送一个请求 -> 读完响应 -> 空闲若干秒；统计延迟、错误以及服务进程的线程数和内存峰值
+#WSGI 模式为 app.run 使用的 werkzeug 多线程服务器（每个连接一个线程），ASGI 模式为 uvicorn asgi:application
+#用法：python benchmarks/asgi_bench.py --connections 1000 --seconds 20 [--modes wsgi,asgi] [--output bench.json]
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_suite import SECRET_KEY, _token, generate_data, summarize  # noqa: E402
+
+HOST = '127.0.0.1'
+
+WSGI_SERVER = """
+import sys
+from werkzeug.serving import run_simple
+from app import create_app
+run_simple('{host}', int(sys.argv[1]), create_app(), threaded=True)
+"""
+
+# 请求组合：(名称, 权重)
+REQUEST_MIX = [('preset_plans', 3), ('list_activities', 5), ('user_info', 2)]
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def _server_command(mode, port, keep_alive):
+    if mode == 'wsgi':
+        # werkzeug 服务器每个响应后都关闭连接，客户端每次请求都需要重新建立连接
+        return [sys.executable, '-c', WSGI_SERVER.format(host=HOST), str(port)]
+    return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', HOST, '--port', str(port),
+            '--log-level', 'warning', '--no-access-log', '--backlog', '4096',
+            '--timeout-keep-alive', str(keep_alive)]
+
+
+def _wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            with socket.create_connection((HOST, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start in time')
+
+
+class ProcessSampler:
+    """后台线程定期读取 /proc/<pid>/status，记录线程数和常驻内存的峰值（非 Linux 时为 None）"""
+
+    def __init__(self, pid, interval=0.2):
+        self.path = f'/proc/{pid}/status'
+        self.interval = interval
+        self.peak_threads = None
+        self.peak_rss_kb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        try:
+            with open(self.path) as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            return
+        threads = int(fields['Threads'])
+        rss_kb = int(fields['VmRSS'].split()[0])
+        self.peak_threads = max(self.peak_threads or 0, threads)
+        self.peak_rss_kb = max(self.peak_rss_kb or 0, rss_kb)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if os.path.exists(self.path):
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+async def _read_response(reader):
+    """读取一个 HTTP/1.1 响应，返回 (状态码, 是否保持连接)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+def _request_bytes(name, user_id, token):
+    path = {
+        'preset_plans': '/fitness_plans/preset',
+        'list_activities': f'/users/{user_id}/activities?limit=20',
+        'user_info': f'/users/{user_id}',
+    }[name]
+    return (f'GET {path} HTTP/1.1\r\nHost: {HOST}\r\nAuthorization: Bearer {token}\r\n'
+            f'Accept-Encoding: gzip\r\nConnection: keep-alive\r\n\r\n').encode('latin-1')
+
+
+async def _client(port, rng, user_ids, tokens, deadline, idle_seconds, ramp_seconds, stats):
+    names = [name for name, _ in REQUEST_MIX]
+    weights = [weight for _, weight in REQUEST_MIX]
+    await asyncio.sleep(rng.uniform(0, ramp_seconds))  # 连接分散建立，模拟客户端陆续上线
+    reader = writer = None
+    while time.monotonic() < deadline:
+        user_id = rng.choice(user_ids)
+        request = _request_bytes(rng.choices(names, weights)[0], user_id, tokens[user_id])
+        try:
+            started = time.perf_counter()
+            reused = writer is not None
+            if not reused:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, port), timeout=10)
+                stats['connections'] += 1
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive = await asyncio.wait_for(_read_response(reader), timeout=30)
+            except (OSError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # 空闲连接已被服务器关闭：与常见 HTTP 客户端一样重新连接并重发一次
+                writer.close()
+                stats['stale_reconnects'] += 1
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, port), timeout=10)
+                stats['connections'] += 1
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive = await asyncio.wait_for(_read_response(reader), timeout=30)
+            stats['latencies'].append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                stats['errors'] += 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            stats['errors'] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.5)
+            continue
+        # 空闲：连接保持打开，但不发送请求
+        await asyncio.sleep(rng.expovariate(1 / idle_seconds))
+    if writer is not None:
+        writer.close()
+
+
+async def _drive(port, args, user_ids, tokens):
+    rng = random.Random(args.seed)
+    stats = {'latencies': [], 'errors': 0, 'connections': 0, 'stale_reconnects': 0}
+    deadline = time.monotonic() + args.seconds
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        _client(port, random.Random(rng.random()), user_ids, tokens, deadline, args.idle, args.ramp, stats)
+        for _ in range(args.connections)
+    ])
+    return stats, time.perf_counter() - started
+
+
+def run_mode(mode, args, env, user_ids, tokens):
+    port = _free_port()
+    process = subprocess.Popen(_server_command(mode, port, args.keep_alive), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               preexec_fn=_raise_fd_limit)
+    try:
+        _wait_for_port(port, process)
+        sampler = ProcessSampler(process.pid).start()
+        try:
+            stats, elapsed = asyncio.run(_drive(port, args, user_ids, tokens))
+        finally:
+            sampler.stop()
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    result = summarize(stats['latencies'], stats['errors'], elapsed)
+    result['connections_opened'] = stats['connections']
+    result['stale_reconnects'] = stats['stale_reconnects']
+    result['server_peak_threads'] = sampler.peak_threads
+    result['server_peak_rss_mb'] = round(sampler.peak_rss_kb / 1024, 1) if sampler.peak_rss_kb else None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WSGI / ASGI 服务模式对比')
+    parser.add_argument('--connections', type=int, default=1000, help='并发保持的客户端连接数')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--idle', type=float, default=2.0, help='两次请求之间的平均空闲秒数（指数分布）')
+    parser.add_argument('--ramp', type=float, default=2.0, help='连接在开始后的多少秒内陆续建立')
+    parser.add_argument('--keep-alive', type=int, default=75, help='ASGI 模式空闲连接的保持秒数')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--activities', type=int, default=200, help='每个用户的运动记录数')
+    parser.add_argument('--presets', type=int, default=30)
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='将 JSON 结果写入文件')
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = set(modes) - {'wsgi', 'asgi'}
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+    if 'asgi' in modes:
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            print('uvicorn is not installed, skipping ASGI mode (pip install uvicorn)', file=sys.stderr)
+            modes.remove('asgi')
+
+    _raise_fd_limit()
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = 'sqlite:///' + os.path.join(tmp, 'asgi_bench.db')
+        os.environ['SECRET_KEY'] = SECRET_KEY
+        from app import create_app
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri, 'SECRET_KEY': SECRET_KEY})
+        user_ids = generate_data(app, args.users, args.activities, args.presets, args.seed)
+        tokens = {user_id: _token(user_id) for user_id in user_ids}
+        from models import db
+        with app.app_context():
+            db.engine.dispose()
+
+        env = dict(os.environ, DATABASE_URL=database_uri, SECRET_KEY=SECRET_KEY)
+        results = {mode: run_mode(mode, args, env, user_ids, tokens) for mode in modes}
+
+    output = {
+        'params': {
+            'connections': args.connections,
+            'seconds': args.seconds,
+            'idle_s': args.idle,
+            'ramp_s': args.ramp,
+            'keep_alive_s': args.keep_alive,
+            'users': args.users,
+            'activities_per_user': args.activities,
+            'presets': args.presets,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    text = json.dumps(output, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#worker 冷启动耗时测量：每次在新的 Python 进程中导入 app 并调用 create_app()
+#用法：python benchmarks/cold_start.py [--runs 10]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+done = time.perf_counter()
+print((imported - start) * 1000, (done - imported) * 1000)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='worker 冷启动耗时测量')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'cold_start.db')
+        env.setdefault('SECRET_KEY', 'cold-start-benchmark-secret-key-0123456789')
+        samples = {'import_ms': [], 'create_app_ms': [], 'total_ms': []}
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                capture_output=True, text=True, check=True
+            ).stdout
+            import_ms, create_app_ms = map(float, output.strip().splitlines()[-1].split())
+            samples['import_ms'].append(import_ms)
+            samples['create_app_ms'].append(create_app_ms)
+            samples['total_ms'].append(import_ms + create_app_ms)
+
+    report = {'runs': args.runs}
+    for name, values in samples.items():
+        report[name] = {
+            'min': round(min(values), 1),
+            'median': round(statistics.median(values), 1),
+            'max': round(max(values), 1),
+        }
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#SQLite 引擎配置基准测试：对比默认配置与 WAL/PRAGMA/连接池配置下的并发读写吞吐
+#用法：python benchmarks/db_engine_bench.py [--seconds 5] [--readers 8] [--writers 4]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from utils.db_engine import engine_options, install_sqlite_pragmas  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE activity (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    activity_type VARCHAR(50) NOT NULL,
+    duration_minutes INTEGER NOT NULL,
+    calories_burned INTEGER NOT NULL,
+    activity_date DATETIME
+)
+"""
+INDEX = "CREATE INDEX ix_activity_user_date_id ON activity (user_id, activity_date, id)"
+USERS = 100
+
+
+def _make_engine(path, tuned):
+    uri = 'sqlite:///' + path
+    if not tuned:
+        return create_engine(uri)
+    engine = create_engine(uri, **engine_options(uri))
+    install_sqlite_pragmas(engine)
+    return engine
+
+
+def _seed(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA))
+        conn.execute(text(INDEX))
+        conn.execute(
+            text("INSERT INTO activity (user_id, activity_type, duration_minutes, calories_burned, activity_date) "
+                 "VALUES (:u, 'run', 30, 300, datetime('now'))"),
+            [{'u': i % USERS} for i in range(rows)]
+        )
+
+
+def _run(engine, seconds, readers, writers):
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def reader(n):
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(
+                        "SELECT id, calories_burned FROM activity WHERE user_id = :u "
+                        "ORDER BY activity_date DESC, id DESC LIMIT 50"), {'u': n % USERS}).fetchall()
+                done += 1
+            except Exception:
+                errors += 1
+            n += 1
+        with lock:
+            counts['reads'] += done
+            counts['errors'] += errors
+
+    def writer(n):
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "INSERT INTO activity (user_id, activity_type, duration_minutes, calories_burned, activity_date) "
+                        "VALUES (:u, 'run', 30, 300, datetime('now'))"), {'u': n % USERS})
+                done += 1
+            except Exception:
+                errors += 1
+            n += 1
+        with lock:
+            counts['writes'] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {
+        'reads_per_sec': round(counts['reads'] / seconds, 1),
+        'writes_per_sec': round(counts['writes'] / seconds, 1),
+        'errors': counts['errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite 引擎配置并发读写基准测试')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    report = {}
+    for name, tuned in (('default', False), ('tuned', True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = _make_engine(os.path.join(tmp, 'bench.db'), tuned)
+            _seed(engine, args.rows)
+            report[name] = _run(engine, args.seconds, args.readers, args.writers)
+            engine.dispose()
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+#接口负载与延迟基准测试：离线运行，使用临时 SQLite 文件和 Flask 测试客户端，覆盖所有蓝图
+#用法：
+#  python benchmarks/load_suite.py --users 50 --activities 2000 --requests 3000 --output bench.json
+#  python benchmarks/load_suite.py --compare bench.json   # 与上次结果对比，p95/吞吐退化超过阈值时返回非 0
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRET_KEY = 'load-suite-benchmark-secret-key-0123456789'
+PASSWORD = 'benchmark-password'
+ACTIVITY_TYPES = ['running', 'walking', 'cycling', 'swimming', 'yoga', 'strength']
+
+# 请求组合：场景名 -> 权重
+DEFAULT_MIX = {
+    'login': 2,
+    'user_info': 5,
+    'list_activities': 20,
+    'list_activities_filtered': 15,
+    'activity_stats': 10,
+    'batch_write': 5,
+    'single_write': 8,
+    'preset_plans': 20,
+    'preset_plans_cached': 10,
+    'user_plans': 5,
+}
+
+
+def generate_data(app, users, activities_per_user, presets, seed):
+    """生成合成数据：users 个用户 × activities_per_user 条运动记录 + presets 个预设计划"""
+    from models import db, User, FitnessPlan
+    from utils.activity_ingest import insert_activities
+    from utils.password_hashing import hash_password
+
+    rng = random.Random(seed)
+    # 所有用户共用同一个密码哈希，避免生成数据时反复执行 KDF
+    password_hash = hash_password(PASSWORD)
+    start = datetime.datetime(2024, 1, 1)
+
+    with app.app_context():
+        db.create_all()
+        user_ids = []
+        for i in range(users):
+            user = User(username=f'bench_user_{i}', email=f'bench_user_{i}@example.com', password_hash=password_hash,
+                        height=rng.uniform(150, 195), weight=rng.uniform(45, 110), age=rng.randint(16, 70))
+            db.session.add(user)
+            db.session.flush()
+            user_ids.append(user.id)
+
+            rows = []
+            for _ in range(activities_per_user):
+                activity_type = rng.choice(ACTIVITY_TYPES)
+                duration = rng.randint(10, 120)
+                rows.append({
+                    'activity_type': activity_type,
+                    'duration_minutes': duration,
+                    'calories_burned': duration * rng.randint(5, 12),
+                    'distance_km': round(duration * rng.uniform(0.05, 0.2), 2) if activity_type in ('running', 'walking', 'cycling') else None,
+                    'activity_date': start + datetime.timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+                })
+            for offset in range(0, len(rows), 1000):
+                insert_activities(user.id, rows[offset:offset + 1000])
+            db.session.commit()
+
+        for i in range(presets):
+            db.session.add(FitnessPlan(
+                plan_name=f'Preset plan {i}',
+                description=f'Synthetic preset plan {i} for benchmarking',
+                content={'weeks': [{'day': d, 'exercises': [rng.choice(ACTIVITY_TYPES) for _ in range(4)]} for d in range(7)]},
+                is_preset=True
+            ))
+        db.session.commit()
+
+        for user_id in user_ids[:max(1, users // 4)]:
+            db.session.add(FitnessPlan(user_id=user_id, plan_name='My plan', content={'goal': 'benchmark'}, is_preset=False))
+        db.session.commit()
+    return user_ids
+
+
+def _token(user_id):
+    import jwt
+    return jwt.encode({'user_id': user_id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                      SECRET_KEY, algorithm='HS256')
+
+
+def _batch_payload(rng, size):
+    return [{
+        'activity_type': rng.choice(ACTIVITY_TYPES),
+        'duration_minutes': rng.randint(10, 90),
+        'calories_burned': rng.randint(50, 900),
+        'activity_date': (datetime.datetime(2024, 6, 1) + datetime.timedelta(minutes=rng.randint(0, 100000))).isoformat(),
+    } for _ in range(size)]
+
+
+def make_scenarios(user_ids, tokens, batch_size):
+    """每个场景是一个函数 (client, rng, state) -> response"""
+    def pick(rng):
+        user_id = rng.choice(user_ids)
+        return user_id, {'Authorization': 'Bearer ' + tokens[user_id]}
+
+    def login(client, rng, state):
+        index = rng.randrange(len(user_ids))
+        return client.post('/login', json={'username': f'bench_user_{index}', 'password': PASSWORD})
+
+    def user_info(client, rng, state):
+        user_id, headers = pick(rng)
+        return client.get(f'/users/{user_id}', headers=headers)
+
+    def list_activities(client, rng, state):
+        user_id, headers = pick(rng)
+        return client.get(f'/users/{user_id}/activities', query_string={'limit': 50}, headers=headers)
+
+    def list_activities_filtered(client, rng, state):
+        user_id, headers = pick(rng)
+        month = rng.randint(1, 11)
+        return client.get(f'/users/{user_id}/activities', headers=headers, query_string={
+            'type': rng.choice(ACTIVITY_TYPES),
+            'start_date': f'2024-{month:02d}-01',
+            'end_date': f'2024-{month + 1:02d}-01',
+            'limit': 100,
+        })
+
+    def activity_stats(client, rng, state):
+        user_id, headers = pick(rng)
+        return client.get('/activities/stats', headers=headers,
+                          query_string={'period': rng.choice(['day', 'week', 'month'])})
+
+    def batch_write(client, rng, state):
+        user_id, headers = pick(rng)
+        return client.post('/activities/batch', json=_batch_payload(rng, batch_size), headers=headers)
+
+    def single_write(client, rng, state):
+        user_id, headers = pick(rng)
+        return client.post('/activities', json=_batch_payload(rng, 1)[0], headers=headers)
+
+    def preset_plans(client, rng, state):
+        return client.get('/fitness_plans/preset')
+
+    def preset_plans_cached(client, rng, state):
+        headers = {'If-None-Match': state['preset_etag']} if state.get('preset_etag') else {}
+        response = client.get('/fitness_plans/preset', headers=headers)
+        if response.headers.get('ETag'):
+            state['preset_etag'] = response.headers['ETag']
+        return response
+
+    def user_plans(client, rng, state):
+        user_id, headers = pick(rng)
+        return client.get(f'/users/{user_id}/fitness_plans', headers=headers)
+
+    return {
+        'login': login,
+        'user_info': user_info,
+        'list_activities': list_activities,
+        'list_activities_filtered': list_activities_filtered,
+        'activity_stats': activity_stats,
+        'batch_write': batch_write,
+        'single_write': single_write,
+        'preset_plans': preset_plans,
+        'preset_plans_cached': preset_plans_cached,
+        'user_plans': user_plans,
+    }
+
+
+SHED_PCT_TOLERANCE = 1.0  # 503 拒绝比例允许上升的百分点
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, shed=0):
+    """shed 为被背压拒绝（503）的请求数，单独统计，不计入 errors"""
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'shed': shed,
+        'shed_pct': round(shed / len(values) * 100, 2) if values else 0.0,
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(values), 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50), 3),
+        'p95_ms': round(percentile(values, 0.95), 3),
+        'p99_ms': round(percentile(values, 0.99), 3),
+    }
+
+
+def run_mix(app, scenarios, mix, total_requests, concurrency, seed):
+    """按权重随机生成请求序列，concurrency 个线程并发执行，返回各场景与整体的统计"""
+    rng = random.Random(seed)
+    names = sorted(mix)
+    plan = rng.choices(names, weights=[mix[name] for name in names], k=total_requests)
+    chunks = [plan[i::concurrency] for i in range(concurrency)]
+
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    shed = {name: 0 for name in names}
+    lock = threading.Lock()
+
+    def worker(index, items):
+        client = app.test_client()
+        local_rng = random.Random(seed + index + 1)
+        state = {}
+        local_latencies = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        local_shed = {name: 0 for name in names}
+        for name in items:
+            started = time.perf_counter()
+            response = scenarios[name](client, local_rng, state)
+            local_latencies[name].append((time.perf_counter() - started) * 1000)
+            if response.status_code == 503:
+                local_shed[name] += 1
+            elif response.status_code >= 400:
+                local_errors[name] += 1
+        with lock:
+            for name in names:
+                latencies[name].extend(local_latencies[name])
+                errors[name] += local_errors[name]
+                shed[name] += local_shed[name]
+
+    threads = [threading.Thread(target=worker, args=(i, items)) for i, items in enumerate(chunks)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for name in names for value in latencies[name]]
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'overall': summarize(all_latencies, sum(errors.values()), elapsed, sum(shed.values())),
+        'scenarios': {name: summarize(latencies[name], errors[name], elapsed, shed[name])
+                      for name in names if latencies[name]},
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    对比两次结果，返回 (报告, 是否退化)
+    p95 上升或吞吐下降超过 threshold，或 503 拒绝比例上升超过 SHED_PCT_TOLERANCE 个百分点视为退化
+    """
+    report = {}
+    regressed = False
+    for name, now in current['results']['scenarios'].items():
+        before = baseline['results']['scenarios'].get(name)
+        if not before:
+            continue
+        p95_change = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        rps_change = (now['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] if before['throughput_rps'] else 0.0
+        shed_change = now.get('shed_pct', 0.0) - before.get('shed_pct', 0.0)
+        flagged = p95_change > threshold or rps_change < -threshold or shed_change > SHED_PCT_TOLERANCE
+        regressed = regressed or flagged
+        report[name] = {
+            'p95_change_pct': round(p95_change * 100, 1),
+            'throughput_change_pct': round(rps_change * 100, 1),
+            'shed_pct_change': round(shed_change, 2),
+            'regressed': flagged,
+        }
+    return report, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='接口负载与延迟基准测试')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--activities', type=int, default=1000, help='每个用户的运动记录数')
+    parser.add_argument('--presets', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mix', help='JSON 格式的请求组合，覆盖默认权重，例如 {"login": 1, "preset_plans": 9}')
+    parser.add_argument('--output', help='将 JSON 结果写入文件')
+    parser.add_argument('--compare', help='与之前的 JSON 结果对比')
+    parser.add_argument('--threshold', type=float, default=0.15, help='判定退化的相对变化阈值')
+    args = parser.parse_args()
+
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['SECRET_KEY'] = SECRET_KEY
+        from app import create_app
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'load_suite.db'),
+            'SECRET_KEY': SECRET_KEY,
+        })
+
+        setup_started = time.perf_counter()
+        user_ids = generate_data(app, args.users, args.activities, args.presets, args.seed)
+        setup_s = time.perf_counter() - setup_started
+
+        tokens = {user_id: _token(user_id) for user_id in user_ids}
+        scenarios = make_scenarios(user_ids, tokens, args.batch_size)
+        unknown = set(mix) - set(scenarios)
+        if unknown:
+            parser.error(f"unknown scenarios in --mix: {', '.join(sorted(unknown))}")
+
+        results = run_mix(app, scenarios, mix, args.requests, args.concurrency, args.seed)
+
+        from models import db
+        with app.app_context():
+            db.engine.dispose()
+
+    output = {
+        'params': {
+            'users': args.users,
+            'activities_per_user': args.activities,
+            'presets': args.presets,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'batch_size': args.batch_size,
+            'seed': args.seed,
+            'mix': mix,
+        },
+        'setup_s': round(setup_s, 3),
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report, regressed = compare(baseline, output, args.threshold)
+        output['comparison'] = {'baseline': args.compare, 'threshold': args.threshold, 'scenarios': report}
+
+    text = json.dumps(output, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+    if args.compare and regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash # 用于密码哈希
+from utils.password_hashing import hash_password, verify_password, needs_rehash # 用于密码哈希
+from utils.serializers import compile_serializer
 from datetime import datetime #D的依赖
 import json
+import uuid
 
 db = SQLAlchemy() # 初始化 db 变量，它将在 app.py 中与 Flask 应用绑定
 
@@ -16,6 +18,7 @@ class User(db.Model):
     height = db.Column(db.Float)
     weight = db.Column(db.Float)
     age = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime, nullable=True) # 申请注销的时间；不为空时账户不可用，数据由后台任务分批清除
     # fitness_goal = db.Column(db.String(200))
 
     def __repr__(self):
@@ -23,47 +26,205 @@ class User(db.Model):
 
     # 用于设置密码，将明文密码哈希后存储
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     # 用于验证密码，比较明文密码和存储的哈希值
+    # 验证通过且存储的哈希使用了过时的算法参数时，顺便用当前参数重新哈希（由调用方提交）
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not verify_password(self.password_hash, password):
+            return False
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
 #数据库模型
 
 #运动记录数据模型activities
 class Activity(db.Model):
+    # 复合索引：按用户+时间的游标分页和按类型/日期筛选都走索引范围扫描
+    __table_args__ = (
+        db.Index('ix_activity_user_date_id', 'user_id', 'activity_date', 'id'),
+        db.Index('ix_activity_user_type_date_id', 'user_id', 'activity_type', 'activity_date', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     activity_type = db.Column(db.String(50), nullable=False) #运动类型
     duration_minutes = db.Column(db.Integer, nullable=False) #运动时长
     calories_burned = db.Column(db.Integer, nullable=False) #卡路里消耗
+    calories_estimated = db.Column(db.Boolean, default=False) #卡路里是否由服务端估算（客户端未提供）
     distance_km = db.Column(db.Float, nullable=True)  # 可以是 Float 类型，允许为 None
     activity_date = db.Column(db.DateTime, default=datetime.utcnow) #记录时间
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) #最后修改时间
+    # 批量插入的哨兵列：executemany + RETURNING 时由 SQLAlchemy 填入行序号，把返回的 ID 对应回输入顺序，
+    # 没有它 SQLite 上会退化为逐行 INSERT；查询时不加载
+    _insert_sentinel = db.insert_sentinel('insert_sentinel')
+
+    # 列表接口使用的字段
+    LIST_FIELDS = ('id', 'activity_type', 'duration_minutes', 'calories_burned', 'calories_estimated', 'distance_km',
+                   'activity_date', 'updated_at')
+
+    def to_dict(self):
+        #将模型对象转换为字典，用于JSON响应
+        return _serialize_activity(self)
+
+    def to_detail_dict(self):
+        #单条记录接口使用的字典（键名为 activity_id，并包含 user_id）
+        return _serialize_activity_detail(self)
+
+
+# 序列化函数在模块加载时编译一次
+_serialize_activity = compile_serializer(
+    [(field, field) for field in Activity.LIST_FIELDS],
+    iso_fields=('activity_date', 'updated_at'), name='serialize_activity')
+_serialize_activity_detail = compile_serializer(
+    [('activity_id', 'id'), ('user_id', 'user_id'), ('activity_type', 'activity_type'),
+     ('duration_minutes', 'duration_minutes'), ('calories_burned', 'calories_burned'),
+     ('calories_estimated', 'calories_estimated'), ('distance_km', 'distance_km'), ('activity_date', 'activity_date')],
+    iso_fields=('activity_date',), name='serialize_activity_detail')
+
+#运动记录变更日志activity_changes（增量同步用）
+#每次新增/修改/删除运动记录追加一行，seq 单调递增（AUTOINCREMENT 保证不复用），删除记录即墓碑
+class ActivityChange(db.Model):
+    __tablename__ = 'activity_changes'
+    __table_args__ = (
+        db.Index('ix_activity_changes_user_seq', 'user_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+    seq = db.Column(db.Integer, primary_key=True) #变更序号
+    user_id = db.Column(db.Integer, nullable=False)
+    activity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False) #upsert / delete
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) #变更时间
+
+#用户数据版本号user_collection_versions
+#用户的运动记录、健身计划或个人信息发生任何写入时递增，用于 ETag / Last-Modified 条件请求
+class UserCollectionVersion(db.Model):
+    __tablename__ = 'user_collection_versions'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0) #版本号
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) #最后写入时间
+
+#运动统计汇总数据模型activity_rollups
+#按 日/周/月 + 运动类型 预聚合，由运动记录的写路径增量维护
+class ActivityRollup(db.Model):
+    __tablename__ = 'activity_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'bucket_start', 'activity_type', name='uq_activity_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.String(10), nullable=False) #统计粒度：day / week / month
+    bucket_start = db.Column(db.Date, nullable=False) #统计区间起始日期
+    activity_type = db.Column(db.String(50), nullable=False) #运动类型
+    activity_count = db.Column(db.Integer, nullable=False, default=0) #运动次数
+    calories_burned = db.Column(db.Integer, nullable=False, default=0) #卡路里消耗合计
+    duration_minutes = db.Column(db.Integer, nullable=False, default=0) #运动时长合计
+    distance_km = db.Column(db.Float, nullable=False, default=0.0) #距离合计
 
     def to_dict(self):
         #将模型对象转换为字典，用于JSON响应
         return {
-            "id": self.id,
+            "bucket_start": self.bucket_start.isoformat(),
             "activity_type": self.activity_type,
-            "duration_minutes": self.duration_minutes,
+            "activity_count": self.activity_count,
             "calories_burned": self.calories_burned,
-            "distance_km": self.distance_km,
-            "activity_date": self.activity_date.isoformat()
+            "duration_minutes": self.duration_minutes,
+            "distance_km": self.distance_km
+        }
+
+#排行榜分数leaderboard_scores
+#board 形如 "calories:week:2024-01-01:running"（运动类型为 * 表示全部类型），由运动记录写路径增量维护
+class LeaderboardScore(db.Model):
+    __tablename__ = 'leaderboard_scores'
+    __table_args__ = (
+        db.Index('ix_leaderboard_scores_board_score', 'board', 'score'),
+    )
+
+    board = db.Column(db.String(120), primary_key=True) #排行榜标识
+    user_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0) #分数（卡路里或公里数）
+    bucket = db.Column(db.Integer, nullable=True) #分数所在的分桶（见 utils/leaderboards.py），旧数据由 init-db 回填
+
+#排行榜分数分桶人数leaderboard_buckets
+#分数按等比区间分桶，与 leaderboard_scores 在同一事务中维护；名次 = 更高分桶的人数之和 + 本桶内更高分的人数
+class LeaderboardBucket(db.Model):
+    __tablename__ = 'leaderboard_buckets'
+
+    board = db.Column(db.String(120), primary_key=True) #排行榜标识
+    bucket = db.Column(db.Integer, primary_key=True) #分桶序号，越大分数越高
+    users = db.Column(db.Integer, nullable=False, default=0) #该分桶内的用户数
+
+#账户删除任务account_purge_jobs
+#注销账户时创建，后台按表分批删除该用户的数据，最后删除用户本身；任务行保留用于查询进度
+class AccountPurgeJob(db.Model):
+    __tablename__ = 'account_purge_jobs'
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, nullable=False, index=True) #被删除的用户（用户行最终会被删除，不设外键）
+    status = db.Column(db.String(20), nullable=False, default='pending') #pending / running / done / failed
+    stage = db.Column(db.String(50)) #当前正在清理的表
+    rows_total = db.Column(db.Integer) #开始时统计的待删除行数
+    rows_deleted = db.Column(db.Integer, nullable=False, default=0) #已删除行数
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        #将模型对象转换为字典，用于JSON响应
+        progress = None
+        if self.status == 'done':
+            progress = 1.0
+        elif self.rows_total:
+            progress = min(self.rows_deleted / self.rows_total, 1.0)
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "stage": self.stage,
+            "rows_total": self.rows_total,
+            "rows_deleted": self.rows_deleted,
+            "progress": progress,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
         }
 
+#健身计划内容plan_contents（按内容哈希寻址）
+#同样的计划详情只存一份，多个 FitnessPlan 通过 content_hash 共享；内容不可变，修改时写入新哈希
+class PlanContent(db.Model):
+    __tablename__ = 'plan_contents'
+
+    hash = db.Column(db.String(64), primary_key=True) #规范化 JSON 的 SHA-256
+    content = db.Column(db.Text, nullable=False) #规范化 JSON 文本
+    size = db.Column(db.Integer, nullable=False) #字节数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 #健身计划数据模型plans
 class FitnessPlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     plan_name = db.Column(db.String(100), nullable=False) #计划名称
     description = db.Column(db.Text) #计划描述
-    content = db.Column(db.JSON)  # 存储计划详情
+    content = db.Column(db.JSON)  # 旧数据的计划详情（内联存储），新数据写入 plan_contents，此列为空
+    content_hash = db.Column(db.String(64), db.ForeignKey('plan_contents.hash'), nullable=True, index=True) #计划详情的内容哈希
     is_preset = db.Column(db.Boolean, default=False)  # 是否为系统预设
     created_at = db.Column(db.DateTime, default=datetime.utcnow) #创建时间
 
     def to_dict(self):
         #将模型对象转换为字典，用于JSON响应
+        if self.content_hash is not None:
+            # 按哈希读取共享内容（进程内缓存已解析的对象，调用方不要修改）
+            from utils.plan_content import get_content
+            plan_dict = _serialize_plan(self)
+            plan_dict["content"] = get_content(self.content_hash)
+            return plan_dict
+
         plan_content = self.content
         if plan_content is None:
             plan_content = {}  # 或者 None，取决于前端期望
@@ -74,11 +235,12 @@ class FitnessPlan(db.Model):
             except json.JSONDecodeError:
                 plan_content = {"error": "Invalid JSON content"}  # 或者其他默认值
 
-        return {
-            "id": self.id,
-            "plan_name": self.plan_name,
-            "description": self.description,
-            "content": plan_content,
-            "is_preset": self.is_preset,
-            "created_at": self.created_at.isoformat()
-        }
\ No newline at end of file
+        plan_dict = _serialize_plan(self)
+        plan_dict["content"] = plan_content
+        return plan_dict
+
+
+_serialize_plan = compile_serializer(
+    [('id', 'id'), ('plan_name', 'plan_name'), ('description', 'description'),
+     ('is_preset', 'is_preset'), ('created_at', 'created_at')],
+    iso_fields=('created_at',), name='serialize_plan')
\ No newline at end of file
@@ -1,47 +1,87 @@
 #运动记录路由
 from utils.auth_decorators import token_required #导入认证装饰器
-from flask import Blueprint, request, jsonify, g
-from models import Activity, db
+from utils.collection_version import conditional_collection
+from utils.pagination import encode_cursor, decode_cursor, parse_limit
+from utils.activity_ingest import MAX_BATCH_SIZE, naive_utc, parse_activity_payload, parse_ndjson, insert_activities
+from utils import activity_events
+from utils.rollups import PERIODS, bucket_start, parse_bucket_date
+from utils.export import EXPORT_FORMATS, iter_export, wants_gzip
+from utils.write_behind import WriteQueueFull, WriteFailed
+from utils.serializers import to_columns
+from utils.series import SERIES_METRICS, DEFAULT_POINTS, MAX_POINTS, downsample
+from utils.calories import estimate_calories, load_biometrics
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context, current_app
+from sqlalchemy import func, select, tuple_
+from models import Activity, ActivityChange, ActivityRollup, db
+from datetime import date, datetime, timedelta
 
 # 创建蓝图，用于组织运动记录相关路由
 activities_bp = Blueprint('activities_bp', __name__)
 
+# PUT /activities/<id> 可修改的字段
+UPDATABLE_FIELDS = ('activity_type', 'duration_minutes', 'calories_burned', 'distance_km')
+
 #---记录运动数据API---
 @activities_bp.route('/activities', methods=['POST'])
 @token_required
 def record_activity():
     """
     记录运动数据API
-    请求体: JSON {activity_type, duration_minutes, calories_burned}
+    请求体: JSON {activity_type, duration_minutes, calories_burned(可选), distance_km(可选), activity_date(可选)}
+    未提供 calories_burned 时按运动类型、时长、距离和用户身体数据估算
     响应: 201 Created 或错误信息
     """
     data = request.get_json()
     
     # 验证必要字段是否存在
-    required_fields = ['activity_type', 'duration_minutes', 'calories_burned']
-    if not all(field in data for field in required_fields):
+    required_fields = ['activity_type', 'duration_minutes']
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
         return jsonify({
             "error": "Missing required fields",
-            "message": "Required fields: activity_type, duration_minutes, calories_burned"
+            "message": "Required fields: activity_type, duration_minutes"
         }), 400  # 400 Bad Request
+
+    # 与批量接口使用同一套校验，字段类型错误返回 400 而不是在估算或插入时出错
+    row, errors = parse_activity_payload(data)
+    if errors:
+        return jsonify({
+            "error": "Bad Request",
+            "message": "; ".join(errors),
+            "status_code": 400
+        }), 400
+
+    # 开启 write-behind 模式时只入队，由写线程合并提交
+    write_queue = current_app.extensions.get('activity_write_queue')
+    if write_queue is not None:
+        return _enqueue_activity(write_queue, row)
     
     try:
         # 从认证装饰器中获取当前用户ID
         #user_id = getattr(request, 'current_user_id', None)
         user_id = g.user_id
         
+        calories_burned = row['calories_burned']
+        calories_estimated = calories_burned is None
+        if calories_estimated:
+            weight, height, age = load_biometrics([user_id]).get(user_id, (None, None, None))
+            calories_burned = estimate_calories(row['activity_type'], row['duration_minutes'],
+                                                row['distance_km'], weight, height, age)
+
         # 创建新的运动记录对象
         new_activity = Activity(
             user_id=user_id,
-            activity_type=data['activity_type'],
-            duration_minutes=data['duration_minutes'],
-            calories_burned=data['calories_burned']
-            #activity_date 字段如果需要，也要从 data 中获取并传入
-            #activity_date=data.get('activity_date')
+            activity_type=row['activity_type'],
+            duration_minutes=row['duration_minutes'],
+            calories_burned=calories_burned,
+            calories_estimated=calories_estimated,
+            distance_km=row['distance_km'],
+            activity_date=row['activity_date']
         )
         
-        # 保存到数据库
+        # 保存到数据库，并在同一事务中更新统计汇总
         db.session.add(new_activity)
+        db.session.flush()
+        activity_events.activities_created([activity_events.snapshot(new_activity)])
         db.session.commit()
         
         # 返回成功响应
@@ -58,13 +98,165 @@ def record_activity():
             "message": str(e)
         }), 500  # 500 Internal Server Error
 
+def _enqueue_activity(write_queue, row):
+    try:
+        accepted_id, activity_id = write_queue.submit(g.user_id, row)
+    except WriteQueueFull:
+        response = jsonify({"error": "Service Unavailable", "message": "写入队列已满，请稍后重试。", "status_code": 503})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except WriteFailed as e:
+        return jsonify({"error": "Database error", "message": str(e), "status_code": 500}), 500
+
+    response = {"message": "Activity accepted", "accepted_id": accepted_id}
+    if activity_id is not None:
+        response["activity_id"] = activity_id
+    return jsonify(response), 202  # 202 Accepted
+
+#---批量记录运动数据API---
+@activities_bp.route('/activities/batch', methods=['POST'])
+@token_required
+def record_activities_batch():
+    """
+    批量记录运动数据API（供穿戴设备同步使用）
+    请求体: JSON 数组 / {"activities": [...]} / NDJSON (Content-Type: application/x-ndjson)
+    先整体校验，再在单个事务中批量插入所有合法记录
+    响应: 201 全部成功, 207 部分成功, 400 全部失败；results 中逐条给出 activity_id 或 errors
+    NDJSON 请求的 results 另带 line（所在物理行号，从 1 开始，空行也计数）
+    """
+    line_numbers = None
+    if request.mimetype == 'application/x-ndjson':
+        items, line_numbers = parse_ndjson(request.get_data(as_text=True))
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('activities') if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            "error": "Bad Request",
+            "message": "请求体必须是非空的运动记录数组或 NDJSON。",
+            "status_code": 400
+        }), 400
+
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({
+            "error": "Payload Too Large",
+            "message": f"单次最多提交 {MAX_BATCH_SIZE} 条运动记录。",
+            "status_code": 413
+        }), 413
+
+    def result(index, **fields):
+        entry = {"index": index}
+        if line_numbers is not None:
+            entry["line"] = line_numbers[index]
+        entry.update(fields)
+        return entry
+
+    # 先整体校验，收集每条记录的错误
+    results = []
+    valid_rows = []
+    valid_indexes = []
+    for index, item in enumerate(items):
+        if isinstance(item, ValueError):
+            results.append(result(index, errors=[str(item)]))
+            continue
+        row, errors = parse_activity_payload(item)
+        if errors:
+            results.append(result(index, errors=errors))
+        else:
+            valid_rows.append(row)
+            valid_indexes.append(index)
+            results.append(None)
+
+    if not valid_rows:
+        return jsonify({
+            "error": "Bad Request",
+            "message": "没有可写入的合法运动记录。",
+            "results": results,
+            "status_code": 400
+        }), 400
+
+    try:
+        # 单事务批量插入，只产生一次提交
+        new_ids = insert_activities(g.user_id, valid_rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "error": "Database error",
+            "message": str(e),
+            "status_code": 500
+        }), 500
+
+    for index, activity_id in zip(valid_indexes, new_ids):
+        results[index] = result(index, activity_id=activity_id)
+
+    failed = len(items) - len(new_ids)
+    status_code = 201 if failed == 0 else 207
+    return jsonify({
+        "message": "Activities recorded",
+        "inserted": len(new_ids),
+        "failed": failed,
+        "results": results,
+        "status_code": status_code
+    }), status_code
+
+#---运动统计API---
+@activities_bp.route('/activities/stats', methods=['GET'])
+@token_required
+def get_activity_stats():
+    """
+    运动统计API：按 日/周/月 返回各运动类型的卡路里、时长、距离合计
+    支持查询参数: period(day/week/month，默认 week), type(运动类型), start_date, end_date
+    直接读取预聚合的汇总表，开销只与返回的桶数有关
+    """
+    period = request.args.get('period', 'week')
+    if period not in PERIODS:
+        return jsonify({
+            "error": "Bad Request",
+            "message": f"period must be one of: {', '.join(PERIODS)}",
+            "status_code": 400
+        }), 400
+
+    try:
+        start_date = parse_bucket_date(request.args.get('start_date'))
+        end_date = parse_bucket_date(request.args.get('end_date'))
+    except ValueError:
+        return jsonify({
+            "error": "Bad Request",
+            "message": "start_date/end_date must be ISO dates (YYYY-MM-DD)",
+            "status_code": 400
+        }), 400
+
+    query = ActivityRollup.query.filter_by(user_id=g.user_id, period=period)
+
+    activity_type = request.args.get('type')
+    if activity_type:
+        query = query.filter(ActivityRollup.activity_type == activity_type)
+    if start_date:
+        # 起始日期所在的桶也要包含在内
+        query = query.filter(ActivityRollup.bucket_start >= bucket_start(period, start_date))
+    if end_date:
+        query = query.filter(ActivityRollup.bucket_start <= end_date)
+
+    buckets = query.order_by(ActivityRollup.bucket_start, ActivityRollup.activity_type).all()
+
+    return jsonify({
+        "period": period,
+        "count": len(buckets),
+        "buckets": [bucket.to_dict() for bucket in buckets]
+    }), 200
+
 #---获取用户所有运动记录API---
 @activities_bp.route('/users/<int:user_id>/activities', methods=['GET'])
 @token_required
+@conditional_collection # 数据未变化时直接返回 304
 def get_user_activities(user_id):
     """
-    获取用户运动历史API
-    支持查询参数: type(运动类型), start_date(开始日期), end_date(结束日期)
+    获取用户运动历史API（游标分页，按 activity_date、id 倒序）
+    支持查询参数: type(运动类型), start_date(开始日期), end_date(结束日期),
+    limit(每页条数), cursor(上一页返回的 next_cursor),
+    format(columnar 时返回列式结构，适合图表客户端)
     """
     # 验证请求用户只能访问自己的数据
     current_user_id = g.user_id # 获取当前认证用户的ID
@@ -78,6 +270,20 @@ def get_user_activities(user_id):
     activity_type = request.args.get('type')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    cursor = request.args.get('cursor')
+    columnar = request.args.get('format') == 'columnar'
+
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor_values = decode_cursor(cursor) if cursor else None
+        if cursor_values is not None and len(cursor_values) != 2:
+            raise ValueError("invalid cursor")
+    except ValueError as e:
+        return jsonify({
+            "error": "Bad Request",
+            "message": str(e),
+            "status_code": 400
+        }), 400
     
     # 构建基础查询
     query = Activity.query.filter_by(user_id=user_id)
@@ -91,28 +297,224 @@ def get_user_activities(user_id):
     
     if end_date:
         query = query.filter(Activity.activity_date <= end_date)
+
+    # 游标条件：(activity_date, id) 严格小于上一页最后一条，命中复合索引
+    if cursor_values:
+        last_date, last_id = cursor_values
+        query = query.filter(tuple_(Activity.activity_date, Activity.id) < tuple_(last_date, last_id))
     
-    # 执行查询
+    query = query.order_by(Activity.activity_date.desc(), Activity.id.desc()).limit(limit + 1)
+
+    if columnar:
+        # 列式结构只查询需要的列，不构造 ORM 对象
+        columns = [getattr(Activity, name) for name in Activity.LIST_FIELDS]
+        rows = query.with_entities(*columns).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].activity_date, rows[-1].id)
+        response = to_columns(rows, Activity.LIST_FIELDS)
+        response["count"] = len(rows)
+        response["next_cursor"] = next_cursor
+        return jsonify(response), 200
+
+    # 多取一条用于判断是否还有下一页
     activities = query.all()
 
-    # 确保 Activity 模型有 to_dict() 方法
-    activities_list = []
-    for activity in activities:
-        activities_list.append({
-            "activity_id": activity.id,
-            "user_id": activity.user_id,
-            "activity_type": activity.activity_type,
-            "duration_minutes": activity.duration_minutes,
-            "calories_burned": activity.calories_burned,
-            "distance_km": activity.distance_km,
-            "activity_date": activity.activity_date.isoformat() if activity.activity_date else None
-        })
+    next_cursor = None
+    if len(activities) > limit:
+        activities = activities[:limit]
+        last = activities[-1]
+        next_cursor = encode_cursor(last.activity_date, last.id)
 
     # 返回结果
     return jsonify({
         "count": len(activities),
-        "activities": [activity.to_dict() for activity in activities]
+        "activities": [activity.to_dict() for activity in activities],
+        "next_cursor": next_cursor
     }), 200  # 200 OK
+def _parse_series_bound(raw, end=False):
+    """
+    解析图表区间边界，统一为 naive UTC（带时区的输入先换算到 UTC）
+    只有日期的 end_date 包含当天，即取次日零点
+    """
+    try:
+        day = date.fromisoformat(raw)
+    except ValueError:
+        return naive_utc(datetime.fromisoformat(raw))
+    bound = datetime.combine(day, datetime.min.time())
+    return bound + timedelta(days=1) if end else bound
+
+#---运动数据图表（降采样时间序列）API---
+@activities_bp.route('/users/<int:user_id>/activities/series', methods=['GET'])
+@token_required
+def get_activity_series(user_id):
+    """
+    运动数据图表API：将时间区间等分为最多 points 个桶，返回每个桶的 count/sum/min/max/avg
+    支持查询参数: metric(calories_burned/duration_minutes/distance_km), start_date, end_date(默认最近 90 天；只有日期时包含当天),
+    points(桶数，默认 100，最大 1000), type(运动类型)
+    """
+    if user_id != g.user_id:
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "You can only access your own activities"
+        }), 403
+
+    metric = request.args.get('metric', 'calories_burned')
+    if metric not in SERIES_METRICS:
+        return jsonify({
+            "error": "Bad Request",
+            "message": f"metric must be one of: {', '.join(SERIES_METRICS)}",
+            "status_code": 400
+        }), 400
+
+    try:
+        points = parse_limit(request.args.get('points'), default=DEFAULT_POINTS, maximum=MAX_POINTS)
+        end = _parse_series_bound(request.args['end_date'], end=True) if request.args.get('end_date') else datetime.utcnow()
+        start = _parse_series_bound(request.args['start_date']) if request.args.get('start_date') else end - timedelta(days=90)
+        if start >= end:
+            raise ValueError("start_date must be earlier than end_date")
+    except ValueError as e:
+        return jsonify({
+            "error": "Bad Request",
+            "message": str(e),
+            "status_code": 400
+        }), 400
+
+    bucket_seconds, series = downsample(user_id, metric, start, end, points, request.args.get('type'))
+    return jsonify({
+        "metric": metric,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "bucket_seconds": bucket_seconds,
+        "count": len(series),
+        "series": series
+    }), 200
+
+#---运动记录增量同步API---
+@activities_bp.route('/users/<int:user_id>/activities/changes', methods=['GET'])
+@token_required
+def get_activity_changes(user_id):
+    """
+    运动记录增量同步API：返回 since 游标之后新增/修改/删除的运动记录
+    支持查询参数: since(上次返回的 next_cursor), limit(每页变更条数)
+    不带 since 时返回 reset=true 和当前游标，客户端应先全量拉取 /users/<id>/activities 再从该游标开始同步
+    游标依赖同一用户的 seq 按提交顺序可见：写入变更日志前先锁定该用户的版本号行（见 activity_events._log_changes）
+    """
+    if user_id != g.user_id:
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "You can only sync your own activities"
+        }), 403
+
+    since = request.args.get('since')
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        since_seq = decode_cursor(since)[0] if since else None
+        if since_seq is not None and not isinstance(since_seq, int):
+            raise ValueError("invalid cursor")
+    except (ValueError, IndexError):
+        return jsonify({
+            "error": "Bad Request",
+            "message": "invalid since cursor or limit",
+            "status_code": 400
+        }), 400
+
+    # 游标早于已清理的变更日志时，中间的变更可能已丢失，同样要求客户端全量重建
+    oldest_seq = db.session.query(func.min(ActivityChange.seq)).scalar()
+    if since_seq is None or (oldest_seq is not None and since_seq < oldest_seq - 1):
+        latest_seq = db.session.query(func.max(ActivityChange.seq)).filter(ActivityChange.user_id == user_id).scalar()
+        return jsonify({
+            "reset": True,
+            "upserts": [],
+            "deletes": [],
+            "next_cursor": encode_cursor(latest_seq or 0),
+            "has_more": False
+        }), 200
+
+    # 走 (user_id, seq) 索引，只读取游标之后的变更
+    changes = ActivityChange.query.filter(
+        ActivityChange.user_id == user_id,
+        ActivityChange.seq > since_seq
+    ).order_by(ActivityChange.seq).limit(limit + 1).all()
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # 同一条记录在本页内多次变更时只保留最后一次
+    latest = {}
+    for change in changes:
+        latest[change.activity_id] = change
+
+    upsert_ids = [activity_id for activity_id, change in latest.items() if change.op == 'upsert']
+    activities = {}
+    if upsert_ids:
+        for activity in Activity.query.filter(Activity.user_id == user_id, Activity.id.in_(upsert_ids)):
+            activities[activity.id] = activity
+
+    upserts = []
+    deletes = []
+    for activity_id, change in latest.items():
+        activity = activities.get(activity_id)
+        if activity is not None:
+            upserts.append(activity.to_dict())
+        else:
+            # 记录已被删除（删除变更可能在后续页），直接以墓碑形式返回
+            deleted_at = change.changed_at.isoformat() if change.op == 'delete' else None
+            deletes.append({"activity_id": activity_id, "deleted_at": deleted_at})
+
+    next_cursor = encode_cursor(changes[-1].seq if changes else since_seq)
+    return jsonify({
+        "reset": False,
+        "upserts": upserts,
+        "deletes": deletes,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }), 200
+
+#---导出用户全部运动记录API---
+@activities_bp.route('/users/<int:user_id>/activities/export', methods=['GET'])
+@token_required
+def export_user_activities(user_id):
+    """
+    导出用户全部运动记录API（流式响应，内存占用与记录条数无关）
+    支持查询参数: format(ndjson/csv，默认 ndjson)
+    客户端 Accept-Encoding 包含 gzip 时按块实时压缩
+    """
+    if user_id != g.user_id:
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "You can only export your own activities"
+        }), 403
+
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            "error": "Bad Request",
+            "message": f"format must be one of: {', '.join(EXPORT_FORMATS)}",
+            "status_code": 400
+        }), 400
+
+    # 只取需要的列，按 (activity_date, id) 顺序走索引，服务端游标分批读取
+    query = select(
+        Activity.id,
+        Activity.activity_type,
+        Activity.duration_minutes,
+        Activity.calories_burned,
+        Activity.distance_km,
+        Activity.activity_date
+    ).where(Activity.user_id == user_id).order_by(Activity.activity_date, Activity.id)
+
+    use_gzip = wants_gzip(request.accept_encodings)
+    body = iter_export(db.session.execute(query.execution_options(yield_per=1000)), export_format, use_gzip)
+
+    response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename=activities-{user_id}.{export_format}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 # --- 获取指定 ID 的运动记录 API ---
 # 规范：GET /activities/<activity_id>
 @activities_bp.route('/activities/<int:activity_id>', methods=['GET']) # <-- 修正这里，改为完整路径
@@ -138,15 +540,7 @@ def get_activity_by_id(activity_id):
 
     return jsonify({
         "message": "获取运动记录成功！",
-        "data": {
-            "activity_id": activity.id,
-            "user_id": activity.user_id,
-            "activity_type": activity.activity_type,
-            "duration_minutes": activity.duration_minutes,
-            "calories_burned": activity.calories_burned,
-            "distance_km": activity.distance_km,
-            "activity_date": activity.activity_date.isoformat() if activity.activity_date else None
-        },
+        "data": activity.to_detail_dict(),
         "status_code": 200
     }), 200
 
@@ -174,26 +568,41 @@ def update_activity_by_id(activity_id):
         }), 403
 
     data = request.get_json()
+    # 部分更新：只校验并修改请求中出现的字段，类型错误在修改统计汇总和排行榜之前返回 400
+    if not isinstance(data, dict):
+        data = None
+    else:
+        data = {name: data[name] for name in UPDATABLE_FIELDS if name in data}
+    changes, errors = parse_activity_payload(data, partial=True)
+    if errors:
+        return jsonify({
+            "error": "Bad Request",
+            "message": "; ".join(errors),
+            "status_code": 400
+        }), 400
 
     try:
-        activity.activity_type = data.get('activity_type', activity.activity_type)
-        activity.duration_minutes = data.get('duration_minutes', activity.duration_minutes)
-        activity.calories_burned = data.get('calories_burned', activity.calories_burned)
-        activity.distance_km = data.get('distance_km', activity.distance_km)
+        before = activity_events.snapshot(activity)
+        for name in ('activity_type', 'duration_minutes', 'distance_km'):
+            if name in changes:
+                setattr(activity, name, changes[name])
+        if changes.get('calories_burned') is not None:
+            activity.calories_burned = changes['calories_burned']
+            activity.calories_estimated = False
+        elif activity.calories_estimated or 'calories_burned' in changes:
+            # 估算值随类型/时长/距离的修改重新计算；显式传入 null 表示改回服务端估算
+            activity.calories_estimated = True
+            weight, height, age = load_biometrics([current_user_id]).get(current_user_id, (None, None, None))
+            activity.calories_burned = estimate_calories(activity.activity_type, activity.duration_minutes,
+                                                         activity.distance_km, weight, height, age)
 
+        db.session.flush()
+        activity_events.activity_updated(before, activity_events.snapshot(activity))
         db.session.commit()
 
         return jsonify({
             "message": "运动记录更新成功！",
-            "data": {
-                "activity_id": activity.id,
-                "user_id": activity.user_id,
-                "activity_type": activity.activity_type,
-                "duration_minutes": activity.duration_minutes,
-                "calories_burned": activity.calories_burned,
-                "distance_km": activity.distance_km,
-                "activity_date": activity.activity_date.isoformat() if activity.activity_date else None
-            },
+            "data": activity.to_detail_dict(),
             "status_code": 200
         }), 200
     except Exception as e:
@@ -224,7 +633,9 @@ def delete_activity(activity_id):
         }), 403
 
     try:
+        deleted = activity_events.snapshot(activity)
         db.session.delete(activity)
+        activity_events.activity_deleted(deleted)
         db.session.commit()
         return jsonify({
             "message": "运动记录删除成功！",
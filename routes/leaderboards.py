@@ -0,0 +1,69 @@
+#排行榜路由
+from utils.auth_decorators import token_required
+from flask import Blueprint, request, jsonify, g
+from datetime import datetime
+from models import User, db
+from utils.leaderboards import BOARD_TOP_K, LEADERBOARD_METRICS, LEADERBOARD_PERIODS, board_cache, board_key, user_rank
+from utils.pagination import parse_limit
+from utils.rollups import bucket_start, parse_bucket_date
+
+# 创建蓝图，用于组织排行榜相关路由
+leaderboard_bp = Blueprint('leaderboard_bp', __name__)
+
+#---获取排行榜API---
+@leaderboard_bp.route('/leaderboards', methods=['GET'])
+@token_required
+def get_leaderboard():
+    """
+    排行榜API：返回前 limit 名以及当前用户的名次
+    支持查询参数: metric(calories/distance，默认 calories), period(week/month，默认 week),
+    type(运动类型，不传为全部类型), date(统计区间内任意日期，默认今天), limit(默认 10，最大 100)
+    """
+    metric = request.args.get('metric', 'calories')
+    period = request.args.get('period', 'week')
+    if metric not in LEADERBOARD_METRICS or period not in LEADERBOARD_PERIODS:
+        return jsonify({
+            "error": "Bad Request",
+            "message": f"metric must be one of: {', '.join(LEADERBOARD_METRICS)}; "
+                       f"period must be one of: {', '.join(LEADERBOARD_PERIODS)}",
+            "status_code": 400
+        }), 400
+
+    try:
+        day = parse_bucket_date(request.args.get('date')) or datetime.utcnow().date()
+        limit = parse_limit(request.args.get('limit'), default=10, maximum=BOARD_TOP_K)
+    except ValueError as e:
+        return jsonify({
+            "error": "Bad Request",
+            "message": str(e),
+            "status_code": 400
+        }), 400
+
+    period_start = bucket_start(period, day)
+    key = board_key(metric, period, period_start, request.args.get('type'))
+    board = board_cache.get(key)
+
+    top = board.top(limit)
+    usernames = {}
+    if top:
+        user_ids = [user_id for _, user_id, _ in top]
+        usernames = dict(db.session.execute(
+            db.select(User.id, User.username).where(User.id.in_(user_ids))
+        ).all())
+
+    my_rank = user_rank(board, key, g.user_id)
+    return jsonify({
+        "board": key,
+        "metric": metric,
+        "period": period,
+        "period_start": period_start.isoformat(),
+        "activity_type": request.args.get('type'),
+        "total": board.total,
+        "entries": [{
+            "rank": rank,
+            "user_id": user_id,
+            "username": usernames.get(user_id),
+            "score": score
+        } for rank, user_id, score in top],
+        "me": {"rank": my_rank[0], "score": my_rank[1]} if my_rank else None
+    }), 200
@@ -1,6 +1,11 @@
 #健身计划路由
 from utils.auth_decorators import token_required
-from flask import Blueprint, request, jsonify, g
+from utils.preset_cache import get_preset_payload
+from utils.collection_version import bump_collection_version, conditional_collection
+from utils.plan_content import plan_content_hash, preload_contents, store_content
+from utils.plan_search import search_plans
+from utils.pagination import encode_cursor, decode_cursor, parse_limit
+from flask import Blueprint, Response, request, jsonify, g, current_app
 from models import FitnessPlan, db
 
 
@@ -13,39 +18,90 @@ def get_preset_plans():
     """
     获取系统预设健身计划API
     无需认证，所有用户可访问
+    响应体在进程内缓存并带强 ETag（压缩后为弱 ETag），If-None-Match 命中时返回 304
     """
     try:
-        # 调试点 1: 查询前
-        print("DEBUG: Attempting to query preset plans...")
-        preset_plans = FitnessPlan.query.filter_by(is_preset=True).all()
-        # 调试点 2: 查询后
-        print(f"DEBUG: Found {len(preset_plans)} preset plans.")
-
-        plans_list = []
-        for plan in preset_plans:
-            # 调试点 3: 尝试转换每个计划
-            try:
-                plan_dict = plan.to_dict()
-                plans_list.append(plan_dict)
-                print(f"DEBUG: Successfully converted plan ID {plan.id} to dict.")
-            except Exception as e_convert:
-                print(f"ERROR: Failed to convert plan ID {plan.id} to dict: {e_convert}")
-                # 如果转换失败，可以跳过这个计划或返回一个错误提示
-                # 为了调试，这里我们直接让它继续，看是否是某个特定计划的问题
-                plans_list.append({"id": plan.id, "error": str(e_convert)})  # 临时添加错误信息
-                continue  # 继续处理下一个计划
-
-        # 调试点 4: 准备返回 JSON
-        print(f"DEBUG: Final plans_list prepared: {plans_list}")
+        body, etag = get_preset_payload(_build_preset_body)
+    except Exception as e:
+        current_app.logger.exception("Failed to load preset plans")
+        return jsonify({
+            "error": "Database error",
+            "message": str(e)
+        }), 500
+
+    if request.if_none_match.contains_weak(etag):  # 压缩后的响应 ETag 为弱 ETag
+        response = Response(status=304)
+    else:
+        response = Response(body, status=200, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _build_preset_body():
+    # 查询并序列化全部预设计划，仅在缓存未命中时调用
+    preset_plans = FitnessPlan.query.filter_by(is_preset=True).all()
+    preload_contents(preset_plans)
+
+    plans_list = []
+    for plan in preset_plans:
+        try:
+            plans_list.append(plan.to_dict())
+        except Exception as e_convert:
+            # 单个计划转换失败时跳过，返回错误占位，不影响其他计划
+            current_app.logger.warning("Failed to convert plan ID %s to dict: %s", plan.id, e_convert)
+            plans_list.append({"id": plan.id, "error": str(e_convert)})
+
+    return current_app.json.dumps({
+        "count": len(plans_list),
+        "plans": plans_list
+    }).encode('utf-8')
+
 
+#---搜索健身计划API---
+@plan_bp.route('/fitness_plans/search', methods=['GET'])
+@token_required
+def search_fitness_plans():
+    """
+    搜索健身计划API：在预设计划和当前用户自己的计划中按名称、描述和计划详情全文搜索
+    查询参数: q(必填，每个词做前缀匹配，多个词同时匹配), scope(all/preset/mine，默认 all),
+    limit(默认 20，最大 100), cursor(上一页返回的 next_cursor)
+    结果按相关度排序
+    """
+    query = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'all')
+    if not query or scope not in ('all', 'preset', 'mine'):
         return jsonify({
-            "count": len(plans_list),
-            "plans": plans_list
-        }), 200
+            "error": "Bad Request",
+            "message": "q is required; scope must be one of: all, preset, mine",
+            "status_code": 400
+        }), 400
 
+    try:
+        limit = parse_limit(request.args.get('limit'), default=20, maximum=100)
+        offset = 0
+        if request.args.get('cursor'):
+            offset, = decode_cursor(request.args['cursor'])
+            if not isinstance(offset, int) or offset < 0:
+                raise ValueError("invalid cursor")
+    except ValueError as e:
+        return jsonify({
+            "error": "Bad Request",
+            "message": str(e),
+            "status_code": 400
+        }), 400
+
+    try:
+        plans, has_more = search_plans(query, g.user_id, scope=scope, limit=limit, offset=offset)
+        preload_contents(plans)
+        return jsonify({
+            "count": len(plans),
+            "plans": [plan.to_dict() for plan in plans],
+            "has_more": has_more,
+            "next_cursor": encode_cursor(offset + len(plans)) if has_more else None
+        }), 200
     except Exception as e:
-        # 调试点 5: 捕获到更上层的错误
-        print(f"ERROR: An unexpected error occurred in get_preset_plans: {e}")
+        current_app.logger.exception("Plan search failed")
         return jsonify({
             "error": "Database error",
             "message": str(e)
@@ -90,12 +146,12 @@ def create_or_select_plan(user_id):
                     "message": "Plan with provided ID does not exist"
                 }), 404
             
-            # 创建用户副本（非预设）
+            # 创建用户副本（非预设），计划详情按内容哈希与原计划共享，不复制
             new_plan = FitnessPlan(
                 user_id=user_id,
                 plan_name=existing_plan.plan_name,
                 description=existing_plan.description,
-                content=existing_plan.content,
+                content_hash=plan_content_hash(existing_plan),
                 is_preset=False  # 标记为用户自定义计划
             )
         else:
@@ -110,12 +166,13 @@ def create_or_select_plan(user_id):
                 user_id=user_id,
                 plan_name=data['plan_name'],
                 description=data.get('description', ''),
-                content=data['content'],
+                content_hash=store_content(data['content']),
                 is_preset=False
             )
         
         # 保存到数据库
         db.session.add(new_plan)
+        bump_collection_version(user_id)
         db.session.commit()
         
         return jsonify({
@@ -133,6 +190,7 @@ def create_or_select_plan(user_id):
 #---获取用户健身计划API---
 @plan_bp.route('/users/<int:user_id>/fitness_plans', methods=['GET'])
 @token_required # 认证用户
+@conditional_collection # 数据未变化时直接返回 304
 def get_user_plans(user_id):
     """
     获取用户的所有健身计划API
@@ -149,6 +207,7 @@ def get_user_plans(user_id):
     try:
         # 查询用户的所有非预设计划
         user_plans = FitnessPlan.query.filter_by(user_id=user_id, is_preset=False).all()
+        preload_contents(user_plans)
         
         return jsonify({
             "count": len(user_plans),
@@ -169,7 +228,8 @@ def get_user_plans(user_id):
 def update_user_fitness_plan(user_id, plan_id):
     """
     更新用户健身计划API
-    请求体: JSON {status, end_date, etc.}
+    请求体: JSON {status, end_date, content, etc.}
+    修改 content 时写时复制：写入新内容并改为引用新哈希，与其他用户共享的原内容不变
     响应: 200 OK 或错误信息
     """
     current_user_id = g.user_id
@@ -198,6 +258,10 @@ def update_user_fitness_plan(user_id, plan_id):
         user_plan.end_date = data['end_date']
 
     try:
+        if 'content' in data:
+            user_plan.content_hash = store_content(data['content'])
+            user_plan.content = db.null()
+        bump_collection_version(user_id)
         db.session.commit()
         return jsonify({
             "message": "健身计划更新成功！",
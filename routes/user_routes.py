@@ -1,13 +1,51 @@
 from flask import Blueprint, request, jsonify, g, current_app
-from models import db, User # 导入 db 和 User 模型
-from werkzeug.security import generate_password_hash, check_password_hash
+from models import db, User, AccountPurgeJob # 导入 db 和 User 模型
 from utils.auth_decorators import token_required
-import jwt # 导入 jwt 库
+from utils.password_hashing import HashPoolSaturated, hash_password, run_hashing
+from utils.collection_version import bump_collection_version, conditional_collection
+from utils.token_cache import token_cache
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 import datetime # 导入 datetime 库
 
 # 创建一个蓝图实例
 user_bp = Blueprint('user_bp', __name__)
 
+def _hashing_busy():
+    # 密码哈希线程池已满：快速失败，提示客户端稍后重试
+    response = jsonify({"error": "Service Unavailable", "message": "服务繁忙，请稍后重试。", "status_code": 503})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def _taken_fields(username=None, email=None, exclude_user_id=None):
+    """
+    一次查询（走 username / email 唯一索引）返回已被占用的字段集合 {'username', 'email'}
+    只用于给出明确的提示，并发注册的最终冲突以提交时的 IntegrityError 为准
+    """
+    conditions = []
+    if username is not None:
+        conditions.append(User.username == username)
+    if email is not None:
+        conditions.append(User.email == email)
+    if not conditions:
+        return set()
+    query = db.select(User.username, User.email).where(or_(*conditions))
+    if exclude_user_id is not None:
+        query = query.where(User.id != exclude_user_id)
+    taken = set()
+    for row in db.session.execute(query.limit(2)):
+        if username is not None and row.username == username:
+            taken.add('username')
+        if email is not None and row.email == email:
+            taken.add('email')
+    return taken
+
+def _remember_identity(username=None, email=None):
+    # 写入成功后追加到本进程的布隆过滤器（未开启时忽略）
+    identity_filter = current_app.extensions.get('user_identity_filter')
+    if identity_filter is not None:
+        identity_filter.add(username, email)
+
 # --- 用户注册 API ---
 @user_bp.route('/register', methods=['POST'])
 
@@ -23,14 +61,18 @@ def register():
     if not username or not email or not password:
         return jsonify({"error": "Bad Request", "message": "用户名、邮箱和密码不能为空。", "status_code": 400}), 400
 
-    if User.query.filter_by(username=username).first() or User.query.filter_by(email=email).first():
+    if _taken_fields(username, email):
         return jsonify({"error": "Conflict", "message": "用户名或邮箱已被占用。", "status_code": 409}), 409
 
-    hashed_password = generate_password_hash(password)
+    try:
+        hashed_password = run_hashing(hash_password, password)
+    except HashPoolSaturated:
+        return _hashing_busy()
     new_user = User(username=username, email=email, password_hash=hashed_password)
     db.session.add(new_user)
     try:
         db.session.commit()
+        _remember_identity(username, email)
         return jsonify({
             "message": "用户注册成功！",
             "data": {
@@ -39,6 +81,10 @@ def register():
             },
             "status_code": 201
         }), 201
+    except IntegrityError:
+        # 并发注册：检查之后、提交之前被其他请求占用
+        db.session.rollback()
+        return jsonify({"error": "Conflict", "message": "用户名或邮箱已被占用。", "status_code": 409}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Internal Server Error", "message": f"注册失败：{str(e)}", "status_code": 500}), 500
@@ -55,9 +101,22 @@ def login():
     if not username or not password:
         return jsonify({"error": "Bad Request", "message": "用户名和密码不能为空。", "status_code": 400}), 400
 
-    user = User.query.filter_by(username=username).first()
+    user = User.query.filter_by(username=username, deleted_at=None).first()
 
-    if user and check_password_hash(user.password_hash, password):
+    try:
+        password_ok = user is not None and run_hashing(user.check_password, password)
+    except HashPoolSaturated:
+        return _hashing_busy()
+
+    if password_ok:
+        import jwt # 延迟导入 jwt 库，只有登录成功签发 Token 时才需要
+        # check_password 可能用新参数重新哈希了密码，需要持久化
+        if db.session.is_modified(user):
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception("Failed to persist rehashed password for user %s", user.id)
         token_payload = {
             'user_id': user.id,
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)  # Token 24小时后过期
@@ -76,9 +135,48 @@ def login():
     else:
         return jsonify({"error": "Unauthorized", "message": "用户名或密码不正确。", "status_code": 401}), 401
 
+# --- 用户名 / 邮箱可用性检查 API ---
+@user_bp.route('/users/availability', methods=['GET'])
+def check_availability():
+    """
+    注册表单实时检查用户名 / 邮箱是否可用，无需认证
+    查询参数: username, email（至少一个）
+    开启布隆过滤器时，过滤器判定一定未被占用的值不查询数据库；结果只作提示，注册时仍可能返回 409
+    """
+    values = {field: request.args.get(field) for field in ('username', 'email') if request.args.get(field)}
+    if not values:
+        return jsonify({"error": "Bad Request", "message": "请提供 username 或 email。", "status_code": 400}), 400
+
+    identity_filter = current_app.extensions.get('user_identity_filter')
+    available = {}
+    to_check = {}
+    for field, value in values.items():
+        might_exist = identity_filter.might_exist(field, value) if identity_filter is not None else None
+        if might_exist is False:
+            available[field] = True
+        else:
+            to_check[field] = value
+    if identity_filter is not None:
+        identity_filter.skipped_lookups += len(values) - len(to_check)
+        if to_check:
+            identity_filter.db_lookups += 1
+        if not identity_filter.ready:
+            identity_filter.refresh_async(current_app._get_current_object())
+
+    if to_check:
+        taken = _taken_fields(to_check.get('username'), to_check.get('email'))
+        for field in to_check:
+            available[field] = field not in taken
+
+    return jsonify({
+        "data": {field: {"value": value, "available": available[field]} for field, value in values.items()},
+        "status_code": 200
+    }), 200
+
 # --- 获取个人信息 API ---
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
 @token_required # 认证用户
+@conditional_collection # 数据未变化时直接返回 304
 def get_user_info(user_id):
     # ... (这里放您之前在 app.py 里的获取个人信息 API 代码) ...
     current_user_id = g.user_id # 获取当前认证用户的ID
@@ -132,28 +230,24 @@ def update_user_info(user_id):
 
     data = request.get_json()
 
-    if 'username' in data:
-        new_username = data['username']
-        if new_username != user.username and User.query.filter_by(username=new_username).first():
-            return jsonify({
-                "error": "Conflict",
-                "message": "新用户名已被占用。",
-                "status_code": 409
-            }), 409
+    new_username = data['username'] if 'username' in data and data['username'] != user.username else None
+    new_email = data['email'] if 'email' in data and data['email'] != user.email else None
+    taken = _taken_fields(new_username, new_email, exclude_user_id=user_id)
+    if taken:
+        return jsonify({
+            "error": "Conflict",
+            "message": "新用户名已被占用。" if 'username' in taken else "新邮箱已被占用。",
+            "status_code": 409
+        }), 409
+    if new_username is not None:
         user.username = new_username
-
-    if 'email' in data:
-        new_email = data['email']
-        if new_email != user.email and User.query.filter_by(email=new_email).first():
-            return jsonify({
-                "error": "Conflict",
-                "message": "新邮箱已被占用。",
-                "status_code": 409
-            }), 409
+    if new_email is not None:
         user.email = new_email
 
     try:
+        bump_collection_version(user_id)
         db.session.commit()
+        _remember_identity(new_username, new_email)
         return jsonify({
             "message": "用户信息更新成功！",
             "data": {
@@ -163,6 +257,9 @@ def update_user_info(user_id):
             },
             "status_code": 200
         }), 200
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Conflict", "message": "新用户名或邮箱已被占用。", "status_code": 409}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Internal Server Error", "message": f"用户信息更新失败：{str(e)}", "status_code": 500}), 500
@@ -174,7 +271,8 @@ def update_user_info(user_id):
 def delete_user(user_id):
     """
     删除指定用户账户API
-    响应: 200 OK 或 204 No Content 或错误信息
+    立即把账户标记为已注销（之后无法登录和访问），数据由后台任务分批清除
+    响应: 202 Accepted，data 为删除任务，可通过 GET /account_deletions/<job_id> 查询进度
     """
     current_user_id = g.user_id # 获取当前认证用户的ID
 
@@ -195,14 +293,42 @@ def delete_user(user_id):
             "status_code": 404
         }), 404
 
-    try:
-        db.session.delete(user)
-        db.session.commit()
+    # 重复请求（其他进程中的 Token 缓存尚未失效）返回已有的任务
+    job = AccountPurgeJob.query.filter_by(user_id=user_id).order_by(AccountPurgeJob.created_at.desc()).first()
+    if user.deleted_at is None or job is None:
+        try:
+            user.deleted_at = datetime.datetime.utcnow()
+            job = AccountPurgeJob(user_id=user_id)
+            db.session.add(job)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": "Database error", "message": f"用户账户删除失败：{str(e)}", "status_code": 500}), 500
+        token_cache.revoke_user(user_id)
+        current_app.extensions['account_purge'].submit(job.id)
+
+    response = jsonify({
+        "message": "用户账户已注销，数据正在后台清除。",
+        "data": job.to_dict(),
+        "status_code": 202
+    })
+    response.headers['Location'] = f'/account_deletions/{job.id}'
+    return response, 202
+
+# --- 查询账户删除进度 API ---
+# 账户注销后原 Token 失效，凭删除接口返回的任务 ID（随机 UUID）查询，无需认证
+@user_bp.route('/account_deletions/<job_id>', methods=['GET'])
+def get_account_deletion(job_id):
+    job = db.session.get(AccountPurgeJob, job_id)
+    if not job:
         return jsonify({
-            "message": "用户账户删除成功！",
-            "status_code": 200
-        }), 200 # 也可以返回 204 No Content，但 200 并带消息更明确
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"error": "Database error", "message": f"用户账户删除失败：{str(e)}", "status_code": 500}), 500
+            "error": "Not Found",
+            "message": "未找到指定的删除任务。",
+            "status_code": 404
+        }), 404
+    return jsonify({
+        "message": "获取删除进度成功",
+        "data": job.to_dict(),
+        "status_code": 200
+    }), 200
 
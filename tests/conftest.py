@@ -0,0 +1,38 @@
+#测试公共夹具：每个测试使用临时目录中的独立 SQLite 数据库
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+TEST_SECRET_KEY = 'test-secret-key-0123456789abcdef0123456789'
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'SECRET_KEY': TEST_SECRET_KEY,
+        'TESTING': True,
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def register(client, username='alice', password='pw123456'):
+    """注册并登录，返回 (user_id, 认证请求头)"""
+    client.post('/register', json={'username': username, 'email': f'{username}@example.com', 'password': password})
+    data = client.post('/login', json={'username': username, 'password': password}).get_json()['data']
+    return data['user_id'], {'Authorization': 'Bearer ' + data['access_token']}
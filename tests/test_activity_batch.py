@@ -0,0 +1,40 @@
+#批量插入运动记录：语句数不随行数线性增长，返回的 ID 与输入顺序一一对应
+from sqlalchemy import event
+
+from conftest import register
+from models import Activity, db
+
+
+def _count_inserts():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO activity '):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def test_batch_insert_uses_constant_number_of_statements(app, client):
+    _, headers = register(client)
+    statements = _count_inserts()
+    payload = [{'activity_type': 'run', 'duration_minutes': i % 60, 'calories_burned': i} for i in range(500)]
+
+    response = client.post('/activities/batch', json=payload, headers=headers)
+
+    assert response.status_code == 201
+    assert len(statements) == 1
+
+
+def test_batch_insert_returns_ids_in_input_order(app, client):
+    _, headers = register(client)
+    payload = [{'activity_type': f'type{i}', 'duration_minutes': i, 'calories_burned': 1000 - i} for i in range(50)]
+
+    results = client.post('/activities/batch', json=payload, headers=headers).get_json()['results']
+
+    assert [result['index'] for result in results] == list(range(50))
+    for i, result in enumerate(results):
+        activity = db.session.get(Activity, result['activity_id'])
+        assert (activity.activity_type, activity.duration_minutes, activity.calories_burned) == \
+            (f'type{i}', i, 1000 - i)
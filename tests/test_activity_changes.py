@@ -0,0 +1,34 @@
+#增量同步：变更日志的 seq 分配前先锁定用户的版本号行，保证同一用户的 seq 按提交顺序可见
+from sqlalchemy import event
+
+from conftest import register
+from models import db
+
+
+def test_version_row_is_locked_before_change_seq_is_allocated(client):
+    user_id, headers = register(client)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        for table in ('user_collection_versions', 'activity_changes'):
+            if statement.startswith(f'INSERT INTO {table}'):
+                statements.append(table)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    client.post('/activities', json={'activity_type': 'run', 'duration_minutes': 10}, headers=headers)
+    activity_id = client.post('/activities', json={'activity_type': 'run', 'duration_minutes': 20},
+                              headers=headers).get_json()['activity_id']
+    client.delete(f'/activities/{activity_id}', headers=headers)
+
+    assert statements == ['user_collection_versions', 'activity_changes'] * 3
+
+
+def test_changes_feed_returns_writes_in_order(client):
+    user_id, headers = register(client)
+    cursor = client.get(f'/users/{user_id}/activities/changes', headers=headers).get_json()['next_cursor']
+    ids = [client.post('/activities', json={'activity_type': 'run', 'duration_minutes': i}, headers=headers)
+           .get_json()['activity_id'] for i in range(3)]
+
+    data = client.get(f'/users/{user_id}/activities/changes?since={cursor}', headers=headers).get_json()
+
+    assert [activity['id'] for activity in data['upserts']] == ids
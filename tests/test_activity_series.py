@@ -0,0 +1,23 @@
+#运动数据图表：只有日期的 end_date 包含当天，次日零点的记录不计入
+from conftest import register
+
+
+def _post(client, headers, when, calories):
+    response = client.post('/activities', json={
+        'activity_type': 'run', 'duration_minutes': 10, 'calories_burned': calories, 'activity_date': when,
+    }, headers=headers)
+    assert response.status_code == 201
+
+
+def test_date_only_end_is_inclusive_and_exclusive_of_next_midnight(client):
+    user_id, headers = register(client)
+    _post(client, headers, '2024-01-01T00:00:00', 100)
+    _post(client, headers, '2024-01-05T23:59:59', 200)
+    _post(client, headers, '2024-01-06T00:00:00', 400)
+
+    data = client.get(f'/users/{user_id}/activities/series?start_date=2024-01-01&end_date=2024-01-05&points=5',
+                      headers=headers).get_json()
+
+    assert data['end_date'] == '2024-01-06T00:00:00'
+    assert [(point['bucket_start'], point['sum']) for point in data['series']] == [
+        ('2024-01-01T00:00:00', 100), ('2024-01-05T00:00:00', 200)]
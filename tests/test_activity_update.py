@@ -0,0 +1,61 @@
+#PUT /activities/<id>：部分更新的字段校验，非法值返回 400 且不修改记录和统计汇总
+import pytest
+
+from conftest import register
+from models import Activity, ActivityRollup, db
+
+
+@pytest.fixture
+def activity(client):
+    _, headers = register(client)
+    response = client.post('/activities', json={
+        'activity_type': 'run', 'duration_minutes': 30, 'calories_burned': 300, 'distance_km': 5.0,
+    }, headers=headers)
+    return response.get_json()['activity_id'], headers
+
+
+def _rollup_minutes():
+    return db.session.execute(db.select(db.func.sum(ActivityRollup.duration_minutes))).scalar()
+
+
+@pytest.mark.parametrize('body', [
+    {'duration_minutes': '45'},
+    {'duration_minutes': None},
+    {'activity_type': None},
+    {'activity_type': ''},
+    {'distance_km': 'abc'},
+    {'calories_burned': -1},
+])
+def test_invalid_fields_return_400_without_changes(client, activity, body):
+    activity_id, headers = activity
+    minutes_before = _rollup_minutes()
+
+    response = client.put(f'/activities/{activity_id}', json=body, headers=headers)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Bad Request'
+    db.session.expire_all()
+    stored = db.session.get(Activity, activity_id)
+    assert (stored.activity_type, stored.duration_minutes, stored.distance_km) == ('run', 30, 5.0)
+    assert _rollup_minutes() == minutes_before
+
+
+def test_partial_update_changes_only_given_fields(client, activity):
+    activity_id, headers = activity
+
+    response = client.put(f'/activities/{activity_id}', json={'duration_minutes': 45, 'distance_km': None},
+                          headers=headers)
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert (data['activity_type'], data['duration_minutes'], data['distance_km'], data['calories_burned']) == \
+        ('run', 45, None, 300)
+
+
+def test_null_calories_switches_to_estimate(client, activity):
+    activity_id, headers = activity
+
+    data = client.put(f'/activities/{activity_id}', json={'calories_burned': None}, headers=headers).get_json()['data']
+
+    assert data['calories_estimated'] is True
+    assert data['calories_burned'] > 0
@@ -0,0 +1,232 @@
+#WSGIToASGI 适配层测试：用假的 receive / send 直接驱动 ASGI 接口，不需要启动服务器
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.asgi_adapter import WSGIToASGI  # noqa: E402
+
+
+def _scope(path='/', method='POST', query_string=b''):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode('utf-8'),
+        'query_string': query_string, 'root_path': '', 'scheme': 'http', 'http_version': '1.1',
+        'headers': [(b'content-type', b'text/plain'), (b'x-test', b'1')],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+    }
+
+
+class FakeClient:
+    """按顺序返回请求体消息；消息用完后等待 disconnect 事件（未设置时一直挂起，与真实连接相同）"""
+
+    def __init__(self, chunks=(b'',)):
+        chunks = list(chunks)
+        self.messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                         for i, chunk in enumerate(chunks)]
+        self.sent = []
+        self.disconnect = asyncio.Event()
+
+    async def receive(self):
+        if self.messages:
+            return self.messages.pop(0)
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    @property
+    def status(self):
+        return next(m['status'] for m in self.sent if m['type'] == 'http.response.start')
+
+    @property
+    def body(self):
+        return b''.join(m.get('body', b'') for m in self.sent if m['type'] == 'http.response.body')
+
+
+def _echo_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [json.dumps({
+        'path': environ['PATH_INFO'], 'query': environ['QUERY_STRING'], 'length': environ['CONTENT_LENGTH'],
+        'content_type': environ.get('CONTENT_TYPE'), 'x_test': environ.get('HTTP_X_TEST'),
+        'body': body.decode('utf-8'),
+    }).encode('utf-8')]
+
+
+def _run(adapter, scope, client):
+    asyncio.run(adapter(scope, client.receive, client.send))
+
+
+def test_request_body_and_environ():
+    adapter = WSGIToASGI(_echo_app, workers=2)
+    client = FakeClient([b'ab', b'cd'])
+    _run(adapter, _scope('/echo', query_string=b'a=1'), client)
+
+    assert client.status == 200
+    assert json.loads(client.body) == {
+        'path': '/echo', 'query': 'a=1', 'length': '4', 'content_type': 'text/plain', 'x_test': '1', 'body': 'abcd',
+    }
+    # 普通响应只发送响应头和一条带 more_body=False 的响应体
+    assert [m['type'] for m in client.sent] == ['http.response.start', 'http.response.body']
+    assert client.sent[-1]['more_body'] is False
+    assert adapter.stats()['open_requests'] == 0
+
+
+def test_body_over_limit_returns_413_without_calling_app():
+    calls = []
+
+    def app(environ, start_response):
+        calls.append(environ)
+        return _echo_app(environ, start_response)
+
+    adapter = WSGIToASGI(app, workers=1, max_body_size=8)
+    client = FakeClient([b'01234', b'56789'])
+    _run(adapter, _scope(), client)
+
+    assert client.status == 413
+    assert json.loads(client.body)['error'] == 'Payload Too Large'
+    assert calls == []
+
+
+def test_disconnect_while_reading_body_skips_app():
+    calls = []
+
+    def app(environ, start_response):
+        calls.append(environ)
+        return _echo_app(environ, start_response)
+
+    adapter = WSGIToASGI(app, workers=1)
+    client = FakeClient([b'partial'])
+    client.messages[0]['more_body'] = True  # 客户端在请求体发送完之前断开
+    client.disconnect.set()
+    _run(adapter, _scope(), client)
+
+    assert client.sent == []
+    assert calls == []
+
+
+def test_streaming_response_sends_chunks_in_order():
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return iter([b'one', b'', b'two', b'three'])
+
+    client = FakeClient()
+    _run(WSGIToASGI(app, workers=1), _scope(method='GET'), client)
+
+    bodies = [(m['body'], m['more_body']) for m in client.sent if m['type'] == 'http.response.body']
+    assert bodies == [(b'one', True), (b'two', True), (b'three', False)]
+
+
+def test_disconnect_during_stream_stops_iteration_and_closes():
+    produced = []
+    closed = threading.Event()
+    first_chunk_sent = threading.Event()
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+
+        def generate():
+            try:
+                for i in range(1000):
+                    if i == 2:
+                        first_chunk_sent.set()
+                        if not release.wait(5):
+                            raise AssertionError('client did not disconnect')
+                    produced.append(i)
+                    yield b'x'
+            finally:
+                closed.set()
+        return generate()
+
+    release = threading.Event()
+    client = FakeClient()
+
+    async def main():
+        adapter = WSGIToASGI(app, workers=1)
+        task = asyncio.ensure_future(adapter(_scope(method='GET'), client.receive, client.send))
+        await asyncio.get_running_loop().run_in_executor(None, first_chunk_sent.wait, 5)
+        client.disconnect.set()
+        await asyncio.sleep(0.05)  # 让断开监视任务处理 disconnect 消息
+        release.set()
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(main())
+    assert closed.is_set()
+    assert len(produced) < 1000
+    assert all(m.get('more_body', False) is True for m in client.sent if m['type'] == 'http.response.body')
+
+
+def test_exception_before_headers_returns_500():
+    def app(environ, start_response):
+        raise RuntimeError('boom')
+
+    client = FakeClient()
+    _run(WSGIToASGI(app, workers=1), _scope(), client)
+
+    assert client.status == 500
+    assert json.loads(client.body) == {
+        'error': 'Internal Server Error', 'message': 'Unhandled server error', 'status_code': 500,
+    }
+
+
+def test_exception_after_headers_propagates_to_server():
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+
+        def generate():
+            yield b'first'
+            yield b'second'
+            raise RuntimeError('boom')
+        return generate()
+
+    client = FakeClient()
+    with pytest.raises(RuntimeError):
+        _run(WSGIToASGI(app, workers=1), _scope(method='GET'), client)
+
+    # 响应头已经发出，不能再改为 500，由服务器断开连接
+    statuses = [m['status'] for m in client.sent if m['type'] == 'http.response.start']
+    assert statuses == [200]
+    assert client.body == b'first'
+
+
+def test_lifespan_shutdown_waits_for_inflight_request():
+    started = threading.Event()
+    release = threading.Event()
+
+    def app(environ, start_response):
+        started.set()
+        release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'done']
+
+    adapter = WSGIToASGI(app, workers=1)
+    client = FakeClient()
+
+    async def main():
+        lifespan_messages = asyncio.Queue()
+        lifespan_sent = []
+
+        async def lifespan_send(message):
+            lifespan_sent.append(message['type'])
+
+        lifespan = asyncio.ensure_future(adapter({'type': 'lifespan'}, lifespan_messages.get, lifespan_send))
+        await lifespan_messages.put({'type': 'lifespan.startup'})
+        request = asyncio.ensure_future(adapter(_scope(method='GET'), client.receive, client.send))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+
+        # 关闭时请求仍在执行：事件循环必须保持运行，请求才能把响应发出去
+        await lifespan_messages.put({'type': 'lifespan.shutdown'})
+        await asyncio.sleep(0.05)
+        assert not lifespan.done()
+        release.set()
+        await asyncio.wait_for(asyncio.gather(request, lifespan), 5)
+        return lifespan_sent
+
+    assert asyncio.run(main()) == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert client.status == 200 and client.body == b'done'
@@ -0,0 +1,51 @@
+#集合接口的条件请求：Last-Modified 只有秒级精度，同一秒内的写入不能因 If-Modified-Since 返回过期的 304
+from datetime import datetime, timedelta
+
+from werkzeug.http import http_date
+
+from conftest import register
+from models import UserCollectionVersion, db
+
+
+def _set_updated_at(user_id, value):
+    db.session.execute(db.update(UserCollectionVersion).where(UserCollectionVersion.user_id == user_id)
+                       .values(updated_at=value))
+    db.session.commit()
+
+
+def _post_activity(client, headers):
+    response = client.post('/activities', json={'activity_type': 'run', 'duration_minutes': 10}, headers=headers)
+    assert response.status_code == 201
+
+
+def test_last_modified_withheld_within_current_second(client):
+    user_id, headers = register(client)
+    _post_activity(client, headers)
+    now = datetime.utcnow()
+    _set_updated_at(user_id, now)
+
+    first = client.get(f'/users/{user_id}/activities', headers=headers)
+    assert first.status_code == 200
+    if datetime.utcnow().replace(microsecond=0) == now.replace(microsecond=0):
+        assert 'Last-Modified' not in first.headers
+
+    # 与最后一次写入同一秒的 If-Modified-Since 不能命中 304
+    response = client.get(f'/users/{user_id}/activities',
+                          headers={**headers, 'If-Modified-Since': http_date(now.replace(microsecond=0))})
+    assert response.status_code == 200
+
+
+def test_write_after_last_modified_is_not_hidden(client):
+    user_id, headers = register(client)
+    _post_activity(client, headers)
+    _set_updated_at(user_id, datetime.utcnow() - timedelta(seconds=10))
+
+    first = client.get(f'/users/{user_id}/activities', headers=headers)
+    last_modified = first.headers['Last-Modified']
+    cached = client.get(f'/users/{user_id}/activities', headers={**headers, 'If-Modified-Since': last_modified})
+    assert cached.status_code == 304
+
+    _post_activity(client, headers)
+    response = client.get(f'/users/{user_id}/activities', headers={**headers, 'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+    assert len(response.get_json()['activities']) == 2
@@ -0,0 +1,148 @@
+#排行榜：分桶人数与分数行一致、榜外名次与全量排序一致、进程内榜单缓存的增量应用与前 K 名淘汰
+import random
+
+import pytest
+
+import utils.leaderboards as leaderboards
+from models import LeaderboardBucket, LeaderboardScore, db
+from utils.leaderboards import BoardCache, apply_deltas, backfill_buckets, release_buckets, user_rank
+
+BOARD = 'calories:week:2024-01-01:*'
+
+
+@pytest.fixture
+def cache(app, monkeypatch):
+    # 每个榜单只在内存中保存前 3 名，提交钩子使用这个缓存
+    cache = BoardCache(capacity=3)
+    monkeypatch.setattr(leaderboards, 'board_cache', cache)
+    return cache
+
+
+def _commit(deltas):
+    apply_deltas({(BOARD, user_id): delta for user_id, delta in deltas.items()})
+    db.session.commit()
+
+
+def _scores():
+    return dict(db.session.execute(
+        db.select(LeaderboardScore.user_id, LeaderboardScore.score).where(LeaderboardScore.board == BOARD)
+    ).all())
+
+
+def _expected_ranks():
+    ordered = sorted(_scores().items(), key=lambda item: (-item[1], item[0]))
+    return {user_id: (rank, score) for rank, (user_id, score) in enumerate(ordered, 1)}
+
+
+def _assert_buckets_consistent():
+    counted = dict(((board, bucket), users) for board, bucket, users in db.session.execute(
+        db.select(LeaderboardBucket.board, LeaderboardBucket.bucket, LeaderboardBucket.users)
+        .where(LeaderboardBucket.users != 0)
+    ).all())
+    actual = dict(((board, bucket), users) for board, bucket, users in db.session.execute(
+        db.select(LeaderboardScore.board, LeaderboardScore.bucket, db.func.count())
+        .group_by(LeaderboardScore.board, LeaderboardScore.bucket)
+    ).all())
+    assert counted == actual
+    assert db.session.execute(
+        db.select(db.func.count()).select_from(LeaderboardScore).where(LeaderboardScore.bucket.is_(None))
+    ).scalar() == 0
+
+
+def test_ranks_outside_top_k_match_full_sort(cache):
+    rng = random.Random(7)
+    for _ in range(30):
+        _commit({rng.randrange(40): rng.choice([1, 1, 1, -1]) * rng.uniform(0.05, 500) for _ in range(10)})
+        _assert_buckets_consistent()
+
+    board = cache.get(BOARD)
+    assert not board.complete
+    expected = _expected_ranks()
+    assert {user_id: user_rank(board, BOARD, user_id) for user_id in expected} == expected
+    assert user_rank(board, BOARD, 999) is None
+
+
+def test_equal_scores_rank_by_user_id(cache):
+    _commit({user_id: 10.0 for user_id in range(1, 7)})
+
+    board = cache.get(BOARD)
+
+    assert [user_rank(board, BOARD, user_id)[0] for user_id in range(1, 7)] == [1, 2, 3, 4, 5, 6]
+
+
+def test_commit_applies_to_cached_board_and_after_reload(cache):
+    _commit({1: 30.0, 2: 20.0})
+    board = cache.get(BOARD)
+
+    _commit({2: 15.0})
+    assert cache.get(BOARD) is board  # 已提交的增量直接应用到缓存的榜单，不重新加载
+    assert board.top(3) == [(1, 2, 35.0), (2, 1, 30.0)]
+
+    cache.clear()
+    reloaded = cache.get(BOARD)
+    assert reloaded is not board
+    _commit({1: 10.0})
+    # 重新加载的榜单已包含之前的增量，之后的增量只计入一次
+    assert reloaded.top(3) == [(1, 1, 40.0), (2, 2, 35.0)]
+    assert cache.get(BOARD).scores == _scores()
+
+
+def test_load_during_inflight_commit_is_not_cached(cache):
+    _commit({1: 5.0})
+    cache.begin('writer', {BOARD})
+
+    cache.get(BOARD)
+    assert BOARD not in cache._boards
+
+    cache.finish('writer', {BOARD})
+    cache.get(BOARD)
+    assert BOARD in cache._boards
+
+
+def test_top_k_eviction_keeps_ranks_exact(cache):
+    _commit({1: 30.0, 2: 20.0, 3: 10.0})
+    board = cache.get(BOARD)
+    assert board.complete
+
+    _commit({4: 25.0})  # 新用户进入前 3 名，第 3 名被挤出内存
+    assert cache.get(BOARD) is board
+    assert board.top(3) == [(1, 1, 30.0), (2, 4, 25.0), (3, 2, 20.0)]
+    assert (board.total, board.complete) == (4, False)
+    assert user_rank(board, BOARD, 3) == (4, 10.0)
+
+    _commit({5: 1.0})  # 榜外新用户：只增加总人数
+    assert cache.get(BOARD) is board
+    assert board.total == 5
+
+    _commit({3: 50.0})  # 榜外用户进入前 3 名：内存中无法确定，重新加载
+    board = cache.get(BOARD)
+    assert board.top(3) == [(1, 3, 60.0), (2, 1, 30.0), (3, 4, 25.0)]
+    assert {user_id: user_rank(board, BOARD, user_id) for user_id in _scores()} == _expected_ranks()
+
+
+def test_score_decrease_reloads_board(cache):
+    _commit({1: 30.0, 2: 20.0, 3: 10.0, 4: 5.0})
+    cache.get(BOARD)
+
+    _commit({1: -28.0})
+
+    board = cache.get(BOARD)
+    assert board.top(3) == [(1, 2, 20.0), (2, 3, 10.0), (3, 4, 5.0)]
+    assert user_rank(board, BOARD, 1) == (4, pytest.approx(2.0))
+    _assert_buckets_consistent()
+
+
+def test_release_and_backfill_keep_bucket_counts(cache):
+    _commit({user_id: float(user_id * 7) for user_id in range(1, 20)})
+
+    release_buckets(LeaderboardScore.user_id == 5)
+    db.session.execute(db.delete(LeaderboardScore).where(LeaderboardScore.user_id == 5))
+    db.session.commit()
+    _assert_buckets_consistent()
+
+    # 分桶功能上线前的数据：没有分桶和人数，由 init-db 回填
+    db.session.execute(db.update(LeaderboardScore).values(bucket=None))
+    db.session.execute(db.delete(LeaderboardBucket))
+    db.session.commit()
+    assert backfill_buckets(chunk_size=4) == 18
+    _assert_buckets_consistent()
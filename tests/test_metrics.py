@@ -0,0 +1,18 @@
+#/metrics 文本输出：counter 名称只带一个 _total 后缀，时间统计换算为秒
+from utils.metrics import _gauge_lines, _ms_to_seconds
+
+
+def test_counter_suffix_is_not_duplicated():
+    lines = _gauge_lines('write_behind', {'commits': 3, 'commit_seconds_total': 1.5, 'queue_depth': 2},
+                         counters=('commits', 'commit_seconds_total'))
+
+    assert 'write_behind_commits_total 3' in lines
+    assert 'write_behind_commit_seconds_total 1.5' in lines
+    assert '# TYPE write_behind_queue_depth gauge' in lines
+    assert not any('_total_total' in line for line in lines)
+
+
+def test_millisecond_stats_are_exported_in_seconds():
+    converted = _ms_to_seconds({'commit_ms_total': 1500.0, 'last_commit_ms': 20.0, 'commits': 4, 'items': 7})
+
+    assert converted == {'commit_seconds_total': 1.5, 'last_commit_seconds': 0.02, 'commits': 4, 'items': 7}
@@ -0,0 +1,188 @@
+#账户删除：注销时只标记用户并创建任务，后台线程按表分批删除该用户的数据
+#每批单独提交并在批次之间短暂让出，其他请求的写事务不会被长时间阻塞
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import tuple_
+from models import (AccountPurgeJob, Activity, ActivityChange, ActivityRollup, FitnessPlan,
+                    LeaderboardScore, User, UserCollectionVersion, db)
+from utils.leaderboards import board_cache, release_buckets
+from utils.plan_search import unindex_plans
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_PAUSE_MS = 20
+
+# 清理顺序：(阶段名, 模型)，用户行在所有阶段完成后删除
+PURGE_STAGES = (
+    ('activities', Activity),
+    ('activity_changes', ActivityChange),
+    ('activity_rollups', ActivityRollup),
+    ('leaderboard_scores', LeaderboardScore),
+    ('fitness_plans', FitnessPlan),
+    ('user_collection_versions', UserCollectionVersion),
+)
+RESUMABLE_STATUSES = ('pending', 'running', 'failed')
+
+
+def _delete_chunk(model, user_id, chunk_size):
+    # 先按主键取出一批，再按主键删除，保证每个事务只触及 chunk_size 行
+    primary_key = list(model.__table__.primary_key.columns)
+    keys = db.session.execute(
+        db.select(*primary_key).where(model.user_id == user_id).limit(chunk_size)
+    ).all()
+    if not keys:
+        return 0
+    if len(primary_key) == 1:
+        condition = primary_key[0].in_([key[0] for key in keys])
+    else:
+        condition = tuple_(*primary_key).in_([tuple(key) for key in keys])
+    if model is FitnessPlan:
+        # 批量删除不会触发 mapper 事件，需要手动从搜索索引中移除
+        unindex_plans(db.session.connection(), [key[0] for key in keys])
+    if model is LeaderboardScore:
+        release_buckets(condition)
+    db.session.execute(db.delete(model).where(condition).execution_options(synchronize_session=False))
+    return len(keys)
+
+
+def _sweep(user_id):
+    """删除各阶段中该用户剩余的全部数据（不分批，正常情况下已经没有剩余行），返回删除的行数"""
+    deleted = 0
+    for _, model in PURGE_STAGES:
+        if model is FitnessPlan:
+            unindex_plans(db.session.connection(), db.session.execute(
+                db.select(FitnessPlan.id).where(FitnessPlan.user_id == user_id)).scalars().all())
+        if model is LeaderboardScore:
+            release_buckets(LeaderboardScore.user_id == user_id)
+        deleted += db.session.execute(
+            db.delete(model).where(model.user_id == user_id).execution_options(synchronize_session=False)
+        ).rowcount
+    return deleted
+
+
+def _count_rows(user_id):
+    total = 1  # 用户行本身
+    for _, model in PURGE_STAGES:
+        total += db.session.execute(
+            db.select(db.func.count()).select_from(model).where(model.user_id == user_id)
+        ).scalar()
+    return total
+
+
+def claim_job(job_id, resume=False):
+    """把任务标记为 running，返回是否抢到；resume=True 时也接管 running / failed 的任务（进程中断后恢复）"""
+    statuses = RESUMABLE_STATUSES if resume else ('pending',)
+    claimed = db.session.execute(
+        db.update(AccountPurgeJob)
+        .where(AccountPurgeJob.id == job_id, AccountPurgeJob.status.in_(statuses))
+        .values(status='running', error=None)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def run_purge_job(job_id, chunk_size=DEFAULT_CHUNK_SIZE, pause_ms=DEFAULT_PAUSE_MS):
+    """
+    执行（或继续执行）一个已被 claim 的删除任务
+    每个阶段循环删除直到没有剩余行；各批次都是幂等的，中断后重新执行会从剩余数据继续
+    """
+    job = db.session.get(AccountPurgeJob, job_id)
+    try:
+        if job.started_at is None:
+            job.started_at = datetime.utcnow()
+            job.rows_total = _count_rows(job.user_id)
+            db.session.commit()
+
+        for stage, model in PURGE_STAGES:
+            job.stage = stage
+            while True:
+                deleted = _delete_chunk(model, job.user_id, chunk_size)
+                job.rows_deleted += deleted
+                db.session.commit()
+                if deleted < chunk_size:
+                    break
+                time.sleep(pause_ms / 1000)
+            if model is LeaderboardScore:
+                board_cache.clear()
+
+        job.stage = 'users'
+        deleted = db.session.execute(
+            db.delete(User).where(User.id == job.user_id, User.deleted_at.is_not(None))
+        ).rowcount
+        # 最后一次清扫：注销前已通过认证的请求可能在分批删除期间又写入了数据，与用户行在同一事务中删除
+        swept = _sweep(job.user_id)
+        job.rows_deleted += deleted + swept
+        job.stage = None
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        if swept:
+            board_cache.clear()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("account purge job %s failed", job_id)
+        job = db.session.get(AccountPurgeJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        db.session.commit()
+    return job
+
+
+class AccountPurgeWorker:
+    """进程内后台线程：按提交顺序依次执行删除任务"""
+
+    def __init__(self, app, chunk_size=DEFAULT_CHUNK_SIZE, pause_ms=DEFAULT_PAUSE_MS):
+        self.app = app
+        self.chunk_size = chunk_size
+        self.pause_ms = pause_ms
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # 首次提交任务时才启动线程（与 write-behind 相同，兼容 fork 之后的 worker）
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='account-purge', daemon=True)
+                self._thread.start()
+
+    def submit(self, job_id):
+        self._ensure_started()
+        self._queue.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self.app.app_context():
+                    if claim_job(job_id):
+                        run_purge_job(job_id, self.chunk_size, self.pause_ms)
+            except Exception:
+                logger.exception("account purge worker failed on job %s", job_id)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """等待已提交的任务全部执行完（命令行和测试使用）"""
+        self._queue.join()
+
+
+def init_account_purge(app):
+    """根据配置为应用创建后台删除线程"""
+    def setting(name, default):
+        return app.config.get(name, os.getenv(name, default))
+
+    worker = AccountPurgeWorker(
+        app,
+        chunk_size=int(setting('ACCOUNT_PURGE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)),
+        pause_ms=float(setting('ACCOUNT_PURGE_PAUSE_MS', DEFAULT_PAUSE_MS)),
+    )
+    app.extensions['account_purge'] = worker
+    return worker
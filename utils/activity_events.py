@@ -0,0 +1,65 @@
+#运动记录写路径的统一钩子：新增 / 更新 / 删除后需要同步维护的派生数据都在这里处理
+#所有函数都在调用方的事务中执行，由调用方负责 commit / rollback
+from datetime import datetime
+from sqlalchemy import insert
+from models import ActivityChange, db
+from utils import leaderboards, rollups
+from utils.collection_version import bump_collection_version
+
+
+def _log_changes(activities, op):
+    # 追加变更日志（增量同步）并递增数据版本号，批量写入
+    if not activities:
+        return
+    # 先递增版本号再分配变更序号：版本号行的行锁持有到提交，同一用户的写事务在此排队，
+    # 因此同一用户的 seq 按提交顺序可见（PostgreSQL 并发提交时不会先看到 N+1 再看到 N）
+    bump_collection_version({activity['user_id'] for activity in activities})
+    changed_at = datetime.utcnow()
+    db.session.execute(insert(ActivityChange), [{
+        'user_id': activity['user_id'],
+        'activity_id': activity['id'],
+        'op': op,
+        'changed_at': changed_at,
+    } for activity in activities])
+
+
+def snapshot(activity):
+    """将 Activity 对象转换为普通字典，用于在修改/删除前保存旧值"""
+    return {
+        'id': activity.id,
+        'user_id': activity.user_id,
+        'activity_type': activity.activity_type,
+        'duration_minutes': activity.duration_minutes,
+        'calories_burned': activity.calories_burned,
+        'distance_km': activity.distance_km,
+        'activity_date': activity.activity_date,
+    }
+
+
+def activities_created(activities):
+    """新增运动记录之后调用，activities 为快照字典列表"""
+    deltas = {}
+    for activity in activities:
+        rollups.accumulate(deltas, activity, 1)
+    rollups.apply_deltas(deltas)
+    leaderboards.apply_deltas(leaderboards.deltas_from_rollups(deltas))
+    _log_changes(activities, 'upsert')
+
+
+def activity_updated(before, after):
+    """更新运动记录之后调用，before/after 为更新前后的快照"""
+    deltas = {}
+    rollups.accumulate(deltas, before, -1)
+    rollups.accumulate(deltas, after, 1)
+    rollups.apply_deltas(deltas)
+    leaderboards.apply_deltas(leaderboards.deltas_from_rollups(deltas))
+    _log_changes([after], 'upsert')
+
+
+def activity_deleted(activity):
+    """删除运动记录之后调用，activity 为删除前的快照"""
+    deltas = {}
+    rollups.accumulate(deltas, activity, -1)
+    rollups.apply_deltas(deltas)
+    leaderboards.apply_deltas(leaderboards.deltas_from_rollups(deltas))
+    _log_changes([activity], 'delete')
@@ -0,0 +1,117 @@
+#运动记录批量写入工具：统一的字段校验 + 单事务批量插入
+import json
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from models import Activity, db
+from utils import activity_events
+from utils.calories import fill_missing_calories
+
+MAX_BATCH_SIZE = 5000  # 单次批量写入的最大条数
+MAX_ACTIVITY_TYPE_LENGTH = 50
+
+
+def _is_number(value):
+    # bool 是 int 的子类，这里需要单独排除
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def naive_utc(value):
+    """带时区的时间转换为 UTC 后去掉时区；库中统一存储 naive UTC，混存会破坏 (activity_date, id) 排序和比较"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_activity_payload(data, partial=False):
+    """
+    校验单条运动记录，返回 (row, errors)
+    row 为可直接插入 Activity 表的字典；errors 非空时 row 为 None
+    partial=True 用于部分更新：只校验请求中出现的字段，row 只包含这些字段（activity_date 不补默认值）
+    """
+    if not isinstance(data, dict):
+        return None, ["activity must be a JSON object"]
+
+    errors = []
+    row = {}
+
+    def present(name):
+        return not partial or name in data
+
+    if present('activity_type'):
+        activity_type = row['activity_type'] = data.get('activity_type')
+        if not isinstance(activity_type, str) or not activity_type.strip():
+            errors.append("activity_type is required and must be a non-empty string")
+        elif len(activity_type) > MAX_ACTIVITY_TYPE_LENGTH:
+            errors.append(f"activity_type must be at most {MAX_ACTIVITY_TYPE_LENGTH} characters")
+
+    if present('duration_minutes'):
+        duration_minutes = row['duration_minutes'] = data.get('duration_minutes')
+        if not isinstance(duration_minutes, int) or isinstance(duration_minutes, bool) or duration_minutes < 0:
+            errors.append("duration_minutes is required and must be a non-negative integer")
+
+    # calories_burned 可省略（或为 null），由服务端估算
+    if present('calories_burned'):
+        calories_burned = row['calories_burned'] = data.get('calories_burned')
+        if calories_burned is not None and (
+                not isinstance(calories_burned, int) or isinstance(calories_burned, bool) or calories_burned < 0):
+            errors.append("calories_burned must be a non-negative integer")
+
+    if present('distance_km'):
+        distance_km = data.get('distance_km')
+        if distance_km is not None and (not _is_number(distance_km) or distance_km < 0):
+            errors.append("distance_km must be a non-negative number")
+        else:
+            row['distance_km'] = float(distance_km) if distance_km is not None else None
+
+    if present('activity_date'):
+        activity_date = data.get('activity_date')
+        if activity_date is None:
+            row['activity_date'] = datetime.utcnow()
+        else:
+            try:
+                row['activity_date'] = naive_utc(datetime.fromisoformat(activity_date))
+            except (TypeError, ValueError):
+                errors.append("activity_date must be an ISO 8601 datetime string")
+
+    if errors:
+        return None, errors
+    return row, []
+
+
+def parse_ndjson(body):
+    """
+    解析 NDJSON 请求体（每行一个 JSON 对象），空行忽略
+    返回 (items, line_numbers)：解析失败的行以 ValueError 实例占位；line_numbers 为每一项所在的物理行号（从 1 开始，
+    空行也计数），便于客户端按行定位错误
+    """
+    items = []
+    line_numbers = []
+    for line_number, line in enumerate(body.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        line_numbers.append(line_number)
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(ValueError(f"invalid JSON line: {e}"))
+    return items, line_numbers
+
+
+def insert_activities(user_id, rows):
+    """
+    在当前事务中批量插入运动记录，按输入顺序返回新记录 ID
+    借助 Activity 的插入哨兵列，SQLAlchemy 把整批合并为多行 INSERT ... RETURNING（每 1000 行一条语句）
+    缺少 calories_burned 的行先按用户身体数据估算
+    调用方负责 commit / rollback
+    """
+    if not rows:
+        return []
+    params = fill_missing_calories([dict(row, user_id=user_id) for row in rows], user_id)
+    stmt = insert(Activity).returning(Activity.id, sort_by_parameter_order=True)
+    result = db.session.execute(stmt, params)
+    new_ids = [row_id for (row_id,) in result]
+    for row, row_id in zip(params, new_ids):
+        row['id'] = row_id
+    activity_events.activities_created(params)
+    return new_ids
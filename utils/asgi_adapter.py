@@ -0,0 +1,236 @@
+#ASGI 适配层：在事件循环中持有连接、异步读取请求体，只在执行 Flask 视图时占用有界线程池中的线程
+#空闲的 keep-alive 连接和慢速上传 / 下载都不占线程，单进程可以维持大量移动端长连接
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKER_THREADS = 32
+SPOOL_MAX_MEMORY = 1024 * 1024  # 请求体超过 1MB 时转存到临时文件
+
+
+def _latin1(value):
+    # PEP 3333：environ 中的路径是按 latin-1 解码的原始字节
+    return value.encode('utf-8').decode('latin-1')
+
+
+def build_environ(scope, body_file, content_length):
+    """由 ASGI 的 http scope 构造 WSGI environ"""
+    script_name = scope.get('root_path', '')
+    path_info = scope['path']
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _latin1(script_name),
+        'PATH_INFO': _latin1(path_info),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(content_length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body_file,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = client[0], str(client[1])
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').lower()
+        value = raw_value.decode('latin-1')
+        if name == 'content-length':
+            continue  # 以实际读到的请求体长度为准
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _error_body(status_code, error, message):
+    return json.dumps({"error": error, "message": message, "status_code": status_code}).encode('utf-8')
+
+
+class WSGIToASGI:
+    """
+    把 WSGI 应用包装为 ASGI 应用（用法：uvicorn asgi:application）
+    - 请求体在事件循环中读完后才提交到线程池，慢速上传不占线程
+    - 视图在线程池中执行，响应体逐块通过事件循环发送，发送等待期间形成背压
+    - 客户端断开后停止迭代流式响应；线程池排队中的请求在客户端断开后直接丢弃
+    """
+
+    def __init__(self, wsgi_app, workers=DEFAULT_WORKER_THREADS, max_body_size=None):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self.max_body_size = max_body_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-wsgi')
+        self._lock = threading.Lock()
+        self.open_requests = 0  # 已接收、尚未完成的请求（包括正在读取请求体和排队等待线程的）
+        self.running = 0  # 正在线程中执行的请求
+        self.dropped = 0  # 排队期间客户端已断开、未执行的请求
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            with self._lock:
+                self.open_requests += 1
+            try:
+                await self._handle_http(scope, receive, send)
+            finally:
+                with self._lock:
+                    self.open_requests -= 1
+        elif scope['type'] == 'websocket':
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1003})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 在默认线程池中等待正在执行的请求结束：它们通过事件循环发送响应，在循环中阻塞等待会互相等死
+                await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive, send):
+        """读取完整请求体，返回 (文件对象, 长度)；客户端断开或超出大小限制时返回 None"""
+        body_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body_file.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if self.max_body_size is not None and size > self.max_body_size:
+                body_file.close()
+                await self._send_simple(send, 413, _error_body(
+                    413, "Payload Too Large", f"Request body exceeds {self.max_body_size} bytes"))
+                return None
+            if chunk:
+                body_file.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body_file.seek(0)
+        return body_file, size
+
+    @staticmethod
+    async def _send_simple(send, status_code, body):
+        await send({'type': 'http.response.start', 'status': status_code, 'headers': [
+            (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('latin-1'))]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    async def _handle_http(self, scope, receive, send):
+        request_body = await self._read_body(receive, send)
+        if request_body is None:
+            return
+        body_file, size = request_body
+        environ = build_environ(scope, body_file, size)
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            await loop.run_in_executor(self._executor, self._run_wsgi, environ, send, loop, disconnected)
+        finally:
+            watcher.cancel()
+            body_file.close()
+
+    def _run_wsgi(self, environ, send, loop, disconnected):
+        """在线程池中执行：调用 WSGI 应用，把响应逐块交给事件循环发送"""
+        if disconnected.is_set():
+            with self._lock:
+                self.dropped += 1
+            return
+        with self._lock:
+            self.running += 1
+        state = {'start': None, 'sent': False}
+
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and state['sent']:
+                raise exc_info[1].with_traceback(exc_info[2])
+            state['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            }
+            return write
+
+        def send_body(chunk, more_body):
+            if not state['sent']:
+                send_sync(state['start'])
+                state['sent'] = True
+            send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+
+        def write(chunk):
+            # 旧式 write() 接口，Flask 不使用，按规范支持
+            if chunk:
+                send_body(chunk, True)
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                # 延迟一块发送，最后一块带上 more_body=False，普通响应只需发送两条消息
+                pending = None
+                for chunk in result:
+                    if disconnected.is_set():
+                        return
+                    if not chunk:
+                        continue
+                    if pending is not None:
+                        send_body(pending, True)
+                    pending = chunk
+                if not disconnected.is_set():
+                    send_body(pending or b'', False)
+            finally:
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    close()
+        except Exception:
+            if state['sent']:
+                raise  # 响应头已发出，只能由服务器断开连接
+            logger.exception("unhandled error in WSGI application")
+            body = _error_body(500, "Internal Server Error", "Unhandled server error")
+            state['start'] = {'type': 'http.response.start', 'status': 500, 'headers': [
+                (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('latin-1'))]}
+            send_body(body, False)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "open_requests": self.open_requests,
+                "running": self.running,
+                "waiting": self.open_requests - self.running,
+                "dropped": self.dropped,
+            }
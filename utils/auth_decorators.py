@@ -1,6 +1,7 @@
 from functools import wraps
 from flask import request, jsonify, g, current_app # 导入 g 对象
-import jwt
+from utils.token_cache import account_status, token_cache
+from models import User, db
 
 def token_required(f):
     @wraps(f)
@@ -18,8 +19,29 @@ def token_required(f):
                 "status_code": 401
             }), 401
 
+        import jwt # 延迟导入，缩短 worker 启动时间（已导入时只是一次字典查找）
+
         try:
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+            secret_key = current_app.config['SECRET_KEY']
+            # 先查已验证 Token 缓存，未命中时才做完整的 JWT 解码与签名校验
+            data = token_cache.get(token, secret_key)
+            if data is None:
+                data = jwt.decode(token, secret_key, algorithms=['HS256'])
+                token_cache.put(token, secret_key, data)
+            # 缓存命中时也要确认账户仍然有效（已注销的账户拒绝访问），状态按用户短暂缓存
+            active = account_status.get(data['user_id'])
+            if active is None:
+                account = db.session.execute(
+                    db.select(User.deleted_at).where(User.id == data['user_id'])
+                ).first()
+                active = account is not None and account.deleted_at is None
+                account_status.put(data['user_id'], active)
+            if not active:
+                return jsonify({
+                    "error": "Unauthorized",
+                    "message": "账户不存在或已注销。",
+                    "status_code": 401
+                }), 401
             g.user_id = data['user_id'] # 将 user_id 存储在 Flask 的全局 g 对象中
         except jwt.ExpiredSignatureError:
             return jsonify({
@@ -0,0 +1,138 @@
+#布隆过滤器：进程内记录已占用的用户名 / 邮箱，可用性检查对大多数未占用的值不再查询数据库
+#只能给出"一定不存在"或"可能存在"；其他进程的新注册不会同步过来，所以结果只作提示，注册仍以唯一索引为准
+import hashlib
+import logging
+import math
+import threading
+from models import User, db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ERROR_RATE = 0.01
+MIN_CAPACITY = 10000
+WARM_CHUNK_SIZE = 5000
+
+
+class BloomFilter:
+    """
+    位数组 + k 个哈希（由一次 blake2b 摘要做双重哈希得到）
+    按 capacity 和 error_rate 计算位数和哈希个数
+    """
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class UserIdentityFilter:
+    """
+    已占用用户名 / 邮箱的布隆过滤器
+    启动时从 users 表分块加载；本进程注册或修改成功后追加；未加载或元素数超过容量时在后台线程中重新加载
+    """
+
+    def __init__(self, error_rate=DEFAULT_ERROR_RATE):
+        self.error_rate = error_rate
+        self._filter = None
+        self._lock = threading.Lock()
+        self._warming = False
+        self.skipped_lookups = 0
+        self.db_lookups = 0
+
+    @staticmethod
+    def _key(field, value):
+        return f'{field}:{value}'
+
+    @property
+    def ready(self):
+        return self._filter is not None and self._filter.count <= self._filter.capacity
+
+    def warm(self):
+        """从数据库重新加载全部用户名和邮箱（在应用上下文中调用），返回加载的用户数"""
+        total = db.session.execute(db.select(db.func.count()).select_from(User)).scalar()
+        bloom = BloomFilter(max(MIN_CAPACITY, total * 2 * 2), self.error_rate)  # 每个用户两个值，再留一倍余量
+        rows = db.session.execute(
+            db.select(User.username, User.email).execution_options(yield_per=WARM_CHUNK_SIZE))
+        loaded = 0
+        for username, email in rows:
+            bloom.add(self._key('username', username))
+            bloom.add(self._key('email', email))
+            loaded += 1
+        with self._lock:
+            self._filter = bloom
+        return loaded
+
+    def refresh_async(self, app):
+        """在后台线程中重新加载（已有加载在进行时不重复启动）"""
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+
+        def run():
+            try:
+                with app.app_context():
+                    self.warm()
+            except Exception as e:
+                logger.warning("user identity filter refresh failed: %s", e)
+            finally:
+                self._warming = False
+
+        threading.Thread(target=run, name='identity-filter-warm', daemon=True).start()
+
+    def add(self, username=None, email=None):
+        with self._lock:
+            if self._filter is None:
+                return
+            if username is not None:
+                self._filter.add(self._key('username', username))
+            if email is not None:
+                self._filter.add(self._key('email', email))
+
+    def might_exist(self, field, value):
+        """False 表示一定未被占用；True 表示可能已被占用（需要查库确认）；过滤器不可用时返回 None"""
+        with self._lock:
+            bloom = self._filter
+        if bloom is None or bloom.count > bloom.capacity:
+            return None
+        return self._key(field, value) in bloom
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            "ready": self.ready,
+            "count": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else 0,
+            "size_bytes": len(bloom.bits) if bloom else 0,
+            "skipped_lookups": self.skipped_lookups,
+            "db_lookups": self.db_lookups,
+        }
+
+
+def init_identity_filter(app):
+    """创建过滤器并在启动时加载；users 表尚不存在等情况下记录日志，首次使用时再加载"""
+    identity_filter = UserIdentityFilter()
+    app.extensions['user_identity_filter'] = identity_filter
+    with app.app_context():
+        try:
+            identity_filter.warm()
+        except Exception as e:
+            logger.warning("user identity filter not warmed at startup: %s", e)
+    return identity_filter
@@ -0,0 +1,233 @@
+#卡路里估算：按运动类型查 MET 表，结合时长、距离（配速）和用户身体数据计算消耗
+#单条估算用纯 Python；批量重算在安装了 numpy 时按列向量化计算，否则逐行回退
+import bisect
+from datetime import datetime
+from sqlalchemy import update
+from models import Activity, ActivityChange, User, db
+from utils.collection_version import bump_collection_version
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，只影响批量重算的速度
+    np = None
+
+DEFAULT_MET = 5.0  # 未知运动类型按中等强度估算
+DEFAULT_WEIGHT_KG = 70.0  # 用户未填写体重时使用
+STANDARD_RMR = 3.5  # 标准静息耗氧量 ml/kg/min（1 MET 的定义）
+RMR_RANGE = (2.5, 4.5)  # 个体化静息耗氧量的合理范围，超出时截断
+SEX_NEUTRAL_OFFSET = -78  # Mifflin-St Jeor 公式男女常数项(+5/-161)的中值，用户表没有性别字段
+RECOMPUTE_CHUNK_SIZE = 10000
+
+# MET 参考值来自 Compendium of Physical Activities
+MET_TABLE = {
+    'walking': 3.5,
+    'running': 9.8,
+    'cycling': 7.5,
+    'swimming': 6.0,
+    'hiking': 6.0,
+    'rowing': 7.0,
+    'elliptical': 5.0,
+    'jump_rope': 11.8,
+    'hiit': 8.0,
+    'strength': 5.0,
+    'yoga': 2.5,
+    'pilates': 3.0,
+    'stretching': 2.3,
+    'dancing': 5.0,
+    'climbing': 8.0,
+    'basketball': 6.5,
+    'football': 7.0,
+    'tennis': 7.3,
+    'badminton': 5.5,
+}
+
+# 运动类型别名（客户端传入的 activity_type 不统一）
+ACTIVITY_ALIASES = {
+    'walk': 'walking', '步行': 'walking', '走路': 'walking', '健走': 'walking',
+    'run': 'running', 'jogging': 'running', '跑步': 'running', '慢跑': 'running',
+    'bike': 'cycling', 'biking': 'cycling', 'cycle': 'cycling', '骑行': 'cycling', '骑车': 'cycling',
+    'swim': 'swimming', '游泳': 'swimming',
+    'hike': 'hiking', '徒步': 'hiking', '登山': 'hiking',
+    'row': 'rowing', '划船': 'rowing',
+    '椭圆机': 'elliptical',
+    'skipping': 'jump_rope', '跳绳': 'jump_rope',
+    'strength_training': 'strength', 'weight_training': 'strength', 'weights': 'strength', '力量训练': 'strength',
+    '瑜伽': 'yoga', '普拉提': 'pilates', 'stretch': 'stretching', '拉伸': 'stretching',
+    'dance': 'dancing', '舞蹈': 'dancing', '跳舞': 'dancing',
+    'rock_climbing': 'climbing', '攀岩': 'climbing',
+    '篮球': 'basketball', 'soccer': 'football', '足球': 'football', '网球': 'tennis', '羽毛球': 'badminton',
+}
+
+# 有距离时按速度(km/h)插值 MET，速度超出范围时取端点值
+SPEED_MET_CURVES = {
+    'walking': ((3.2, 4.0, 4.8, 5.6, 6.4, 7.2), (2.8, 3.0, 3.5, 4.3, 5.0, 7.0)),
+    'running': ((6.4, 8.0, 9.7, 11.3, 12.9, 14.5, 16.1, 17.7, 19.3), (6.0, 8.3, 9.8, 11.0, 11.8, 12.8, 14.5, 16.0, 19.0)),
+    'cycling': ((16.0, 19.3, 22.5, 25.7, 30.6, 32.2), (4.0, 6.8, 8.0, 10.0, 12.0, 15.8)),
+}
+
+
+def normalize_activity_type(activity_type):
+    key = str(activity_type or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return ACTIVITY_ALIASES.get(key, key)
+
+
+def _interp(x, xs, ys):
+    # 与 numpy.interp 一致的分段线性插值（两端截断）
+    if x <= xs[0]:
+        return ys[0]
+    if x >= xs[-1]:
+        return ys[-1]
+    i = bisect.bisect_right(xs, x)
+    x0, x1, y0, y1 = xs[i - 1], xs[i], ys[i - 1], ys[i]
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+def _met(kind, duration_minutes, distance_km):
+    curve = SPEED_MET_CURVES.get(kind)
+    if curve is not None and distance_km and duration_minutes:
+        return _interp(distance_km / (duration_minutes / 60), *curve)
+    return MET_TABLE.get(kind, DEFAULT_MET)
+
+
+def _rmr(weight, height, age):
+    """
+    个体化静息耗氧量（ml/kg/min）：Mifflin-St Jeor 基础代谢(kcal/天) 换算为耗氧量（1 L O2 ≈ 5 kcal）
+    身高或年龄缺失时使用标准值 3.5
+    """
+    if not height or not age:
+        return STANDARD_RMR
+    bmr = 10 * weight + 6.25 * height - 5 * age + SEX_NEUTRAL_OFFSET
+    rmr = bmr / weight / 1440 * 200
+    return min(max(rmr, RMR_RANGE[0]), RMR_RANGE[1])
+
+
+def estimate_calories(activity_type, duration_minutes, distance_km=None, weight=None, height=None, age=None):
+    """
+    估算单条运动记录的卡路里消耗（整数 kcal）
+    kcal = 校正 MET × 体重(kg) × 时长(h)，校正 MET = MET × 3.5 / 个体静息耗氧量
+    """
+    if not duration_minutes or duration_minutes <= 0:
+        return 0
+    weight = weight if weight and weight > 0 else DEFAULT_WEIGHT_KG
+    met = _met(normalize_activity_type(activity_type), duration_minutes, distance_km)
+    corrected_met = met * STANDARD_RMR / _rmr(weight, height, age)
+    return int(round(corrected_met * weight * duration_minutes / 60))
+
+
+def _float_column(values, count):
+    # None 转为 NaN；比 np.array(list, dtype=float) 处理含 None 的列表快
+    return np.fromiter((np.nan if value is None else value for value in values), dtype=float, count=count)
+
+
+def estimate_calories_batch(activity_types, durations, distances, weights, heights, ages):
+    """
+    批量估算，参数为等长序列（缺失值用 None），返回整数列表
+    安装了 numpy 时整列向量化计算，结果与 estimate_calories 一致
+    """
+    if np is None:
+        return [estimate_calories(*row) for row in zip(activity_types, durations, distances, weights, heights, ages)]
+    count = len(durations)
+    if not count:
+        return []
+
+    # 运动类型编码为整数，只对不同的类型做一次归一化和查表
+    codes = {}
+    type_codes = np.fromiter((codes.setdefault(t, len(codes)) for t in activity_types), dtype=np.intp, count=count)
+    kinds = [normalize_activity_type(t) for t in codes]
+
+    duration = _float_column(durations, count)
+    distance = np.nan_to_num(_float_column(distances, count))
+    weight = _float_column(weights, count)
+    weight = np.where(np.isnan(weight) | (weight <= 0), DEFAULT_WEIGHT_KG, weight)
+    height = _float_column(heights, count)
+    age = _float_column(ages, count)
+
+    # 先按类型查表，再对有距离的步行/跑步/骑行按速度插值覆盖
+    met = np.array([MET_TABLE.get(kind, DEFAULT_MET) for kind in kinds])[type_codes]
+    positive = duration > 0
+    for kind, (xs, ys) in SPEED_MET_CURVES.items():
+        curve_codes = [code for code, name in enumerate(kinds) if name == kind]
+        if not curve_codes:
+            continue
+        mask = np.isin(type_codes, curve_codes) & positive & (distance > 0)
+        met[mask] = np.interp(distance[mask] / (duration[mask] / 60), xs, ys)
+
+    has_biometrics = ~np.isnan(height) & ~np.isnan(age) & (height != 0) & (age != 0)
+    with np.errstate(invalid='ignore'):
+        bmr = 10 * weight + 6.25 * height - 5 * age + SEX_NEUTRAL_OFFSET
+        rmr = np.clip(bmr / weight / 1440 * 200, *RMR_RANGE)
+    rmr = np.where(has_biometrics, rmr, STANDARD_RMR)
+
+    kcal = met * STANDARD_RMR / rmr * weight * np.where(positive, duration, 0) / 60
+    # np.rint 与 round 一样采用银行家舍入
+    return np.rint(kcal).astype(int).tolist()
+
+
+def load_biometrics(user_ids):
+    """一次查询取出多个用户的 {user_id: (weight, height, age)}"""
+    rows = db.session.execute(
+        db.select(User.id, User.weight, User.height, User.age).where(User.id.in_(set(user_ids)))
+    ).all()
+    return {row.id: (row.weight, row.height, row.age) for row in rows}
+
+
+def fill_missing_calories(rows, user_id):
+    """
+    为缺少 calories_burned 的待插入行补全估算值，并标记 calories_estimated
+    rows 为 parse_activity_payload 返回的字典列表（原地修改）
+    """
+    missing = [row for row in rows if row.get('calories_burned') is None]
+    for row in rows:
+        row['calories_estimated'] = row.get('calories_burned') is None
+    if not missing:
+        return rows
+    weight, height, age = load_biometrics([user_id]).get(user_id, (None, None, None))
+    estimates = estimate_calories_batch(
+        [row['activity_type'] for row in missing],
+        [row['duration_minutes'] for row in missing],
+        [row.get('distance_km') for row in missing],
+        [weight] * len(missing), [height] * len(missing), [age] * len(missing))
+    for row, calories in zip(missing, estimates):
+        row['calories_burned'] = calories
+    return rows
+
+
+def recompute_estimates(user_id=None, chunk_size=RECOMPUTE_CHUNK_SIZE):
+    """
+    按 ID 游标分块重算所有估算值（calories_estimated 为真的记录），用于调整 MET 表或用户修改体重后
+    每块一次查询 + 一次向量化计算 + 一次批量 UPDATE，并单独提交，中断后重新执行即可
+    值有变化的记录写入变更日志并更新集合版本；统计汇总和排行榜由调用方之后统一重建
+    返回 (扫描条数, 变化条数)
+    """
+    scanned = changed = 0
+    last_id = 0
+    while True:
+        query = db.select(
+            Activity.id, Activity.user_id, Activity.activity_type, Activity.duration_minutes,
+            Activity.distance_km, Activity.calories_burned, User.weight, User.height, User.age
+        ).join(User, User.id == Activity.user_id).where(
+            Activity.calories_estimated.is_(True), Activity.id > last_id
+        )
+        if user_id is not None:
+            query = query.where(Activity.user_id == user_id)
+        rows = db.session.execute(query.order_by(Activity.id).limit(chunk_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        scanned += len(rows)
+
+        columns = list(zip(*rows))
+        estimates = estimate_calories_batch(columns[2], columns[3], columns[4], columns[6], columns[7], columns[8])
+        updates = [(row, calories) for row, calories in zip(rows, estimates) if calories != row.calories_burned]
+        if updates:
+            now = datetime.utcnow()
+            db.session.execute(update(Activity), [
+                {'id': row.id, 'calories_burned': calories, 'updated_at': now} for row, calories in updates])
+            # 与 activity_events 相同：先锁定版本号行再分配变更序号
+            bump_collection_version({row.user_id for row, _ in updates})
+            db.session.execute(db.insert(ActivityChange), [
+                {'user_id': row.user_id, 'activity_id': row.id, 'op': 'upsert', 'changed_at': now}
+                for row, _ in updates])
+            changed += len(updates)
+        db.session.commit()
+    return scanned, changed
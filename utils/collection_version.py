@@ -0,0 +1,92 @@
+#用户数据版本号与条件请求：轮询接口在执行任何数据查询之前比较 ETag / Last-Modified，未变化时直接返回 304
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, request
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import UserCollectionVersion, db
+
+
+def bump_collection_version(user_ids):
+    """
+    在当前事务中递增用户的数据版本号（不存在时创建），调用方负责 commit
+    user_ids: 单个用户 ID 或 ID 集合
+    同时锁定这些用户的版本号行直到事务结束，运动记录变更日志依赖它保证同一用户的 seq 按提交顺序可见；
+    按用户 ID 升序加锁，多个用户的批量写入之间不会死锁
+    """
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    now = datetime.utcnow()
+    params = [{'user_id': user_id, 'version': 1, 'updated_at': now} for user_id in sorted(set(user_ids))]
+    if not params:
+        return
+    dialect = db.session.get_bind().dialect.name
+    insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+    stmt = insert(UserCollectionVersion)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={
+            'version': UserCollectionVersion.version + 1,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+    db.session.execute(stmt, params)
+
+
+def get_collection_version(user_id):
+    """返回 (version, updated_at)，用户还没有任何写入记录时返回 (0, None)"""
+    row = db.session.execute(
+        db.select(UserCollectionVersion.version, UserCollectionVersion.updated_at)
+        .where(UserCollectionVersion.user_id == user_id)
+    ).first()
+    if row is None:
+        return 0, None
+    return row.version, row.updated_at
+
+
+def _collection_etag(user_id, version):
+    # 同一用户的不同接口/查询参数对应不同的表示，ETag 中包含二者的摘要
+    variant = hashlib.sha1(f'{request.endpoint}?{request.query_string.decode("latin-1")}'.encode('utf-8')).hexdigest()[:12]
+    return f'{user_id}.{version}.{variant}'
+
+
+def conditional_collection(f):
+    """
+    用户数据集合接口的条件请求装饰器（需放在 token_required 之后）
+    命中 If-None-Match / If-Modified-Since 时直接返回 304，不执行视图函数
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        user_id = kwargs.get('user_id')
+        if user_id is None or user_id != g.user_id:
+            return f(*args, **kwargs)  # 由视图函数返回 403 等错误
+
+        version, updated_at = get_collection_version(user_id)
+        etag = _collection_etag(user_id, version)
+        last_modified = None
+        # Last-Modified 只有秒级精度：最后一次写入仍在当前这一秒内时，同一秒内可能还有写入，
+        # 此时既不输出也不按 If-Modified-Since 判断（与 Apache 的做法相同），只依赖 ETag
+        if updated_at and updated_at.replace(microsecond=0) < datetime.utcnow().replace(microsecond=0):
+            last_modified = updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+
+        not_modified = False
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        elif request.if_modified_since and last_modified:
+            not_modified = last_modified <= request.if_modified_since
+
+        if not_modified:
+            response = current_app.response_class(status=304)
+        else:
+            result = f(*args, **kwargs)
+            response = current_app.make_response(result)
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        if last_modified:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated
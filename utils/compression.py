@@ -0,0 +1,241 @@
+#响应压缩：按 Accept-Encoding 协商 zstd / br / gzip，流式响应逐块压缩，小响应体不压缩
+#策略可按端点或蓝图配置；带强 ETag 的响应体（如预设计划）压缩结果按 (ETag, 编码) 缓存，命中时不再重复压缩
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli / zstandard 为可选依赖，未安装时只协商其余编码
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_SIZE = 1024  # 字节；小于该大小的响应体压缩收益不明显
+VARIANT_CACHE_BYTES = 16 * 1024 * 1024  # 压缩结果缓存的总字节上限
+COMPRESS_LEVELS = {'zstd': 3, 'br': 5, 'gzip': 6}  # 兼顾速度，br 默认的 11 级对动态响应太慢
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+# 默认策略；键为端点名（如 'plan_bp.get_preset_plans'）或蓝图名，端点优先
+# 用户模块的响应包含 Token，且会回显用户输入，关闭压缩以避免 BREACH 类攻击
+DEFAULT_POLICIES = {
+    'user_bp': {'enabled': False},
+}
+
+
+def _gzip_encoder(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31：gzip 格式，头部 mtime 为 0
+    return compressor.compress, compressor.flush
+
+
+def _brotli_encoder(level):
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.finish
+
+
+def _zstd_encoder(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+def available_encodings():
+    """服务端支持的编码，按优先级排列（客户端权重相同时取靠前的）"""
+    encoders = {}
+    if zstandard is not None:
+        encoders['zstd'] = _zstd_encoder
+    if brotli is not None:
+        encoders['br'] = _brotli_encoder
+    encoders['gzip'] = _gzip_encoder
+    return encoders
+
+
+def compress_bytes(data, encoding, level=None):
+    compress, finish = available_encodings()[encoding](level or COMPRESS_LEVELS[encoding])
+    return compress(data) + finish()
+
+
+def iter_compressed(chunks, encoding, level=None):
+    """逐块压缩可迭代的响应体；压缩器缓冲不足一块时不输出，结束时输出剩余数据"""
+    compress, finish = available_encodings()[encoding](level or COMPRESS_LEVELS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            out = compress(chunk)
+            if out:
+                yield out
+        yield finish()
+    finally:
+        # 客户端中途断开时关闭原始迭代器（释放 stream_with_context 持有的上下文和数据库游标）
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class VariantCache:
+    """
+    有界 LRU 缓存：(强 ETag, 编码) -> 压缩后的响应体
+    强 ETag 与响应体字节一一对应，内容变化后 ETag 随之变化，旧条目自然淘汰，不需要失效
+    """
+
+    def __init__(self, max_bytes=VARIANT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ResponseCompressor:
+    """
+    after_request 钩子：按策略压缩响应
+    跳过：策略关闭、非文本类型、已有 Content-Encoding（如导出接口自行压缩）、304/204/206、send_file 直通的文件
+    """
+
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, policies=None, cache_bytes=VARIANT_CACHE_BYTES):
+        self.min_size = min_size
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self.encoders = available_encodings()
+        self.variant_cache = VariantCache(cache_bytes)
+        self.compressed_bytes_in = 0
+        self.compressed_bytes_out = 0
+        self.streams = 0
+
+    def policy(self, endpoint, blueprint):
+        """合并后的策略：默认值 <- 蓝图策略 <- 端点策略"""
+        merged = {'enabled': True, 'min_size': self.min_size, 'encodings': None, 'cache': True}
+        for key in (blueprint, endpoint):
+            if key and key in self.policies:
+                merged.update(self.policies[key])
+        return merged
+
+    @staticmethod
+    def _compressible(response):
+        mimetype = response.mimetype or ''
+        return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+
+    def _negotiate(self, request, policy):
+        offered = [name for name in self.encoders if policy['encodings'] is None or name in policy['encodings']]
+        return request.accept_encodings.best_match(offered) if offered else None
+
+    def __call__(self, request, response):
+        policy = self.policy(request.endpoint, request.blueprint)
+        if (not policy['enabled'] or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control', '')
+                or not self._compressible(response)):
+            return response
+
+        # 响应内容随 Accept-Encoding 变化，无论本次是否压缩都需要告知缓存
+        response.vary.add('Accept-Encoding')
+        encoding = self._negotiate(request, policy)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            # 流式响应无法预知大小，总是压缩
+            response.response = iter_compressed(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            self.streams += 1
+        else:
+            data = response.get_data()
+            if len(data) < policy['min_size']:
+                return response
+            etag, weak = response.get_etag()
+            cache_key = (etag, encoding) if etag and not weak and policy['cache'] else None
+            body = self.variant_cache.get(cache_key) if cache_key else None
+            if body is None:
+                body = compress_bytes(data, encoding)
+                if cache_key:
+                    self.variant_cache.put(cache_key, body)
+            self.compressed_bytes_in += len(data)
+            self.compressed_bytes_out += len(body)
+            response.set_data(body)
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # 压缩后的字节与原表示不同，强 ETag 降为弱 ETag（If-None-Match 使用弱比较，仍可命中 304）
+            response.set_etag(etag, weak=True)
+        return response
+
+    def stats(self):
+        stats = {
+            "streams": self.streams,
+            "bytes_in": self.compressed_bytes_in,
+            "bytes_out": self.compressed_bytes_out,
+        }
+        stats.update({f"variant_cache_{name}": value for name, value in self.variant_cache.stats().items()})
+        return stats
+
+
+def init_compression(app):
+    """
+    根据配置注册压缩钩子
+    COMPRESSION_MIN_SIZE: 压缩阈值（字节）
+    COMPRESSION_POLICIES: {端点名或蓝图名: {'enabled', 'min_size', 'encodings', 'cache'}}，覆盖默认策略
+    """
+    compressor = ResponseCompressor(
+        min_size=int(app.config.get('COMPRESSION_MIN_SIZE', os.getenv('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE))),
+        policies=app.config.get('COMPRESSION_POLICIES'),
+    )
+    app.extensions['compression'] = compressor
+
+    @app.after_request
+    def _compress_response(response):
+        try:
+            return compressor(request, response)
+        except Exception:
+            # 压缩失败时返回未压缩的响应，不影响请求本身
+            logger.exception("response compression failed")
+            return response
+
+    return compressor
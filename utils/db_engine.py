@@ -0,0 +1,74 @@
+#数据库引擎配置：数据库地址来自环境变量，SQLite 连接建立时设置 WAL 等 PRAGMA，并配置连接池
+import os
+import sqlite3
+from sqlalchemy import event
+
+DEFAULT_DATABASE_URI = 'sqlite:///smart_fitness.db'
+
+
+def database_uri():
+    """读取 DATABASE_URL 环境变量，兼容部分平台使用的 postgres:// 写法"""
+    uri = os.getenv('DATABASE_URL') or DEFAULT_DATABASE_URI
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def _is_sqlite_memory(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def engine_options(uri):
+    """
+    根据数据库类型生成 SQLALCHEMY_ENGINE_OPTIONS
+    SQLite 文件库：连接池 + busy 超时；PostgreSQL 等：连接池 + 断线检测 + 定期回收
+    """
+    if uri.startswith('sqlite'):
+        if _is_sqlite_memory(uri):
+            return {}
+        return {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+            'connect_args': {
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000,
+                'check_same_thread': False,
+            },
+        }
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+
+
+def sqlite_pragmas():
+    """每个 SQLite 连接建立时执行的 PRAGMA，可通过环境变量调整"""
+    return {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),  # 读写互不阻塞
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),  # WAL 下仍保证数据库一致性
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),  # 负数表示 KiB，即 64MB
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'temp_store': 'MEMORY',
+    }
+
+
+def install_sqlite_pragmas(engine):
+    """为 SQLite 引擎注册 connect 事件，非 SQLite 引擎不做任何处理"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
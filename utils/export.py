@@ -0,0 +1,76 @@
+#运动记录导出工具：把查询结果逐行编码为 NDJSON / CSV，按块输出，可选 gzip 压缩
+import csv
+import io
+import json
+import zlib
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_COLUMNS = ['id', 'activity_type', 'duration_minutes', 'calories_burned', 'distance_km', 'activity_date']
+CHUNK_SIZE = 64 * 1024  # 每次向客户端输出的目标字节数
+
+
+def wants_gzip(accept_encodings):
+    """根据请求的 Accept-Encoding 判断客户端是否接受 gzip"""
+    return accept_encodings['gzip'] > 0
+
+
+def _row_values(row):
+    activity_date = row.activity_date
+    return [
+        row.id,
+        row.activity_type,
+        row.duration_minutes,
+        row.calories_burned,
+        row.distance_km,
+        activity_date.isoformat() if activity_date else None,
+    ]
+
+
+def _iter_ndjson(rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, _row_values(row))), ensure_ascii=False))
+        buffer.write('\n')
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(_row_values(row))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_export(rows, export_format, use_gzip=False):
+    """
+    将结果行编码为指定格式的字节块生成器
+    rows 应来自带 yield_per 的流式查询，整个过程只在内存中保留一个块
+    """
+    chunks = _iter_csv(rows) if export_format == 'csv' else _iter_ndjson(rows)
+    if not use_gzip:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+
+    # wbits=31 输出带 gzip 头的压缩流
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
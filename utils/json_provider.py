@@ -0,0 +1,58 @@
+#JSON 序列化：安装了 orjson 时使用 orjson 快速编码，否则回退到标准库 json；datetime/date 统一输出 ISO 8601
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+def _response_obj(args, kwargs):
+    # 与 jsonify 的参数约定一致：单个位置参数原样序列化，多个位置参数作为列表，关键字参数作为字典
+    if args and kwargs:
+        raise TypeError("app.json.response() takes either args or kwargs, not both")
+    if not args and not kwargs:
+        return None
+    if len(args) == 1:
+        return args[0]
+    return args or kwargs
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider：
+    - orjson 可用且没有要求缩进等特殊格式时走 orjson，直接输出 UTF-8 字节
+    - datetime/date 原生输出 ISO 8601 字符串（Flask 默认会输出 HTTP 日期格式）
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def _orjson_options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        # orjson 只支持紧凑输出，有 indent 等参数时交给标准库处理
+        if orjson is not None and set(kwargs) <= {'separators'}:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        obj = _response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,413 @@
+#排行榜：数据库保存每个榜单的用户分数和分数分桶人数（由写路径增量维护），进程内只保存前 K 名；
+#前 K 名之外的名次 = 更高分桶的人数之和 + 本桶内的 COUNT 查询，开销只与分桶数和本桶人数有关，与名次无关
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from models import ActivityRollup, LeaderboardBucket, LeaderboardScore, db
+
+LEADERBOARD_METRICS = ('calories', 'distance')
+LEADERBOARD_PERIODS = ('week', 'month')
+ALL_TYPES = '*'
+BOARD_CACHE_SIZE = 64  # 进程内最多缓存的榜单数
+BOARD_CACHE_TTL = 60  # 秒；其他进程的写入最多延迟这么久可见
+BOARD_TOP_K = 100  # 进程内只保存每个榜单的前 K 名（接口 limit 的上限）
+INFLIGHT_TIMEOUT = 30  # 秒；超过该时间仍未结束的写事务登记视为已丢失
+SCORE_EPSILON = 1e-9
+# 分数分桶：等比区间，相邻下界相差 BUCKET_RATIO 倍；榜外用户的名次查询只扫描自己所在的一个分桶
+BUCKET_RATIO = 1.05
+BUCKET_MIN_SCORE = 0.1
+BUCKET_MAX_SCORE = 1e7
+
+
+def board_key(metric, period, period_start, activity_type=None):
+    return f'{metric}:{period}:{period_start.isoformat()}:{activity_type or ALL_TYPES}'
+
+
+def deltas_from_rollups(rollup_deltas):
+    """
+    将统计汇总的增量 {(user_id, period, bucket_start, activity_type): [count, calories, minutes, km]}
+    转换为排行榜增量 {(board, user_id): score_delta}，同时计入具体运动类型和全部类型(*)两个榜单
+    """
+    deltas = {}
+    for (user_id, period, start, activity_type), (count, calories, minutes, km) in rollup_deltas.items():
+        if period not in LEADERBOARD_PERIODS:
+            continue
+        for metric, value in (('calories', calories), ('distance', km)):
+            if not value:
+                continue
+            for board_type in (activity_type, ALL_TYPES):
+                key = (board_key(metric, period, start, board_type), user_id)
+                deltas[key] = deltas.get(key, 0) + value
+    return deltas
+
+
+def _bounds():
+    bounds = [BUCKET_MIN_SCORE]
+    while bounds[-1] < BUCKET_MAX_SCORE:
+        bounds.append(bounds[-1] * BUCKET_RATIO)
+    return bounds
+
+
+# 分桶下界：桶 0 为 (-inf, BUCKET_BOUNDS[0])，桶 i 为 [BUCKET_BOUNDS[i-1], BUCKET_BOUNDS[i])，最后一个桶无上界
+BUCKET_BOUNDS = _bounds()
+
+
+def bucket_of(score):
+    return bisect.bisect_right(BUCKET_BOUNDS, score)
+
+
+def bucket_upper(bucket):
+    """分桶的上界（不含），最后一个桶返回 None"""
+    return BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else None
+
+
+def _upsert(model, index_elements, column):
+    """INSERT ... ON CONFLICT DO UPDATE：冲突时把 column 累加到已有行"""
+    dialect = db.session.get_bind().dialect.name
+    insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+    stmt = insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: getattr(model, column) + getattr(stmt.excluded, column)}
+    )
+
+
+def _add_bucket_counts(counts):
+    params = [{'board': board, 'bucket': bucket, 'users': users}
+              for (board, bucket), users in counts.items() if users]
+    if params:
+        db.session.execute(_upsert(LeaderboardBucket, ['board', 'bucket'], 'users'), params)
+
+
+def apply_deltas(deltas):
+    """
+    在当前事务中把分数增量写入数据库并同步分桶人数，把 (增量, 写入后的分数) 登记到会话上，事务提交后再更新进程内榜单
+    调用方负责 commit / rollback
+    """
+    params = [{'board': board, 'user_id': user_id, 'score': score, 'bucket': bucket_of(score)}
+              for (board, user_id), score in deltas.items() if abs(score) > SCORE_EPSILON]
+    if not params:
+        return
+    # upsert 只修改 score，RETURNING 中的 bucket 是该行原来的分桶（新插入的行为按增量计算的分桶）
+    rows = db.session.execute(
+        _upsert(LeaderboardScore, ['board', 'user_id'], 'score').returning(
+            LeaderboardScore.board, LeaderboardScore.user_id, LeaderboardScore.score, LeaderboardScore.bucket),
+        params)
+    returned = {(row.board, row.user_id): row for row in rows}
+
+    counts = {}
+    moved = []
+    for p in params:
+        row = returned[(p['board'], p['user_id'])]
+        created = abs(row.score - p['score']) <= SCORE_EPSILON
+        old_bucket = None if created else row.bucket  # 旧数据尚未回填分桶时同样为 None，不扣减
+        new_bucket = bucket_of(row.score) if row.score > SCORE_EPSILON else None  # 分数归零的行随后删除
+        if old_bucket == new_bucket and not created:
+            continue
+        if old_bucket is not None:
+            counts[(p['board'], old_bucket)] = counts.get((p['board'], old_bucket), 0) - 1
+        if new_bucket is not None:
+            counts[(p['board'], new_bucket)] = counts.get((p['board'], new_bucket), 0) + 1
+            if new_bucket != row.bucket:
+                moved.append({'b_board': p['board'], 'b_user_id': p['user_id'], 'b_bucket': new_bucket})
+    if moved:
+        db.session.execute(
+            db.update(LeaderboardScore.__table__)
+            .where(LeaderboardScore.board == db.bindparam('b_board'),
+                   LeaderboardScore.user_id == db.bindparam('b_user_id'))
+            .values(bucket=db.bindparam('b_bucket')),
+            moved
+        )
+    _add_bucket_counts(counts)
+
+    boards = {p['board'] for p in params}
+    db.session.execute(
+        db.delete(LeaderboardScore).where(
+            LeaderboardScore.board.in_(boards),
+            LeaderboardScore.score <= SCORE_EPSILON
+        )
+    )
+    db.session.info.setdefault('leaderboard_deltas', []).extend(
+        (p['board'], p['user_id'], p['score'], returned[(p['board'], p['user_id'])].score) for p in params)
+
+
+def release_buckets(condition):
+    """删除分数行之前调用：从分桶人数中扣除满足 condition 的行（如注销账户的清理任务）"""
+    rows = db.session.execute(
+        db.select(LeaderboardScore.board, LeaderboardScore.bucket, db.func.count())
+        .where(condition, LeaderboardScore.bucket.is_not(None))
+        .group_by(LeaderboardScore.board, LeaderboardScore.bucket)
+    ).all()
+    _add_bucket_counts({(board, bucket): -users for board, bucket, users in rows})
+
+
+def backfill_buckets(chunk_size=1000):
+    """为尚未分桶的分数行（分桶功能上线前的数据）计算分桶并计入人数，按块提交，返回处理的行数"""
+    filled = 0
+    while True:
+        rows = db.session.execute(
+            db.select(LeaderboardScore.board, LeaderboardScore.user_id, LeaderboardScore.score)
+            .where(LeaderboardScore.bucket.is_(None)).limit(chunk_size)
+        ).all()
+        if not rows:
+            return filled
+        counts = {}
+        updates = []
+        for row in rows:
+            bucket = bucket_of(row.score)
+            counts[(row.board, bucket)] = counts.get((row.board, bucket), 0) + 1
+            updates.append({'b_board': row.board, 'b_user_id': row.user_id, 'b_bucket': bucket})
+        db.session.execute(
+            db.update(LeaderboardScore.__table__)
+            .where(LeaderboardScore.board == db.bindparam('b_board'),
+                   LeaderboardScore.user_id == db.bindparam('b_user_id'))
+            .values(bucket=db.bindparam('b_bucket')),
+            updates
+        )
+        _add_bucket_counts(counts)
+        db.session.commit()
+        filled += len(rows)
+
+
+class TopBoard:
+    """
+    单个榜单的前 capacity 名：按 (-score, user_id) 升序保存，同分时 user_id 小的在前
+    total 为榜单总人数；榜单人数不超过 capacity 时全部用户都在内存中（complete）
+    """
+
+    def __init__(self, rows, total, capacity=BOARD_TOP_K):
+        self.capacity = capacity
+        self.scores = dict(rows)
+        self.keys = sorted((-score, user_id) for user_id, score in self.scores.items())
+        self.total = total
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls, key, capacity=BOARD_TOP_K):
+        rows = db.session.execute(
+            db.select(LeaderboardScore.user_id, LeaderboardScore.score)
+            .where(LeaderboardScore.board == key)
+            .order_by(LeaderboardScore.score.desc(), LeaderboardScore.user_id)
+            .limit(capacity)
+        ).all()
+        total = len(rows)
+        if total >= capacity:
+            total = db.session.execute(
+                db.select(db.func.count()).select_from(LeaderboardScore).where(LeaderboardScore.board == key)
+            ).scalar()
+        return cls(((row.user_id, row.score) for row in rows), total, capacity)
+
+    @property
+    def complete(self):
+        return self.total <= len(self.keys)
+
+    def _insert(self, user_id, score):
+        self.scores[user_id] = score
+        bisect.insort(self.keys, (-score, user_id))
+        if len(self.keys) > self.capacity:
+            _, dropped = self.keys.pop()
+            del self.scores[dropped]
+
+    def apply(self, user_id, delta, new_score):
+        """
+        应用一次已提交的增量，返回 False 表示无法在内存中精确更新、需要从数据库重新加载
+        增量可交换，多个事务的提交钩子以任意顺序到达结果都相同；new_score 只用于判断新用户和能否进入前 capacity 名
+        """
+        if delta < 0:
+            return False  # 分数下降时榜外用户可能反超，直接重新加载（只在删除 / 修改记录时出现）
+        complete = self.complete
+        if abs(new_score - delta) <= SCORE_EPSILON:
+            self.total += 1  # 本次写入新建了该用户的分数行
+        old = self.scores.get(user_id)
+        if old is not None:
+            self.keys.pop(bisect.bisect_left(self.keys, (-old, user_id)))
+            del self.scores[user_id]
+            self._insert(user_id, old + delta)
+        elif complete:
+            self._insert(user_id, delta)
+        elif (-new_score, user_id) < self.keys[-1]:
+            return False  # 榜外用户进入前 capacity 名，无法得知其完整分数历史之外的排名变化
+        return True
+
+    def top(self, limit):
+        return [(rank + 1, user_id, -neg_score) for rank, (neg_score, user_id) in enumerate(self.keys[:limit])]
+
+    def rank(self, user_id):
+        """返回 (名次, 分数)；用户不在内存中的前 capacity 名时返回 None（榜单不完整时见 user_rank）"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect.bisect_left(self.keys, (-score, user_id)) + 1, score
+
+    def __len__(self):
+        return self.total
+
+
+class BoardCache:
+    """
+    进程内榜单缓存（LRU + TTL），首次访问时从数据库加载
+    加载期间可能有事务提交：每个榜单维护代数，写事务在提交前登记、提交或回滚后注销并加一；
+    加载开始后代数变化或仍有未完成的写事务时，加载结果只用于本次请求，不放入缓存，避免重复计入或丢失增量
+    """
+
+    def __init__(self, maxsize=BOARD_CACHE_SIZE, ttl=BOARD_CACHE_TTL, capacity=BOARD_TOP_K):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.capacity = capacity  # 每个榜单在内存中保存的名次数
+        self._boards = OrderedDict()
+        self._generations = {}  # 榜单 -> 代数
+        self._inflight = {}  # 榜单 -> {写事务标记: 开始时间}
+        self._epoch = 0  # clear() 时加一
+        self._lock = threading.Lock()
+
+    def _generation(self, key):
+        return self._epoch, self._generations.get(key, 0)
+
+    def _busy(self, key):
+        writers = self._inflight.get(key)
+        if not writers:
+            return False
+        # 提交钩子异常丢失时不会永久阻止缓存该榜单
+        now = time.monotonic()
+        for token, started in list(writers.items()):
+            if now - started > INFLIGHT_TIMEOUT:
+                del writers[token]
+        return bool(writers)
+
+    def get(self, key):
+        with self._lock:
+            board = self._boards.get(key)
+            if board is not None and time.monotonic() - board.loaded_at < self.ttl:
+                self._boards.move_to_end(key)
+                return board
+            generation = self._generation(key)
+
+        board = TopBoard.load(key, self.capacity)
+        with self._lock:
+            if self._generation(key) == generation and not self._busy(key):
+                self._boards[key] = board
+                self._boards.move_to_end(key)
+                while len(self._boards) > self.maxsize:
+                    self._boards.popitem(last=False)
+        return board
+
+    def begin(self, token, keys):
+        """写事务提交前调用"""
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._inflight.setdefault(key, {})[token] = now
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def finish(self, token, keys, updates=()):
+        """
+        写事务提交或回滚后调用；updates 为已提交的 [(榜单, user_id, 增量, 写入后的分数)]
+        只更新已加载的榜单，未加载的下次访问时从数据库读取最新分数
+        """
+        with self._lock:
+            for board_key_, user_id, delta, new_score in updates:
+                board = self._boards.get(board_key_)
+                if board is not None and not board.apply(user_id, delta, new_score):
+                    del self._boards[board_key_]
+            for key in keys:
+                writers = self._inflight.get(key)
+                if writers is not None:
+                    writers.pop(token, None)
+                    if not writers:
+                        del self._inflight[key]
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+            self._epoch += 1
+
+
+board_cache = BoardCache()
+
+
+def user_rank(board, key, user_id):
+    """
+    用户在榜单中的 (名次, 分数)，不在榜上返回 None
+    不在内存中的前几名时查询数据库：更高分桶的人数之和（每个榜单最多 len(BUCKET_BOUNDS) + 1 行）
+    加上本桶内分数更高的人数（只扫描本桶分数区间内的索引），开销与名次无关；
+    分数集中在同一区间的大榜单可调小 BUCKET_RATIO（分桶更细）
+    """
+    found = board.rank(user_id)
+    if found is not None or board.complete:
+        return found
+    mine = db.session.execute(
+        db.select(LeaderboardScore.score, LeaderboardScore.bucket)
+        .where(LeaderboardScore.board == key, LeaderboardScore.user_id == user_id)
+    ).first()
+    if mine is None:
+        return None
+    score = mine.score
+    bucket = mine.bucket if mine.bucket is not None else bucket_of(score)
+    above = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(LeaderboardBucket.users), 0))
+        .where(LeaderboardBucket.board == key, LeaderboardBucket.bucket > bucket)
+    ).scalar()
+    in_bucket = db.select(db.func.count()).select_from(LeaderboardScore).where(
+        LeaderboardScore.board == key,
+        db.or_(LeaderboardScore.score > score,
+               db.and_(LeaderboardScore.score == score, LeaderboardScore.user_id < user_id))
+    )
+    upper = bucket_upper(bucket)
+    if upper is not None:
+        in_bucket = in_bucket.where(LeaderboardScore.score < upper)
+    return above + db.session.execute(in_bucket).scalar() + 1, score
+
+
+@event.listens_for(Session, 'before_commit')
+def _register_commit(session):
+    updates = session.info.get('leaderboard_deltas')
+    if updates:
+        token = object()
+        keys = {update[0] for update in updates}
+        session.info['leaderboard_commit'] = (token, keys)
+        board_cache.begin(token, keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_after_commit(session):
+    updates = session.info.pop('leaderboard_deltas', [])
+    pending = session.info.pop('leaderboard_commit', None)
+    if pending is not None:
+        board_cache.finish(*pending, updates=updates)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('leaderboard_deltas', None)
+    pending = session.info.pop('leaderboard_commit', None)
+    if pending is not None:
+        board_cache.finish(*pending)
+
+
+def rebuild_leaderboards():
+    """
+    根据统计汇总表全量重建排行榜分数（用于历史数据回填）
+    只读取 week/month 汇总行，开销与桶数相关；汇总表本身需要先通过 rebuild-rollups 保证正确
+    """
+    db.session.execute(db.delete(LeaderboardScore))
+    db.session.execute(db.delete(LeaderboardBucket))
+    rollup_deltas = {}
+    rows = db.session.execute(
+        db.select(ActivityRollup).where(ActivityRollup.period.in_(LEADERBOARD_PERIODS))
+        .execution_options(yield_per=1000)
+    ).scalars()
+    for rollup in rows:
+        rollup_deltas[(rollup.user_id, rollup.period, rollup.bucket_start, rollup.activity_type)] = [
+            rollup.activity_count, rollup.calories_burned, rollup.duration_minutes, rollup.distance_km]
+    deltas = deltas_from_rollups(rollup_deltas)
+    apply_deltas(deltas)
+    db.session.info.pop('leaderboard_deltas', None)
+    db.session.commit()
+    board_cache.clear()
+    return len({board for board, _ in deltas})
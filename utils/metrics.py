@@ -0,0 +1,305 @@
+#请求级指标与性能剖析：延迟直方图、每请求 SQL 次数/耗时、响应大小，通过 /metrics 以 Prometheus 文本格式输出
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Response, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """累积直方图（与 Prometheus histogram 语义一致），按标签元组分别计数"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, count, total) in sorted(self._series.items()):
+            base = _format_labels(label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_with_le(base, bound)} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_with_le(base, "+Inf")} {count}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _with_le(base, bound):
+    le = f'le="{bound}"'
+    return '{' + (f'{base},{le}' if base else le) + '}'
+
+
+class RequestMetrics:
+    """进程内的请求指标注册表"""
+
+    REQUEST_LABELS = ('blueprint', 'endpoint', 'method')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests_total = Counter()
+        self.latency = Histogram('http_request_duration_seconds', 'Request latency in seconds', LATENCY_BUCKETS)
+        self.sql_queries = Histogram('http_request_sql_queries', 'SQL statements executed per request', SQL_COUNT_BUCKETS)
+        self.sql_time = Histogram('http_request_sql_seconds', 'Time spent in SQL per request', LATENCY_BUCKETS)
+        self.response_size = Histogram('http_response_size_bytes', 'Response body size in bytes', SIZE_BUCKETS)
+
+    def record(self, labels, status, duration, sql_count, sql_seconds, size):
+        with self._lock:
+            self.requests_total[labels + (str(status),)] += 1
+            self.latency.observe(labels, duration)
+            self.sql_queries.observe(labels, sql_count)
+            self.sql_time.observe(labels, sql_seconds)
+            if size is not None:
+                self.response_size.observe(labels, size)
+
+    def render(self):
+        with self._lock:
+            lines = ['# HELP http_requests_total Total HTTP requests', '# TYPE http_requests_total counter']
+            for labels, count in sorted(self.requests_total.items()):
+                lines.append(f'http_requests_total{{{_format_labels(self.REQUEST_LABELS + ("status",), labels)}}} {count}')
+            for histogram in (self.latency, self.sql_queries, self.sql_time, self.response_size):
+                lines.extend(histogram.render(self.REQUEST_LABELS))
+        return lines
+
+
+def _gauge_lines(prefix, values, counters=()):
+    """把统计字典输出为指标；counters 中的键是单调递增的累计值，按 counter 类型输出并加 _total 后缀"""
+    lines = []
+    for key, value in sorted(values.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if key in counters:
+            name = key[:-len('_total')] if key.endswith('_total') else key  # 源键已带 _total 时不重复添加
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total {value}')
+        else:
+            lines.append(f'# TYPE {prefix}_{key} gauge')
+            lines.append(f'{prefix}_{key} {value}')
+    return lines
+
+
+def _ms_to_seconds(values):
+    """毫秒统计值换算为 Prometheus 约定的秒（键名中的 ms 换成 seconds），其余键不变"""
+    converted = {}
+    for key, value in values.items():
+        parts = key.split('_')
+        if 'ms' in parts and isinstance(value, (int, float)) and not isinstance(value, bool):
+            key = '_'.join('seconds' if part == 'ms' else part for part in parts)
+            value = value / 1000
+        converted[key] = value
+    return converted
+
+
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+
+def metrics_authorized(token):
+    """
+    运维端点的访问控制：配置了 token 时要求 Authorization: Bearer <token>（常量时间比较）
+    未配置时只允许本机访问（同机的 Prometheus）；部署在同机反向代理之后时所有请求都来自本机，必须配置 token
+    """
+    if token:
+        auth_header = request.headers.get('Authorization', '')
+        provided = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else ''
+        return hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8'))
+    return request.remote_addr in LOOPBACK_ADDRS
+
+
+# --- SQL 统计：通过引擎事件累计到当前请求的 g 对象上 ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if has_request_context() and hasattr(g, 'metrics_start'):
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+
+
+# --- 采样剖析：对慢请求输出 flamegraph 可用的折叠栈文件 ---
+
+class StackSampler(threading.Thread):
+    """按固定间隔采样目标线程的调用栈，结果为 {折叠栈: 次数}"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _profile_path(directory, suffix):
+    endpoint = (request.endpoint or 'unknown').replace('.', '_')
+    return os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{int(time.time() * 1000) % 1000:03d}-{endpoint}.{suffix}')
+
+
+def _start_profiling(config):
+    mode = config['PROFILE_MODE']
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        g.profiler = profiler
+    else:
+        sampler = StackSampler(threading.get_ident(), config['PROFILE_INTERVAL_MS'] / 1000)
+        sampler.start()
+        g.profiler = sampler
+
+
+def _finish_profiling(config, duration):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    if isinstance(profiler, StackSampler):
+        profiler.stop()
+    else:
+        profiler.disable()
+    if duration * 1000 < config['PROFILE_SLOW_MS']:
+        return
+
+    directory = config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(profiler, StackSampler):
+        with open(_profile_path(directory, 'folded'), 'w', encoding='utf-8') as f:
+            for stack, count in profiler.samples.most_common():
+                f.write(f'{stack} {count}\n')
+    else:
+        profiler.dump_stats(_profile_path(directory, 'prof'))
+
+
+def init_metrics(app, db):
+    """为应用注册请求钩子、SQL 引擎事件和 /metrics 端点"""
+    app.config.setdefault('METRICS_TOKEN', os.getenv('METRICS_TOKEN'))  # 未设置时 /metrics 只允许本机访问
+    app.config.setdefault('PROFILE_SLOW_MS', float(os.getenv('PROFILE_SLOW_MS', 0)))  # 0 表示关闭剖析
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.getenv('PROFILE_SAMPLE_RATE', 1.0)))
+    app.config.setdefault('PROFILE_MODE', os.getenv('PROFILE_MODE', 'sample'))  # sample / cprofile
+    app.config.setdefault('PROFILE_INTERVAL_MS', float(os.getenv('PROFILE_INTERVAL_MS', 5)))
+    app.config.setdefault('PROFILE_DIR', os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles')))
+
+    registry = RequestMetrics()
+    app.extensions['request_metrics'] = registry
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    profile_counter = {'n': 0}
+    profile_lock = threading.Lock()
+
+    def should_profile():
+        # 按 PROFILE_SAMPLE_RATE 均匀抽取请求
+        rate = app.config['PROFILE_SAMPLE_RATE']
+        if rate >= 1:
+            return True
+        with profile_lock:
+            profile_counter['n'] += 1
+            return profile_counter['n'] * rate % 1 < rate
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        if app.config['PROFILE_SLOW_MS'] > 0 and should_profile():
+            _start_profiling(app.config)
+
+    @app.after_request
+    def _record_request_metrics(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        _finish_profiling(app.config, duration)
+        if request.endpoint == 'metrics':
+            return response
+        labels = (request.blueprint or '', request.endpoint or 'unmatched', request.method)
+        size = None if response.is_streamed else response.calculate_content_length()
+        registry.record(labels, response.status_code, duration, g.get('sql_count', 0), g.get('sql_seconds', 0.0), size)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not metrics_authorized(current_app.config.get('METRICS_TOKEN')):
+            return jsonify({
+                "error": "Unauthorized",
+                "message": "A valid metrics token is required",
+                "status_code": 401
+            }), 401
+
+        lines = registry.render()
+
+        from utils.token_cache import token_cache
+        lines.extend(_gauge_lines('token_cache', token_cache.stats(),
+                                  counters=('hits', 'misses', 'evictions', 'expirations')))
+
+        from utils.password_hashing import get_hashing_pool
+        lines.extend(_gauge_lines('password_hash_pool', get_hashing_pool().stats(), counters=('rejected',)))
+
+        write_queue = current_app.extensions.get('activity_write_queue')
+        if write_queue is not None:
+            lines.extend(_gauge_lines('write_behind', _ms_to_seconds(write_queue.metrics()), counters=(
+                'enqueued', 'rejected', 'committed_rows', 'failed_rows', 'commit_wait_timeouts',
+                'commits', 'commit_seconds_total')))
+
+        asgi_adapter = current_app.extensions.get('asgi')
+        if asgi_adapter is not None:
+            lines.extend(_gauge_lines('asgi', asgi_adapter.stats(), counters=('dropped',)))
+
+        compressor = current_app.extensions.get('compression')
+        if compressor is not None:
+            lines.extend(_gauge_lines('compression', compressor.stats(), counters=(
+                'streams', 'bytes_in', 'bytes_out', 'variant_cache_hits', 'variant_cache_misses')))
+
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    return registry
@@ -0,0 +1,57 @@
+#游标(keyset)分页工具
+import base64
+import binascii
+import json
+from datetime import datetime
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+
+def encode_cursor(*values):
+    """
+    将排序键编码为不透明的游标字符串
+    datetime 会被转换为 ISO 字符串并打上标记，解码时还原
+    """
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({"dt": value.isoformat()})
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标字符串，返回排序键列表
+    游标格式不合法时抛出 ValueError
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(payload, list):
+            raise ValueError("cursor payload must be a list")
+        values = []
+        for value in payload:
+            if isinstance(value, dict) and 'dt' in value:
+                values.append(datetime.fromisoformat(value['dt']))
+            else:
+                values.append(value)
+        return values
+    except (TypeError, UnicodeError, json.JSONDecodeError, binascii.Error) as e:
+        raise ValueError(f"invalid cursor: {e}")
+
+
+def parse_limit(raw_limit, default=DEFAULT_PAGE_LIMIT, maximum=MAX_PAGE_LIMIT):
+    """
+    解析 limit 查询参数，超出上限时截断
+    非正整数时抛出 ValueError
+    """
+    if raw_limit is None or raw_limit == '':
+        return default
+    limit = int(raw_limit)
+    if limit <= 0:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, maximum)
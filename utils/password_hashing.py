@@ -0,0 +1,117 @@
+#密码哈希工具：在独立的有界线程池中执行耗时的 KDF，避免登录高峰阻塞所有请求线程
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashPoolSaturated(Exception):
+    """哈希线程池排队已满，调用方应返回 503"""
+
+
+def _hash_method():
+    # 为空时使用 werkzeug 的默认算法与参数
+    return os.getenv('PASSWORD_HASH_METHOD') or None
+
+
+def hash_password(password):
+    """按当前配置的算法参数生成密码哈希"""
+    method = _hash_method()
+    if method:
+        return generate_password_hash(password, method=method)
+    return generate_password_hash(password)
+
+
+def verify_password(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+_current_method_lock = threading.Lock()
+_current_method = None  # (配置的 method, 哈希串中的算法参数前缀)
+
+
+def needs_rehash(password_hash):
+    """
+    判断已存储的哈希是否使用了过时的算法参数
+    werkzeug 哈希格式为 "method$salt$hash"，比较 method 部分即可
+    """
+    global _current_method
+    configured = _hash_method()
+    with _current_method_lock:
+        if _current_method is None or _current_method[0] != configured:
+            _current_method = (configured, hash_password('').split('$', 1)[0])
+        prefix = _current_method[1]
+    return password_hash.split('$', 1)[0] != prefix
+
+
+class HashingPool:
+    """
+    有界哈希线程池：workers 个线程并行计算，最多再排队 queue_depth 个任务
+    超出时立即抛出 HashPoolSaturated，而不是让请求线程无限等待
+    """
+
+    def __init__(self, workers, queue_depth, timeout):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolSaturated()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # 排队过久同样视为线程池饱和
+            raise HashPoolSaturated()
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """懒加载哈希线程池，确保读取到 .env.py 加载后的环境变量"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    workers=int(os.getenv('PASSWORD_HASH_WORKERS', 4)),
+                    queue_depth=int(os.getenv('PASSWORD_HASH_QUEUE_DEPTH', 32)),
+                    timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT', 10)),
+                )
+    return _pool
+
+
+def run_hashing(fn, *args):
+    """在哈希线程池中执行 fn(*args) 并等待结果，线程池已满时抛出 HashPoolSaturated"""
+    return get_hashing_pool().run(fn, *args)
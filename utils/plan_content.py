@@ -0,0 +1,147 @@
+#健身计划内容存储：按规范化 JSON 的 SHA-256 寻址，相同内容只存一份；解析后的对象按哈希缓存在进程内
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import FitnessPlan, PlanContent, db
+
+CONTENT_CACHE_SIZE = 1024  # 进程内缓存的已解析计划内容条数
+MIGRATE_CHUNK_SIZE = 500
+
+
+def canonical_json(content):
+    # 键排序 + 紧凑分隔符，保证语义相同的内容得到相同的哈希
+    return json.dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ContentCache:
+    """
+    有界 LRU 缓存：内容哈希 -> 已解析的计划内容
+    内容按哈希不可变，缓存不需要失效；返回的对象被多个请求共享，只读使用
+    """
+
+    def __init__(self, maxsize=CONTENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def missing(self, keys):
+        with self._lock:
+            return {key for key in keys if key not in self._entries}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+content_cache = ContentCache()
+
+
+def _parse(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return {"error": "Invalid JSON content"}
+
+
+def get_content(key):
+    """按哈希返回已解析的计划内容，内容不存在时返回 {}"""
+    found, content = content_cache.get(key)
+    if found:
+        return content
+    text = db.session.execute(db.select(PlanContent.content).where(PlanContent.hash == key)).scalar()
+    content = _parse(text) if text is not None else {}
+    content_cache.put(key, content)
+    return content
+
+
+def preload_contents(plans):
+    """列表接口序列化前调用：一次 IN 查询加载所有未缓存的内容，避免逐条查询"""
+    keys = content_cache.missing({plan.content_hash for plan in plans if plan.content_hash is not None})
+    if not keys:
+        return
+    rows = db.session.execute(db.select(PlanContent.hash, PlanContent.content).where(PlanContent.hash.in_(keys)))
+    for key, text in rows:
+        content_cache.put(key, _parse(text))
+
+
+def store_content(content):
+    """
+    在当前事务中写入计划内容（已存在则跳过），返回内容哈希
+    调用方负责 commit / rollback
+    """
+    text = canonical_json(content)
+    key = content_hash(text)
+    dialect = db.session.get_bind().dialect.name
+    insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+    db.session.execute(insert(PlanContent).values(
+        hash=key, content=text, size=len(text.encode('utf-8'))
+    ).on_conflict_do_nothing(index_elements=['hash']))
+    return key
+
+
+def plan_content_hash(plan):
+    """返回计划的内容哈希；旧数据（内联 content）先转存到内容表，并把该计划改为引用哈希"""
+    if plan.content_hash is None:
+        content = plan.content
+        if isinstance(content, str):
+            content = _parse(content)
+        plan.content_hash = store_content(content if content is not None else {})
+        plan.content = db.null()  # SQL NULL（直接赋 None 会存成 JSON 的 null）
+    return plan.content_hash
+
+
+def migrate_inline_contents(chunk_size=MIGRATE_CHUNK_SIZE):
+    """
+    把旧数据的内联 content 转存到内容表并去重，按 ID 游标分块提交，中断后重新执行即可
+    返回 (迁移的计划数, 迁移后的不同内容数)
+    """
+    migrated = 0
+    last_id = 0
+    while True:
+        plans = FitnessPlan.query.filter(
+            FitnessPlan.content_hash.is_(None), FitnessPlan.id > last_id
+        ).order_by(FitnessPlan.id).limit(chunk_size).all()
+        if not plans:
+            break
+        last_id = plans[-1].id
+        for plan in plans:
+            plan_content_hash(plan)
+        db.session.commit()
+        migrated += len(plans)
+    distinct = db.session.execute(db.select(db.func.count()).select_from(PlanContent)).scalar()
+    return migrated, distinct
+
+
+def prune_unreferenced_contents():
+    """删除不再被任何计划引用的内容（用户修改计划后旧内容可能无人引用）"""
+    referenced = db.select(FitnessPlan.content_hash).where(FitnessPlan.content_hash.is_not(None))
+    deleted = db.session.execute(
+        db.delete(PlanContent).where(PlanContent.hash.not_in(referenced))
+    ).rowcount
+    db.session.commit()
+    return deleted
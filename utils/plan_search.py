@@ -0,0 +1,231 @@
+#健身计划全文搜索：SQLite FTS5 索引 plan_name / description / 计划详情中的文本，按 bm25 排序
+#索引通过 FitnessPlan 的 mapper 事件在同一事务中同步；非 SQLite 或索引未建立时回退到 LIKE 查询
+#可见范围（预设 / 所属用户）作为 owner 列写入索引并放进 MATCH 表达式，只对当前用户可见的计划计算相关度
+import json
+import re
+import time
+from sqlalchemy import event, inspect, or_, text
+from models import FitnessPlan, PlanContent, db
+
+FTS_TABLE = 'fitness_plan_fts'
+MAX_QUERY_TERMS = 8
+MAX_BODY_CHARS = 20000  # 单个计划详情参与索引的最大字符数
+INDEX_CHECK_INTERVAL = 60  # 秒；索引不存在时多久重新检查一次（init-db 可能在其他进程中执行）
+REBUILD_CHUNK_SIZE = 1000
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+_CJK_RE = re.compile(r'([㐀-䶿一-鿿豈-﫿])')
+
+_index_checked = {}  # engine url -> (是否可用, 检查时间)
+
+
+def _split_cjk(value):
+    # unicode61 分词器不切分中日韩文字，这里在每个汉字两侧加空格按单字索引，查询时用短语匹配
+    return _CJK_RE.sub(r' \1 ', value)
+
+
+def _collect_strings(value, out):
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_strings(item, out)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_strings(item, out)
+
+
+def content_text(content):
+    """提取计划详情 JSON 中的所有字符串值，拼接为可索引的文本"""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            return content[:MAX_BODY_CHARS]
+    parts = []
+    _collect_strings(content, parts)
+    return ' '.join(parts)[:MAX_BODY_CHARS]
+
+
+def _owner_token(is_preset, user_id):
+    return 'preset' if is_preset else f'u{user_id}'
+
+
+def build_match_query(raw, owners=None):
+    """
+    将用户输入转换为 FTS5 MATCH 表达式：每个词做前缀匹配（单个字母只做完整匹配），多个词之间为 AND
+    只保留字母数字和汉字，用户输入中的 FTS5 语法字符不会生效；没有可用的词时返回 None
+    owners: 限定可见范围的 owner 标记列表（如 ['preset', 'u1']）
+    """
+    terms = _TERM_RE.findall(raw or '')[:MAX_QUERY_TERMS]
+    clauses = []
+    for term in terms:
+        if _CJK_RE.search(term):
+            clauses.append('"' + ' '.join(_split_cjk(term).split()) + '"')
+        elif len(term) > 1:
+            clauses.append(f'"{term}"*')
+        else:
+            clauses.append(f'"{term}"')
+    if not clauses:
+        return None
+    match = '{plan_name description body} : (' + ' '.join(clauses) + ')'
+    if owners:
+        match = 'owner : (' + ' OR '.join(owners) + ') AND ' + match
+    return match
+
+
+def index_available(connection):
+    """当前数据库是否已建立 FTS5 索引（存在时缓存结果，不存在时定期重新检查）"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    key = str(connection.engine.url)
+    available, checked_at = _index_checked.get(key, (False, 0.0))
+    if available or time.monotonic() - checked_at < INDEX_CHECK_INTERVAL:
+        return available
+    available = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first() is not None
+    _index_checked[key] = (available, time.monotonic())
+    return available
+
+
+def ensure_search_index():
+    """
+    建立 FTS5 索引表（已存在则跳过），返回是否新建；SQLite 未编译 FTS5 时抛出 OperationalError
+    列权重：计划名称 10，描述 5，计划详情 1，owner 只用于过滤不参与相关度；2、3 字符前缀建立前缀索引
+    """
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+        ).first() is not None
+        if exists:
+            return False
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"plan_name, description, body, owner, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0, 0.0)')"))
+    _index_checked.pop(str(db.engine.url), None)
+    return True
+
+
+def _plan_row(plan_id, user_id, is_preset, plan_name, description, content):
+    return {
+        'id': plan_id,
+        'plan_name': _split_cjk(plan_name or ''),
+        'description': _split_cjk(description or ''),
+        'body': _split_cjk(content_text(content) if content is not None else ''),
+        'owner': _owner_token(is_preset, user_id),
+    }
+
+
+_SEARCH_SQL = text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+                   f"ORDER BY rank, rowid LIMIT :limit OFFSET :offset")
+_DELETE_SQL = text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id")
+_INSERT_SQL = text(f"INSERT INTO {FTS_TABLE}(rowid, plan_name, description, body, owner) "
+                   f"VALUES (:id, :plan_name, :description, :body, :owner)")
+
+
+def rebuild_search_index(chunk_size=REBUILD_CHUNK_SIZE):
+    """清空并按 ID 游标分块重建索引，返回索引的计划数"""
+    ensure_search_index()
+    indexed = 0
+    last_id = 0
+    with db.engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        while True:
+            # 计划详情随计划一起连接查询，每块只需一次查询
+            rows = conn.execute(
+                db.select(FitnessPlan.id, FitnessPlan.user_id, FitnessPlan.is_preset,
+                          FitnessPlan.plan_name, FitnessPlan.description,
+                          FitnessPlan.content, FitnessPlan.content_hash, PlanContent.content.label('stored'))
+                .outerjoin(PlanContent, PlanContent.hash == FitnessPlan.content_hash)
+                .where(FitnessPlan.id > last_id).order_by(FitnessPlan.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            conn.execute(_INSERT_SQL, [
+                _plan_row(row.id, row.user_id, row.is_preset, row.plan_name, row.description,
+                          row.content if row.content_hash is None else row.stored)
+                for row in rows])
+            indexed += len(rows)
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    return indexed
+
+
+SEARCHED_ATTRS = ('plan_name', 'description', 'content', 'content_hash', 'is_preset', 'user_id')
+
+
+def _index_plan(mapper, connection, target):
+    if not index_available(connection):
+        return
+    content = target.content
+    if target.content_hash is not None:
+        content = connection.execute(
+            db.select(PlanContent.content).where(PlanContent.hash == target.content_hash)
+        ).scalar()
+    connection.execute(_DELETE_SQL, {'id': target.id})
+    connection.execute(_INSERT_SQL, _plan_row(
+        target.id, target.user_id, target.is_preset, target.plan_name, target.description, content))
+
+
+def _unindex_plan(mapper, connection, target):
+    if index_available(connection):
+        connection.execute(_DELETE_SQL, {'id': target.id})
+
+
+def unindex_plans(connection, plan_ids):
+    """从索引中移除一批计划（绕过 ORM 的批量删除需要手动调用）"""
+    if plan_ids and index_available(connection):
+        connection.execute(_DELETE_SQL, [{'id': plan_id} for plan_id in plan_ids])
+
+
+def _reindex_plan(mapper, connection, target):
+    # 只修改了与搜索无关的字段时不重建该计划的索引
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in SEARCHED_ATTRS):
+        _index_plan(mapper, connection, target)
+
+
+event.listen(FitnessPlan, 'after_insert', _index_plan)
+event.listen(FitnessPlan, 'after_update', _reindex_plan)
+event.listen(FitnessPlan, 'after_delete', _unindex_plan)
+
+
+def search_plans(raw_query, user_id, scope='all', limit=20, offset=0):
+    """
+    搜索当前用户可见的计划（预设计划 + 自己的计划），返回 (plans, has_more)
+    scope: all / preset / mine
+    """
+    owners = {
+        'all': ['preset', _owner_token(False, user_id)],
+        'preset': ['preset'],
+        'mine': [_owner_token(False, user_id)],
+    }[scope]
+    match = build_match_query(raw_query, owners)
+    if match is None:
+        return [], False
+
+    if index_available(db.session.connection()):
+        # 先在索引中排序分页，只为当前页加载计划
+        ids = db.session.execute(_SEARCH_SQL, {'match': match, 'limit': limit + 1, 'offset': offset}).scalars().all()
+        plans_by_id = {plan.id: plan for plan in FitnessPlan.query.filter(FitnessPlan.id.in_(ids[:limit]))}
+        return [plans_by_id[plan_id] for plan_id in ids[:limit] if plan_id in plans_by_id], len(ids) > limit
+
+    # 回退：逐词 LIKE 匹配名称、描述和计划详情原文（内容表或旧数据的内联 JSON），按 ID 排序
+    visible = {
+        'all': or_(FitnessPlan.is_preset.is_(True), FitnessPlan.user_id == user_id),
+        'preset': FitnessPlan.is_preset.is_(True),
+        'mine': (FitnessPlan.user_id == user_id) & FitnessPlan.is_preset.is_not(True),
+    }[scope]
+    query = db.select(FitnessPlan).outerjoin(PlanContent, PlanContent.hash == FitnessPlan.content_hash) \
+        .where(visible).order_by(FitnessPlan.id)
+    for term in _TERM_RE.findall(raw_query)[:MAX_QUERY_TERMS]:
+        pattern = f'%{term}%'
+        query = query.where(or_(FitnessPlan.plan_name.ilike(pattern),
+                                FitnessPlan.description.ilike(pattern),
+                                PlanContent.content.ilike(pattern),
+                                db.cast(FitnessPlan.content, db.Text).ilike(pattern)))
+    plans = db.session.execute(query.limit(limit + 1).offset(offset)).scalars().all()
+    return plans[:limit], len(plans) > limit
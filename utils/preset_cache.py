@@ -0,0 +1,68 @@
+#预设健身计划缓存：缓存序列化后的响应体和强 ETag，预设计划变更提交后失效
+import hashlib
+import threading
+import time
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import FitnessPlan
+
+# 兜底过期时间（秒）：其他进程修改预设计划时本进程无法收到通知
+PRESET_CACHE_TTL = 300
+
+_lock = threading.Lock()
+_version = 0
+_entry = None  # (version, built_at, body, etag)
+
+
+def invalidate_preset_cache():
+    """使预设计划缓存失效（直接用 SQL 修改预设计划后需要手动调用）"""
+    global _version, _entry
+    with _lock:
+        _version += 1
+        _entry = None
+
+
+def get_preset_payload(build_body):
+    """
+    返回 (body, etag)
+    缓存未命中时调用 build_body() 生成响应体字节串；构建期间若发生失效则不写入缓存
+    """
+    global _entry
+    with _lock:
+        entry = _entry
+        version = _version
+    if entry is not None and entry[0] == version and time.monotonic() - entry[1] < PRESET_CACHE_TTL:
+        return entry[2], entry[3]
+
+    body = build_body()
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    with _lock:
+        if _version == version:
+            _entry = (version, time.monotonic(), body, etag)
+    return body, etag
+
+
+def _mark_if_preset(mapper, connection, target):
+    # 预设计划被新增/修改/删除时记录在会话上，等事务提交后再失效
+    # 提前失效可能让并发请求把未提交前的旧数据重新写入缓存
+    history = inspect(target).attrs.is_preset.history
+    if target.is_preset or history.deleted:
+        session = Session.object_session(target)
+        if session is not None:
+            session.info['preset_plans_dirty'] = True
+
+
+event.listen(FitnessPlan, 'after_insert', _mark_if_preset)
+event.listen(FitnessPlan, 'after_update', _mark_if_preset)
+event.listen(FitnessPlan, 'after_delete', _mark_if_preset)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('preset_plans_dirty', False):
+        invalidate_preset_cache()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('preset_plans_dirty', None)
@@ -0,0 +1,169 @@
+#慢查询与 N+1 检测：挂在 SQLAlchemy 引擎事件上，报告慢语句、单请求内重复的语句以及全表扫描
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+SQL_PREVIEW_LENGTH = 500
+
+
+class QueryInspector:
+    """
+    slow_ms          单条语句耗时超过该值时报告 slow_query
+    repeat_threshold 同一请求内同一条语句（参数不同）执行次数达到该值时报告 repeated_statement（N+1）
+    explain          SQLite 下对每种 SELECT 语句执行一次 EXPLAIN QUERY PLAN，发现全表扫描时报告 full_table_scan
+    """
+
+    def __init__(self, slow_ms=100, repeat_threshold=3, explain=True, max_reports=500, max_plans=2000):
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.explain = explain
+        self.max_plans = max_plans
+        self._reports = deque(maxlen=max_reports)
+        self._plans = OrderedDict()  # 语句 -> 全表扫描的表名列表（已检查过的语句不再重复 EXPLAIN）
+        self._lock = threading.Lock()
+
+    # --- 引擎事件 ---
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('inspector_query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('inspector_query_start')
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+
+        in_request = has_request_context()
+        if in_request:
+            shapes = g.get('query_shapes')
+            if shapes is None:
+                shapes = g.query_shapes = Counter()
+            shapes[statement] += 1
+
+        if elapsed_ms >= self.slow_ms:
+            self._report('slow_query', statement, duration_ms=round(elapsed_ms, 3))
+
+        if self.explain and not executemany and conn.dialect.name == 'sqlite' \
+                and statement.lstrip()[:6].upper() == 'SELECT':
+            self._check_plan(cursor, statement, parameters)
+
+    def _check_plan(self, cursor, statement, parameters):
+        with self._lock:
+            if statement in self._plans:
+                self._plans.move_to_end(statement)
+                return
+        try:
+            rows = cursor.connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ()).fetchall()
+        except Exception:
+            rows = []
+        scans = []
+        details = []
+        for row in rows:
+            detail = row[-1]
+            details.append(detail)
+            # "SCAN activity" 为全表扫描；"SCAN activity USING INDEX ..." 为索引扫描；旧版本写作 "SCAN TABLE activity"
+            # "SCAN fitness_plan_fts VIRTUAL TABLE INDEX ..." 是 FTS5 等虚拟表按自身索引检索，不是全表扫描
+            if detail.startswith('SCAN ') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail:
+                parts = detail.split()
+                table = parts[2] if len(parts) > 2 and parts[1] == 'TABLE' else parts[1]
+                if table not in ('CONSTANT', 'SUBQUERY') and not table.startswith('('):
+                    scans.append(table)
+        with self._lock:
+            self._plans[statement] = scans
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        for table in scans:
+            self._report('full_table_scan', statement, table=table, plan=details)
+
+    # --- 请求结束时检查 N+1 ---
+
+    def finish_request(self):
+        shapes = g.pop('query_shapes', None)
+        if not shapes:
+            return
+        for statement, count in shapes.items():
+            if count >= self.repeat_threshold:
+                self._report('repeated_statement', statement, count=count)
+
+    def _report(self, kind, statement, **details):
+        report = {
+            "type": kind,
+            "endpoint": request.endpoint if has_request_context() else None,
+            "method": request.method if has_request_context() else None,
+            "statement": statement[:SQL_PREVIEW_LENGTH],
+            "at": datetime.utcnow().isoformat(),
+        }
+        report.update(details)
+        with self._lock:
+            self._reports.append(report)
+
+    def reports(self, kind=None):
+        with self._lock:
+            reports = list(self._reports)
+        if kind:
+            reports = [report for report in reports if report['type'] == kind]
+        return reports
+
+    def clear(self):
+        with self._lock:
+            self._reports.clear()
+
+
+def _admin_user_ids(app):
+    raw = app.config.get('DEBUG_ADMIN_USER_IDS', os.getenv('DEBUG_ADMIN_USER_IDS', ''))
+    if isinstance(raw, str):
+        raw = [item for item in raw.replace(' ', '').split(',') if item]
+    return {int(item) for item in raw}
+
+
+def init_query_inspector(app, db):
+    """按配置创建检测器，注册引擎事件、请求钩子以及 /debug/queries 端点"""
+    def setting(name, default):
+        return app.config.get(name, os.getenv(name, default))
+
+    inspector = QueryInspector(
+        slow_ms=float(setting('SLOW_QUERY_MS', 100)),
+        repeat_threshold=int(setting('N_PLUS_ONE_THRESHOLD', 3)),
+        explain=str(setting('EXPLAIN_QUERIES', '1')) not in ('0', 'False', 'false'),
+        max_reports=int(setting('QUERY_REPORT_LIMIT', 500)),
+    )
+    app.extensions['query_inspector'] = inspector
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', inspector.before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', inspector.after_cursor_execute)
+
+    @app.teardown_request
+    def _inspect_request_queries(exc):
+        inspector.finish_request()
+
+    from utils.auth_decorators import token_required
+
+    @app.route('/debug/queries', methods=['GET', 'DELETE'])
+    @token_required
+    def debug_queries():
+        """
+        查询检测报告：GET 返回 JSON（可用 ?type= 过滤），DELETE 清空
+        报告包含 SQL 语句和端点名，只允许 DEBUG_ADMIN_USER_IDS（逗号分隔的用户 ID）中的用户访问，未配置时所有人都返回 403
+        """
+        if g.user_id not in _admin_user_ids(current_app):
+            return jsonify({
+                "error": "Forbidden",
+                "message": "Query reports are only available to administrators",
+                "status_code": 403
+            }), 403
+        if request.method == 'DELETE':
+            inspector.clear()
+            return jsonify({"message": "Query reports cleared", "status_code": 200}), 200
+        reports = inspector.reports(request.args.get('type'))
+        return jsonify({
+            "count": len(reports),
+            "summary": dict(Counter(report['type'] for report in reports)),
+            "reports": reports
+        }), 200
+
+    return inspector
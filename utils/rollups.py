@@ -0,0 +1,122 @@
+#运动统计汇总（rollup）维护：写路径只提交增量，查询按桶读取
+from datetime import date, datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import Activity, ActivityRollup, db
+
+PERIODS = ('day', 'week', 'month')
+ROLLUP_KEY = ('user_id', 'period', 'bucket_start', 'activity_type')
+
+
+def bucket_start(period, value):
+    """
+    计算某个时间点所在统计区间的起始日期
+    week 以周一为起点，month 以当月 1 日为起点
+    """
+    day = value.date() if isinstance(value, datetime) else value
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"unknown period: {period}")
+
+
+def accumulate(deltas, activity, sign):
+    """
+    将一条运动记录（快照字典）以 sign(+1/-1) 累加到 deltas 中
+    deltas: {(user_id, period, bucket_start, activity_type): [count, calories, minutes, km]}
+    """
+    if activity.get('activity_date') is None:
+        return deltas
+    for period in PERIODS:
+        key = (activity['user_id'], period, bucket_start(period, activity['activity_date']), activity['activity_type'])
+        totals = deltas.setdefault(key, [0, 0, 0, 0.0])
+        totals[0] += sign
+        totals[1] += sign * (activity.get('calories_burned') or 0)
+        totals[2] += sign * (activity.get('duration_minutes') or 0)
+        totals[3] += sign * (activity.get('distance_km') or 0.0)
+    return deltas
+
+
+def _upsert_statement():
+    # SQLite 与 PostgreSQL 都支持 ON CONFLICT ... DO UPDATE
+    dialect = db.session.get_bind().dialect.name
+    insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+    stmt = insert(ActivityRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY),
+        set_={
+            'activity_count': ActivityRollup.activity_count + stmt.excluded.activity_count,
+            'calories_burned': ActivityRollup.calories_burned + stmt.excluded.calories_burned,
+            'duration_minutes': ActivityRollup.duration_minutes + stmt.excluded.duration_minutes,
+            'distance_km': ActivityRollup.distance_km + stmt.excluded.distance_km,
+        }
+    )
+
+
+def apply_deltas(deltas):
+    """
+    在当前事务中把增量写入汇总表（批量 upsert），并清理计数归零的桶
+    调用方负责 commit / rollback
+    """
+    params = []
+    for (user_id, period, start, activity_type), (count, calories, minutes, km) in deltas.items():
+        if count == 0 and calories == 0 and minutes == 0 and km == 0:
+            continue  # 更新前后落在同一个桶且数值不变
+        params.append({
+            'user_id': user_id,
+            'period': period,
+            'bucket_start': start,
+            'activity_type': activity_type,
+            'activity_count': count,
+            'calories_burned': calories,
+            'duration_minutes': minutes,
+            'distance_km': km,
+        })
+    if not params:
+        return
+    db.session.execute(_upsert_statement(), params)
+
+    user_ids = {p['user_id'] for p in params}
+    db.session.execute(
+        db.delete(ActivityRollup).where(
+            ActivityRollup.user_id.in_(user_ids),
+            ActivityRollup.activity_count <= 0
+        )
+    )
+
+
+def rebuild_rollups(user_id=None, chunk_size=1000):
+    """
+    从运动记录全量重建汇总表（用于历史数据回填），流式读取，不会一次性加载全部记录
+    """
+    delete = db.delete(ActivityRollup)
+    query = db.select(Activity)
+    if user_id is not None:
+        delete = delete.where(ActivityRollup.user_id == user_id)
+        query = query.where(Activity.user_id == user_id)
+    db.session.execute(delete)
+
+    deltas = {}
+    rows = db.session.execute(query.execution_options(yield_per=chunk_size)).scalars()
+    for activity in rows:
+        accumulate(deltas, {
+            'user_id': activity.user_id,
+            'activity_type': activity.activity_type,
+            'duration_minutes': activity.duration_minutes,
+            'calories_burned': activity.calories_burned,
+            'distance_km': activity.distance_km,
+            'activity_date': activity.activity_date,
+        }, 1)
+    apply_deltas(deltas)
+    db.session.commit()
+    return len(deltas)
+
+
+def parse_bucket_date(raw):
+    """解析查询参数中的日期（YYYY-MM-DD 或完整 ISO 时间），非法时抛出 ValueError"""
+    if raw is None or raw == '':
+        return None
+    return date.fromisoformat(raw[:10])
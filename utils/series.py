@@ -0,0 +1,72 @@
+#时间序列降采样：在数据库中按时间等分分桶聚合，返回点数只与请求的桶数有关
+from datetime import timedelta
+from sqlalchemy import Integer, cast, extract, func, literal
+from models import Activity, db
+
+SERIES_METRICS = ('calories_burned', 'duration_minutes', 'distance_km')
+DEFAULT_POINTS = 100
+MAX_POINTS = 1000
+
+
+def _elapsed_days(column, start):
+    # 距离起始时间的天数（浮点），SQLite 用 julianday，其他数据库用 epoch 差
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.julianday(column) - func.julianday(literal(start.strftime('%Y-%m-%d %H:%M:%S.%f')))
+    return extract('epoch', column - literal(start)) / 86400.0
+
+
+def downsample(user_id, metric, start, end, points, activity_type=None):
+    """
+    将 [start, end) 区间等分为 points 个桶（只有日期的 end_date 已由路由换算为次日零点，不含该时刻），返回非空桶的 count/sum/min/max/avg
+    聚合在 SQL 中完成（GROUP BY 桶序号），只返回最多 points 行
+    """
+    column = getattr(Activity, metric)
+    span_days = (end - start).total_seconds() / 86400
+    bucket = cast(_elapsed_days(Activity.activity_date, start) * points / span_days, Integer)
+
+    query = db.select(
+        bucket.label('bucket'),
+        func.count(column).label('count'),
+        func.sum(column).label('sum'),
+        func.min(column).label('min'),
+        func.max(column).label('max'),
+        func.avg(column).label('avg'),
+    ).where(
+        Activity.user_id == user_id,
+        Activity.activity_date >= start,
+        Activity.activity_date < end,
+    )
+    if activity_type:
+        query = query.where(Activity.activity_type == activity_type)
+    query = query.group_by(bucket).order_by(bucket)
+
+    bucket_seconds = (end - start).total_seconds() / points
+    merged = {}
+    for row in db.session.execute(query):
+        # 浮点误差可能把紧挨 end 的记录算到第 points 个桶，并入最后一个桶
+        index = min(int(row.bucket), points - 1)
+        if row.count == 0:
+            continue
+        if index in merged:
+            previous = merged[index]
+            total_count = previous['count'] + row.count
+            previous['avg'] = (previous['sum'] + row.sum) / total_count
+            previous['count'] = total_count
+            previous['sum'] += row.sum
+            previous['min'] = min(previous['min'], row.min)
+            previous['max'] = max(previous['max'], row.max)
+            continue
+        merged[index] = {
+            'count': row.count,
+            'sum': row.sum,
+            'min': row.min,
+            'max': row.max,
+            'avg': float(row.avg),
+        }
+
+    series = []
+    for index in sorted(merged):
+        point = merged[index]
+        point['bucket_start'] = (start + timedelta(seconds=index * bucket_seconds)).isoformat()
+        series.append(point)
+    return bucket_seconds, series
@@ -0,0 +1,130 @@
+#已验证 Token 缓存：同一个 Token 重复请求时跳过 JWT 解码与签名校验
+#账户状态缓存：每个请求都确认账户未注销，结果按用户缓存几秒，其他进程中注销的账户最多延迟这么久被拒绝
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TOKEN_CACHE_SIZE = 4096
+DEFAULT_ACCOUNT_STATUS_TTL = 5.0  # 秒；设置为 0 时每个请求都查询数据库
+
+
+class TokenCache:
+    """
+    有界 LRU 缓存：Token 摘要 -> 已解码的声明(claims)
+    摘要中混入了 SECRET_KEY，密钥轮换后旧条目自然无法命中
+    条目在 Token 的 exp 时间到达后失效
+    """
+
+    def __init__(self, maxsize=DEFAULT_TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def digest(token, secret_key):
+        key = secret_key.encode('utf-8') if isinstance(secret_key, str) else secret_key
+        return hashlib.sha256(key + b'\x00' + token.encode('utf-8')).digest()
+
+    def get(self, token, secret_key):
+        """命中返回 claims 字典，未命中或已过期返回 None"""
+        key = self.digest(token, secret_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                # 过期的 Token 交给 jwt.decode 重新判断，以返回正确的错误信息
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, token, secret_key, claims):
+        if self.maxsize <= 0:
+            return
+        exp = claims.get('exp')
+        expires_at = float(exp) if isinstance(exp, (int, float)) else None
+        key = self.digest(token, secret_key)
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revoke_user(self, user_id):
+        """移除某个用户的所有缓存条目并在本进程内立即标记账户无效（注销账户后调用），返回移除的条数"""
+        with self._lock:
+            keys = [key for key, (claims, _) in self._entries.items() if claims.get('user_id') == user_id]
+            for key in keys:
+                del self._entries[key]
+        account_status.put(user_id, False)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class AccountStatusCache:
+    """
+    用户 ID -> (账户是否有效, 检查时间)，条目在 ttl 秒后失效
+    Token 缓存命中时跳过了签名校验，但仍需经过这里确认账户未注销
+    """
+
+    def __init__(self, ttl=DEFAULT_ACCOUNT_STATUS_TTL, maxsize=DEFAULT_TOKEN_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """返回 True / False，未缓存或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            active, checked_at = entry
+            if time.monotonic() - checked_at >= self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return active
+
+    def put(self, user_id, active):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (active, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+account_status = AccountStatusCache()
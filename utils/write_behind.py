@@ -0,0 +1,239 @@
+#运动记录异步写入（write-behind）：请求线程只负责校验和入队，单个写线程按批合并提交
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ('none', 'commit')
+_STOP = object()
+
+
+class WriteQueueFull(Exception):
+    """写入队列已满，调用方应返回 503"""
+
+
+class WriteFailed(Exception):
+    """durability=commit 模式下批次最终提交失败"""
+
+
+class _Pending:
+    __slots__ = ('accepted_id', 'user_id', 'row', 'done', 'activity_id', 'error')
+
+    def __init__(self, user_id, row, wait):
+        self.accepted_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.row = row
+        self.done = threading.Event() if wait else None
+        self.activity_id = None
+        self.error = None
+
+
+class ActivityWriteQueue:
+    """
+    进程内写入队列：写线程每攒够 batch_size 条或等待 flush_interval_ms 毫秒就做一次组提交
+    durability:
+      none   - 入队即返回，进程崩溃时队列中未提交的记录会丢失
+      commit - 请求线程等待所在批次提交后再返回，仍可合并多个并发请求的提交
+    """
+
+    def __init__(self, app, batch_size=500, flush_interval_ms=50, max_queue=10000,
+                 durability='none', commit_timeout=10, max_retries=3):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of: {', '.join(DURABILITY_MODES)}")
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.durability = durability
+        self.commit_timeout = commit_timeout
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "enqueued": 0,
+            "rejected": 0,
+            "committed_rows": 0,
+            "failed_rows": 0,
+            "commit_wait_timeouts": 0,
+            "commits": 0,
+            "commit_ms_total": 0.0,
+            "commit_ms_max": 0.0,
+            "last_commit_ms": 0.0,
+            "last_batch_size": 0,
+        }
+
+    def _ensure_started(self):
+        # 首次入队时才启动写线程，避免 gunicorn 预加载后 fork 出的 worker 中没有线程
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='activity-write-behind', daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id, row):
+        """
+        将已校验的运动记录入队，返回 (accepted_id, activity_id)
+        durability=none 时 activity_id 为 None；durability=commit 下等待提交超时也返回 None：
+        记录仍在队列中、之后可能提交成功，不能当作失败让客户端重试（否则会重复写入）
+        """
+        self._ensure_started()
+        pending = _Pending(user_id, row, wait=self.durability == 'commit')
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            self._count('rejected')
+            raise WriteQueueFull()
+        self._count('enqueued')
+
+        if pending.done is None:
+            return pending.accepted_id, None
+        if not pending.done.wait(self.commit_timeout):
+            self._count('commit_wait_timeouts')
+            return pending.accepted_id, None
+        if pending.error is not None:
+            raise WriteFailed(pending.error)
+        return pending.accepted_id, pending.activity_id
+
+    def _count(self, name, value=1):
+        with self._metrics_lock:
+            self._metrics[name] += value
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                self._drain()
+                return
+
+    def _drain(self):
+        # 停止时把队列里剩余的记录全部提交
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._commit(batch)
+                batch = []
+        if batch:
+            self._commit(batch)
+
+    def _insert_and_commit(self, by_user):
+        """在一个事务中插入 {user_id: [pending]} 并提交；成功返回 None，失败回滚并返回错误信息"""
+        from models import db
+        from utils.activity_ingest import insert_activities
+
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                for user_id, items in by_user.items():
+                    new_ids = insert_activities(user_id, [p.row for p in items])
+                    for pending, activity_id in zip(items, new_ids):
+                        pending.activity_id = activity_id
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                for items in by_user.values():
+                    for pending in items:
+                        pending.activity_id = None
+                return str(e)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rows = sum(len(items) for items in by_user.values())
+        with self._metrics_lock:
+            self._metrics["commits"] += 1
+            self._metrics["committed_rows"] += rows
+            self._metrics["commit_ms_total"] += elapsed_ms
+            self._metrics["commit_ms_max"] = max(self._metrics["commit_ms_max"], elapsed_ms)
+            self._metrics["last_commit_ms"] = elapsed_ms
+            self._metrics["last_batch_size"] = rows
+        return None
+
+    def _commit(self, batch):
+        by_user = defaultdict(list)
+        for pending in batch:
+            by_user[pending.user_id].append(pending)
+
+        for attempt in range(self.max_retries):
+            error = self._insert_and_commit(by_user)
+            if error is None:
+                break
+            logger.warning("write-behind commit failed (attempt %s): %s", attempt + 1, error)
+            time.sleep(0.05 * (attempt + 1))
+        else:
+            # 整批多次失败时先按用户、再逐条提交，只让出错的记录失败，不连累同批的其他请求
+            logger.warning("write-behind batch of %s failed, retrying per user", len(batch))
+            for user_id, items in by_user.items():
+                if self._insert_and_commit({user_id: items}) is None:
+                    continue
+                for pending in items:
+                    error = self._insert_and_commit({user_id: [pending]})
+                    if error is not None:
+                        pending.error = error
+                        self._count('failed_rows')
+                        logger.error("write-behind dropped activity %s: %s", pending.accepted_id, error)
+
+        for pending in batch:
+            if pending.done is not None:
+                pending.done.set()
+
+    def stop(self, timeout=30):
+        """停止写线程并提交队列中剩余的记录（进程退出时自动调用）"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def metrics(self):
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        commits = metrics["commits"]
+        metrics["commit_ms_avg"] = metrics["commit_ms_total"] / commits if commits else 0.0
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["durability"] = self.durability
+        return metrics
+
+
+def init_write_behind(app):
+    """根据配置为应用创建写入队列，并注册进程退出时的刷新钩子"""
+    def setting(name, default):
+        return app.config.get(name, os.getenv(name, default))
+
+    write_queue = ActivityWriteQueue(
+        app,
+        batch_size=int(setting('WRITE_BEHIND_BATCH_SIZE', 500)),
+        flush_interval_ms=float(setting('WRITE_BEHIND_FLUSH_MS', 50)),
+        max_queue=int(setting('WRITE_BEHIND_MAX_QUEUE', 10000)),
+        durability=setting('WRITE_BEHIND_DURABILITY', 'none'),
+    )
+    app.extensions['activity_write_queue'] = write_queue
+    atexit.register(write_queue.stop)
+    return write_queue